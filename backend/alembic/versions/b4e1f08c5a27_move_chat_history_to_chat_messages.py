@@ -0,0 +1,107 @@
+"""move chat history to chat messages
+
+Revision ID: b4e1f08c5a27
+Revises: 7c2d9e4a1f35
+Create Date: 2026-10-18 11:03:47.218530
+
+"""
+import pickle
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+from google.genai.types import Content
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e1f08c5a27'
+down_revision: Union[str, Sequence[str], None] = '7c2d9e4a1f35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+BATCH_SIZE = 500
+
+sessions = sa.table('sessions',
+    sa.column('id', sa.Integer()),
+    sa.column('session_data', sa.LargeBinary()),
+    sa.column('message_count', sa.Integer()),
+)
+chat_messages = sa.table('chat_messages',
+    sa.column('session_id', sa.Integer()),
+    sa.column('seq', sa.Integer()),
+    sa.column('role', sa.String()),
+    sa.column('content', postgresql.JSON()),
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('chat_messages',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('session_id', sa.Integer(), nullable=False),
+    sa.Column('seq', sa.Integer(), nullable=False),
+    sa.Column('role', sa.String(), nullable=False),
+    sa.Column('content', postgresql.JSON(astext_type=sa.Text()), nullable=False),
+    sa.ForeignKeyConstraint(['session_id'], ['sessions.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_chat_messages_id'), 'chat_messages', ['id'], unique=False)
+    op.create_index('ix_chat_messages_session_id_seq', 'chat_messages', ['session_id', 'seq'], unique=True)
+    op.add_column('sessions', sa.Column('message_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('sessions', sa.Column('history_start', sa.Integer(), server_default='0', nullable=False))
+
+    # unpickle every session's history into one row per turn
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(
+            sa.select(sessions.c.id, sessions.c.session_data)
+            .where(sessions.c.id > last_id)
+            .order_by(sessions.c.id)
+            .limit(BATCH_SIZE)
+        ).all()
+        if not rows:
+            break
+        messages = []
+        for session_id, session_data in rows:
+            chat_history = pickle.loads(session_data) if session_data else []
+            messages.extend(
+                {
+                    'session_id': session_id,
+                    'seq': seq,
+                    'role': content.role or 'model',
+                    'content': content.model_dump(mode='json', exclude_none=True),
+                }
+                for seq, content in enumerate(chat_history)
+            )
+            if chat_history:
+                conn.execute(sessions.update().where(sessions.c.id == session_id).values(message_count=len(chat_history)))
+        if messages:
+            conn.execute(chat_messages.insert(), messages)
+        last_id = rows[-1].id
+
+    op.drop_column('sessions', 'session_data')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('sessions', sa.Column('session_data', postgresql.BYTEA(), nullable=True))
+
+    # pickle each session's remaining history back into its blob
+    conn = op.get_bind()
+    session_rows = conn.execute(sa.text('SELECT id, history_start FROM sessions ORDER BY id')).all()
+    for session_id, history_start in session_rows:
+        contents = conn.execute(
+            sa.select(chat_messages.c.content)
+            .where(chat_messages.c.session_id == session_id, chat_messages.c.seq >= history_start)
+            .order_by(chat_messages.c.seq)
+        ).scalars().all()
+        chat_history = [Content.model_validate(content) for content in contents]
+        conn.execute(sessions.update().where(sessions.c.id == session_id).values(session_data=pickle.dumps(chat_history)))
+
+    op.alter_column('sessions', 'session_data', nullable=False)
+    op.drop_column('sessions', 'history_start')
+    op.drop_column('sessions', 'message_count')
+    op.drop_index('ix_chat_messages_session_id_seq', table_name='chat_messages')
+    op.drop_index(op.f('ix_chat_messages_id'), table_name='chat_messages')
+    op.drop_table('chat_messages')
@@ -0,0 +1,44 @@
+"""one active generation job per session
+
+Revision ID: c6e4b9a2d851
+Revises: a7d2e9c4b160
+Create Date: 2026-10-19 09:41:27.118402
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6e4b9a2d851'
+down_revision: Union[str, Sequence[str], None] = 'a7d2e9c4b160'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('generation_jobs', sa.Column('claim_token', sa.String(), nullable=True))
+    op.drop_constraint('check_job_status', 'generation_jobs', type_='check')
+    op.create_check_constraint('check_job_status', 'generation_jobs', "status IN ('queued', 'running', 'completed', 'failed', 'cancelled')")
+    # sessions with several active jobs keep the newest, the older ones were already racing it for the session's dailies
+    op.execute("""
+        UPDATE generation_jobs SET status = 'cancelled', error = 'superseded by a newer job of the session'
+        WHERE status IN ('queued', 'running') AND id NOT IN (
+            SELECT DISTINCT ON (session_id) id FROM generation_jobs
+            WHERE status IN ('queued', 'running') ORDER BY session_id, created_at DESC
+        )
+    """)
+    op.create_index('ix_generation_jobs_session_id_active', 'generation_jobs', ['session_id'], unique=True,
+                    postgresql_where=sa.text("status IN ('queued', 'running')"))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_generation_jobs_session_id_active', table_name='generation_jobs', postgresql_where=sa.text("status IN ('queued', 'running')"))
+    op.execute("UPDATE generation_jobs SET status = 'failed' WHERE status = 'cancelled'")
+    op.drop_constraint('check_job_status', 'generation_jobs', type_='check')
+    op.create_check_constraint('check_job_status', 'generation_jobs', "status IN ('queued', 'running', 'completed', 'failed')")
+    op.drop_column('generation_jobs', 'claim_token')
@@ -0,0 +1,50 @@
+"""denormalize dailies owner and goal
+
+Revision ID: e5f7a2c94b30
+Revises: d9a3c6e2b718
+Create Date: 2026-10-18 15:02:47.551093
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5f7a2c94b30'
+down_revision: Union[str, Sequence[str], None] = 'd9a3c6e2b718'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('dailies', sa.Column('goal_id', sa.Integer(), nullable=True))
+    op.add_column('dailies', sa.Column('owner_id', sa.Integer(), nullable=True))
+
+    # backfill from the daily's phase and goal, then enforce goal_id like phase_id
+    op.execute("""
+        UPDATE dailies
+        SET goal_id = phases.goal_id, owner_id = goals.owner_id
+        FROM phases JOIN goals ON goals.id = phases.goal_id
+        WHERE phases.id = dailies.phase_id
+    """)
+    op.alter_column('dailies', 'goal_id', nullable=False)
+
+    op.create_foreign_key(op.f('dailies_goal_id_fkey'), 'dailies', 'goals', ['goal_id'], ['id'])
+    op.create_foreign_key(op.f('dailies_owner_id_fkey'), 'dailies', 'users', ['owner_id'], ['id'])
+    op.create_index('ix_dailies_owner_id_is_completed_dailies_date', 'dailies', ['owner_id', 'is_completed', 'dailies_date'], unique=False)
+    op.create_index('ix_dailies_owner_id_completed_date', 'dailies', ['owner_id', 'completed_date'], unique=False)
+    op.create_index('ix_dailies_owner_id_goal_id_is_completed_dailies_date', 'dailies', ['owner_id', 'goal_id', 'is_completed', 'dailies_date'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dailies_owner_id_goal_id_is_completed_dailies_date', table_name='dailies')
+    op.drop_index('ix_dailies_owner_id_completed_date', table_name='dailies')
+    op.drop_index('ix_dailies_owner_id_is_completed_dailies_date', table_name='dailies')
+    op.drop_constraint(op.f('dailies_owner_id_fkey'), 'dailies', type_='foreignkey')
+    op.drop_constraint(op.f('dailies_goal_id_fkey'), 'dailies', type_='foreignkey')
+    op.drop_column('dailies', 'owner_id')
+    op.drop_column('dailies', 'goal_id')
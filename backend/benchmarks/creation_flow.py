@@ -0,0 +1,186 @@
+"""
+End to end load test of the creation pipeline: N simulated users go from signup through /create/query and
+/create/confirm, the background dailies jobs and goal finalization, all at once, against the database in
+DATABASE_URL and without spending Gemini quota.
+
+Gemini is served from fixtures (LLM_TRANSPORT=replay, see utils.llm_transport). Record them once with real
+keys by running a single user with --record, which writes LLM_FIXTURES_DIR. Replayed calls wait as long as the
+recorded ones did unless --latency-ms is given. Every user follows the same script, so each request matches a
+recorded one and gets the same reply, with dates moved to the day of the replay. Quota admission and the
+response cache are turned off for replays, so only our own code and the database are measured.
+
+The app runs in this process behind an ASGI transport (no sockets), next to the clients. Reports, per endpoint,
+request count, latency percentiles and the SQL statements each request sent, plus the statements the dailies
+jobs sent in the background. The simulated users are deleted at the end unless --keep is given.
+
+Run from backend/:
+    python -m benchmarks.creation_flow --record          # once, with the gemini keys in the environment
+    python -m benchmarks.creation_flow --users 50
+"""
+import argparse, asyncio, contextvars, datetime, os, re, statistics, time
+
+EMAIL_DOMAIN = "@creation-bench.example.com" # marks the simulated users, signup validates it as a real address
+
+GOAL_INPUT = "I want to be able to run a half marathon in under 2 hours by {deadline}, to get healthier."
+FOLLOW_UP_ANSWERS = [ # answers to the model's questions, in order, repeated if it keeps asking
+    "I can run 5k without stopping, I have never trained for a race before.",
+    "About 5 hours a week, but not on weekday mornings before 9am. My budget is 150 dollars and I have running shoes.",
+    "That is everything, please go ahead.",
+]
+MAX_STEPS = 40 # a flow that has not completed after this many responses is counted as failed
+
+request_queries = contextvars.ContextVar("request_queries", default=None)
+
+def endpoint_label(method, path):
+    return f"{method} " + re.sub(r"/jobs/[^/]+", "/jobs/{job_id}", path)
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {}
+        self.queries: dict[str, list[int]] = {}
+        self.background_queries = 0
+
+    def app(self, app): # ASGI wrapper counting the statements each request sends
+        async def counting_app(scope, receive, send):
+            if scope["type"] != "http":
+                return await app(scope, receive, send)
+            counter = [0]
+            token = request_queries.set(counter)
+            try:
+                await app(scope, receive, send)
+            finally:
+                request_queries.reset(token)
+                self.queries.setdefault(endpoint_label(scope["method"], scope["path"]), []).append(counter[0])
+        return counting_app
+
+    def count_statement(self, *args):
+        counter = request_queries.get()
+        if counter is None:
+            self.background_queries += 1
+        else:
+            counter[0] += 1
+
+async def run_user(client, recorder, index, poll_interval):
+    async def call(method, path, **kwargs):
+        start = time.perf_counter()
+        response = await client.request(method, path, **kwargs)
+        recorder.latencies.setdefault(endpoint_label(method, path), []).append(time.perf_counter() - start)
+        response.raise_for_status()
+        return response.json() if response.content else None
+
+    token = (await call("POST", "/auth/signup", json={"username": f"bench{index}", "email": f"bench{index}{EMAIL_DOMAIN}", "password": "bench"}))["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    await call("POST", "/create/load", headers=headers)
+    deadline = datetime.date.today() + datetime.timedelta(days=120)
+    response = await call("POST", "/create/query", headers=headers, json={"user_input": GOAL_INPUT.format(deadline=deadline)})
+    answers = 0
+    for _ in range(MAX_STEPS):
+        ret_obj = response["ret_obj"]
+        status = ret_obj.get("status")
+        if status == "goal_completed":
+            return True
+        if status == "follow_up_required":
+            response = await call("POST", "/create/query", headers=headers, json={"user_input": FOLLOW_UP_ANSWERS[min(answers, len(FOLLOW_UP_ANSWERS) - 1)]})
+            answers += 1
+        elif status == "dailies_pending":
+            job = await call("GET", f"/create/jobs/{ret_obj['job_id']}", headers=headers)
+            while job["status"] in ("queued", "running"):
+                await asyncio.sleep(poll_interval)
+                job = await call("GET", f"/create/jobs/{ret_obj['job_id']}", headers=headers)
+            if job["status"] != "completed":
+                return False
+            response = {"phase_tag": "generate_dailies", "ret_obj": job["dailies"]}
+        else: # definitions, phases or dailies to accept
+            response = await call("POST", "/create/confirm", headers=headers, json={"confirm_obj": ret_obj})
+    return False
+
+async def run(args):
+    import httpx
+    from sqlalchemy import event
+    import main
+    from utils import llm_transport
+    from db.session import async_engine
+
+    recorder = Recorder()
+    event.listen(async_engine.sync_engine, "before_cursor_execute", recorder.count_statement)
+    transport = httpx.ASGITransport(app=recorder.app(main.app))
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def user(index):
+                await asyncio.sleep(args.ramp * index / max(args.users, 1))
+                start = time.perf_counter()
+                try:
+                    completed = await run_user(client, recorder, index, args.poll_interval)
+                except Exception as e:
+                    print(f"user {index} failed: ", e)
+                    completed = False
+                return completed, time.perf_counter() - start
+
+            start = time.perf_counter()
+            results = await asyncio.gather(*(user(index) for index in range(args.users)))
+            elapsed = time.perf_counter() - start
+
+    flows = sorted(seconds for completed, seconds in results if completed)
+    print(f"{len(flows)}/{args.users} flows completed in {elapsed:.1f} s"
+          + (f", flow p50 {statistics.median(flows):.1f} s  max {flows[-1]:.1f} s" if flows else ""))
+    print(f"{'endpoint':<32}{'requests':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries/req':>13}{'max':>6}")
+    for label in sorted(recorder.latencies):
+        latencies = sorted(recorder.latencies[label])
+        queries = recorder.queries.get(label, [0])
+        def percentile(p):
+            return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000
+        print(f"{label:<32}{len(latencies):>9}{percentile(0.50):>9.1f}{percentile(0.95):>9.1f}{percentile(0.99):>9.1f}"
+              f"{statistics.mean(queries):>13.1f}{max(queries):>6}")
+    print(f"dailies jobs, background: {recorder.background_queries} queries")
+    if llm_transport.LLM_TRANSPORT == "replay":
+        stats = llm_transport._replay_models.stats
+        print(f"gemini calls replayed: {stats['replayed']}, {stats['unmatched']} of them without a recording of their own")
+
+def cleanup():
+    from sqlalchemy import text
+    from db import SessionLocal
+    db = SessionLocal()
+    users = "SELECT id FROM users WHERE email LIKE '%' || :domain"
+    params = {"domain": EMAIL_DOMAIN}
+    sessions = [row[0] for row in db.execute(text(f"""
+        SELECT session_id FROM generation_jobs WHERE user_id IN ({users})
+        UNION SELECT session_id FROM users WHERE email LIKE '%' || :domain AND session_id IS NOT NULL"""), params)]
+    db.execute(text(f"DELETE FROM generation_jobs WHERE user_id IN ({users})"), params)
+    db.execute(text(f"DELETE FROM dailies WHERE owner_id IN ({users})"), params)
+    db.execute(text(f"DELETE FROM phases WHERE goal_id IN (SELECT id FROM goals WHERE owner_id IN ({users}))"), params)
+    db.execute(text(f"DELETE FROM goals WHERE owner_id IN ({users})"), params)
+    db.execute(text("DELETE FROM users WHERE email LIKE '%' || :domain"), params)
+    if sessions:
+        db.execute(text("DELETE FROM sessions WHERE id = ANY(:ids)"), {"ids": sessions}) # chat messages cascade
+    db.commit()
+    db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="simulated users going through the flow at once")
+    parser.add_argument("--ramp", type=float, default=0, help="seconds over which the users start")
+    parser.add_argument("--latency-ms", default=None, help="replayed gemini latency, defaults to the recorded one")
+    parser.add_argument("--poll-interval", type=float, default=0.5, help="seconds between job polls")
+    parser.add_argument("--record", action="store_true", help="call gemini and write the fixtures instead of replaying them (one user)")
+    parser.add_argument("--keep", action="store_true", help="keep the simulated users and their goals")
+    args = parser.parse_args()
+
+    # read by the app's modules on import, so set before run() imports them
+    if args.record:
+        args.users = 1
+        os.environ["LLM_TRANSPORT"] = "record"
+    else:
+        os.environ.update({"LLM_TRANSPORT": "replay", "LLM_RPM": "0", "LLM_TPM": "0"})
+        if args.latency_ms is not None:
+            os.environ["LLM_REPLAY_LATENCY_MS"] = args.latency_ms
+    os.environ["LLM_CACHE_PHASES"] = ""
+
+    cleanup() # leftovers of an interrupted run
+    try:
+        asyncio.run(run(args))
+    finally:
+        if not args.keep:
+            cleanup()
+
+if __name__ == "__main__":
+    main()
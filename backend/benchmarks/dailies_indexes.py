@@ -0,0 +1,164 @@
+"""
+Dashboard dailies queries before and after the denormalized owner_id/goal_id columns and composite indexes.
+
+Seeds synthetic users, goals, phases and dailies (1M dailies with the defaults), then runs each dashboard
+predicate in two shapes with EXPLAIN (ANALYZE, BUFFERS):
+  before - reaching Goal.owner_id through Daily -> Phase -> Goal, with the composite indexes dropped
+           (inside a transaction that is rolled back, so the real indexes are never touched)
+  after  - filtering dailies on owner_id / goal_id with the composite indexes in place
+and reports the median execution time and the plan's top nodes. The synthetic rows are deleted at the end
+unless --keep is given. Needs an upgraded database in DATABASE_URL.
+
+Run from backend/:
+    python -m benchmarks.dailies_indexes --users 1000 --goals-per-user 2 --phases-per-goal 5 --dailies-per-phase 100
+"""
+import argparse, datetime, json, statistics, time
+
+from sqlalchemy import text
+
+from db import SessionLocal
+
+EMAIL_DOMAIN = "@bench.local" # marks the synthetic users
+
+NEW_INDEXES = ["ix_dailies_owner_id_is_completed_dailies_date", "ix_dailies_owner_id_completed_date", "ix_dailies_owner_id_goal_id_is_completed_dailies_date"]
+
+QUERIES = { # name -> (before, after)
+    "stats: open tasks up to today": (
+        """SELECT d.id, d.task_description, d.dailies_date, d.start_time, d.estimated_time_minutes, d.is_completed, d.phase_id, p.title
+           FROM dailies d JOIN phases p ON p.id = d.phase_id JOIN goals g ON g.id = p.goal_id
+           WHERE g.owner_id = :user_id AND d.dailies_date <= :today AND d.is_completed = false ORDER BY d.dailies_date""",
+        """SELECT d.id, d.task_description, d.dailies_date, d.start_time, d.estimated_time_minutes, d.is_completed, d.phase_id,
+                  (SELECT p.title FROM phases p WHERE p.id = d.phase_id)
+           FROM dailies d
+           WHERE d.owner_id = :user_id AND d.is_completed = false AND d.dailies_date <= :today ORDER BY d.dailies_date""",
+    ),
+    "stats: completed today": (
+        """SELECT count(d.id) FROM dailies d JOIN phases p ON p.id = d.phase_id JOIN goals g ON g.id = p.goal_id
+           WHERE g.owner_id = :user_id AND d.is_completed = true AND d.completed_date = :today""",
+        """SELECT count(d.id) FROM dailies d
+           WHERE d.owner_id = :user_id AND d.is_completed = true AND d.completed_date = :today""",
+    ),
+    "get_dailies: open tasks of a goal": (
+        """SELECT d.* FROM dailies d JOIN phases p ON p.id = d.phase_id JOIN goals g ON g.id = p.goal_id
+           WHERE g.owner_id = :user_id AND g.id = :goal_id AND d.is_completed = false ORDER BY d.dailies_date""",
+        """SELECT d.* FROM dailies d
+           WHERE d.owner_id = :user_id AND d.goal_id = :goal_id AND d.is_completed = false ORDER BY d.dailies_date""",
+    ),
+    "goal_progress: ongoing goals": (
+        """SELECT g.title, g.deadline, count(d.id), sum(CASE WHEN d.is_completed THEN 1 ELSE 0 END)
+           FROM dailies d JOIN phases p ON p.id = d.phase_id JOIN goals g ON g.id = p.goal_id
+           WHERE g.owner_id = :user_id AND g.is_completed = false GROUP BY g.id""",
+        """SELECT g.title, g.deadline, s.total_dailies, s.completed_dailies
+           FROM goals g JOIN (SELECT goal_id, count(id) AS total_dailies, sum(CASE WHEN is_completed THEN 1 ELSE 0 END) AS completed_dailies
+                              FROM dailies WHERE owner_id = :user_id GROUP BY goal_id) s ON s.goal_id = g.id
+           WHERE g.owner_id = :user_id AND g.is_completed = false""",
+    ),
+}
+
+def seed(db, users, goals_per_user, phases_per_goal, dailies_per_phase):
+    params = {"users": users, "goals": goals_per_user, "phases": phases_per_goal, "dailies": dailies_per_phase,
+              "phase_days": max(dailies_per_phase // 2, 1), "domain": EMAIL_DOMAIN}
+    db.execute(text("SELECT setseed(0.42)"))
+    db.execute(text("""
+        INSERT INTO users (username, email, hashed_password)
+        SELECT 'bench' || i, 'bench' || i || :domain, 'x' FROM generate_series(1, :users) i"""), params)
+    db.execute(text("""
+        INSERT INTO goals (title, metric, purpose, deadline, is_completed, owner_id)
+        SELECT 'goal ' || n, 'metric', 'purpose', current_date + 365, false, u.id
+        FROM users u, generate_series(1, :goals) n WHERE u.email LIKE '%' || :domain"""), params)
+    db.execute(text("""
+        INSERT INTO phases (title, description, start_date, estimated_end_date, is_completed, goal_id)
+        SELECT 'phase ' || n, 'description', current_date - (:phases * :phase_days) / 2 + (n - 1) * :phase_days,
+               current_date - (:phases * :phase_days) / 2 + n * :phase_days - 1, false, g.id
+        FROM goals g JOIN users u ON u.id = g.owner_id, generate_series(1, :phases) n WHERE u.email LIKE '%' || :domain"""), params)
+    # two tasks a day, the past ones mostly completed on their own date
+    db.execute(text("""
+        INSERT INTO dailies (task_description, dailies_date, start_time, estimated_time_minutes, is_completed, completed_date, phase_id, goal_id, owner_id)
+        SELECT 'task ' || n, day, time '09:00' + (n % 2) * interval '3 hours', 60, done, CASE WHEN done THEN day END, p.id, p.goal_id, g.owner_id
+        FROM phases p JOIN goals g ON g.id = p.goal_id JOIN users u ON u.id = g.owner_id,
+             generate_series(0, :dailies - 1) n,
+             LATERAL (SELECT p.start_date + n / 2 AS day) d,
+             LATERAL (SELECT day <= current_date AND random() < 0.9 AS done) c
+        WHERE u.email LIKE '%' || :domain"""), params)
+    db.commit()
+
+def cleanup(db):
+    owners = "SELECT id FROM users WHERE email LIKE '%' || :domain"
+    params = {"domain": EMAIL_DOMAIN}
+    db.execute(text(f"DELETE FROM dailies WHERE owner_id IN ({owners})"), params)
+    db.execute(text(f"DELETE FROM phases WHERE goal_id IN (SELECT id FROM goals WHERE owner_id IN ({owners}))"), params)
+    db.execute(text(f"DELETE FROM goals WHERE owner_id IN ({owners})"), params)
+    db.execute(text("DELETE FROM users WHERE email LIKE '%' || :domain"), params)
+    db.commit()
+
+def plan_summary(node, depth=0): # "Node Type on relation using index" for the top few levels of a json plan
+    label = node["Node Type"]
+    if "Index Name" in node:
+        label += f" using {node['Index Name']}"
+    elif "Relation Name" in node:
+        label += f" on {node['Relation Name']}"
+    labels = [label]
+    if depth < 2:
+        for child in node.get("Plans", []):
+            labels.extend(plan_summary(child, depth + 1))
+    return labels
+
+def explain(db, sql, params, runs):
+    times, plan = [], None
+    for _ in range(runs):
+        result = db.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+        result = json.loads(result) if isinstance(result, str) else result
+        times.append(result[0]["Execution Time"])
+        plan = result[0]["Plan"]
+    return statistics.median(times), plan
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--goals-per-user", type=int, default=2)
+    parser.add_argument("--phases-per-goal", type=int, default=5)
+    parser.add_argument("--dailies-per-phase", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=7, help="EXPLAIN ANALYZE runs per query, the median is reported")
+    parser.add_argument("--show-plans", action="store_true", help="print the full json plans")
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic rows for another run")
+    parser.add_argument("--reuse", action="store_true", help="use synthetic rows kept by an earlier --keep run")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if not args.reuse:
+            start = time.perf_counter()
+            seed(db, args.users, args.goals_per_user, args.phases_per_goal, args.dailies_per_phase)
+            print(f"seeded in {time.perf_counter() - start:.1f} s")
+        with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection: # fresh statistics and visibility map, as after autovacuum
+            connection.execute(text("VACUUM ANALYZE users, goals, phases, dailies"))
+        total = db.execute(text("SELECT count(*) FROM dailies")).scalar()
+        user_id, goal_id = db.execute(text("""
+            SELECT u.id, g.id FROM users u JOIN goals g ON g.owner_id = u.id
+            WHERE u.email LIKE '%' || :domain ORDER BY u.id OFFSET (SELECT count(*) / 2 FROM users WHERE email LIKE '%' || :domain) LIMIT 1"""),
+            {"domain": EMAIL_DOMAIN}).one()
+        params = {"user_id": user_id, "goal_id": goal_id, "today": datetime.date.today()}
+        print(f"{total} dailies in total, measuring user {user_id}\n")
+
+        results = {}
+        for name, (before_sql, after_sql) in QUERIES.items():
+            results[name] = {"after": explain(db, after_sql, params, args.runs)}
+        for index in NEW_INDEXES: # rolled back below
+            db.execute(text(f"DROP INDEX {index}"))
+        for name, (before_sql, after_sql) in QUERIES.items():
+            results[name]["before"] = explain(db, before_sql, params, args.runs)
+        db.rollback()
+
+        for name, result in results.items():
+            (before_ms, before_plan), (after_ms, after_plan) = result["before"], result["after"]
+            print(f"{name}\n  before {before_ms:9.3f} ms  {' > '.join(plan_summary(before_plan))}")
+            print(f"  after  {after_ms:9.3f} ms  {' > '.join(plan_summary(after_plan))}")
+            if args.show_plans:
+                print(json.dumps({"before": before_plan, "after": after_plan}, indent=2))
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+if __name__ == "__main__":
+    main()
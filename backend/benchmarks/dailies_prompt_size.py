@@ -0,0 +1,96 @@
+"""
+Prompt size of each generate_dailies window, before and after the compact context encoding.
+
+Builds a synthetic plan and renders the window prompts of its last phase both ways:
+"before" embeds the full phases json and the repr of every confirmed DailyCreate, "after" uses
+encode_phases_outline and encode_dailies_context. Token counts are estimated locally unless
+--count-tokens is given, which asks Gemini's count_tokens with DAILIES_API_KEY. --live also times
+one generate_content call per window for both prompts.
+
+Run from backend/:
+    python -m benchmarks.dailies_prompt_size --phases 4 --weeks-per-phase 8 --tasks-per-day 2
+"""
+import argparse, asyncio, datetime, json, time
+
+from schemas import DailyCreate, DailiesGeneration, PhaseCreate, PhaseGeneration
+from utils.context_encoder import estimate_tokens, encode_dailies_context, encode_phases_outline
+from utils.instruction_chain import DAILIES_GENERATION_INSTRUCTION
+from utils.llm_clients import get_llm_client
+from utils.llm_utils import DAILIES_API_KEY, LLM_MODEL, split_phase_windows
+
+TASK = ("Work through the next section of the course notes, summarise the key ideas in your own words "
+        "and complete the practice exercises at the end of the chapter")
+
+def build_plan(phases, weeks_per_phase, tasks_per_day):
+    start = datetime.date.today()
+    plan = []
+    for p in range(phases):
+        end = start + datetime.timedelta(weeks=weeks_per_phase) - datetime.timedelta(days=1)
+        plan.append(PhaseCreate(title=f"Phase {p+1}", description=f"Reach milestone {p+1} of the goal, measured by a timed practice test", start_date=start, end_date=end))
+        start = end + datetime.timedelta(days=1)
+    dailies = []
+    for phase in plan[:-1]: # every phase but the last is already confirmed
+        day = phase.start_date
+        while day <= phase.end_date:
+            for t in range(tasks_per_day):
+                dailies.append(DailyCreate(
+                    task_description=f"{TASK} ({day}, part {t+1})\n Resources: (Please copy and paste)\n[1] https://example.com/resource/{t}\n",
+                    dailies_date=day, start_time=datetime.time(9 + 3*t), estimated_time_minutes=60, phase_title=phase.title,
+                ))
+            day += datetime.timedelta(days=1)
+    return PhaseGeneration(phases=plan), dailies
+
+def window_prompts(phases, dailies, goal_json, prereq_json):
+    phase = phases.phases[-1]
+    phases_json = phases.model_dump_json()
+    before_system = DAILIES_GENERATION_INSTRUCTION.format(dailiesGeneration=DailiesGeneration.model_json_schema(), phase_resources="",
+                                                          goal_obj=goal_json, prereq_obj=prereq_json, phases_obj=phases_json, phase_title=phase.title)
+    after_system = DAILIES_GENERATION_INSTRUCTION.format(dailiesGeneration=DailiesGeneration.model_json_schema(), phase_resources="",
+                                                         goal_obj=goal_json, prereq_obj=prereq_json, phases_obj=encode_phases_outline(phases_json, phase.title), phase_title=phase.title)
+    confirmed = list(dailies)
+    for window_start, window_end in split_phase_windows(phase):
+        before = f"The currently confirmed tasks for this goal (for context and continuity) is: {confirmed}.\nGenerate the daily schedule for the next 2 weeks starting from, and including {window_start}"
+        after = f"The currently confirmed tasks for this goal (for context and continuity) are:\n{encode_dailies_context(confirmed)}\nGenerate the daily schedule for the next 2 weeks starting from, and including {window_start}"
+        yield window_start, (before_system, before), (after_system, after)
+        day = window_start # the window's own tasks become context for the next one
+        while day <= window_end:
+            confirmed.append(DailyCreate(task_description=TASK, dailies_date=day, start_time=datetime.time(9), estimated_time_minutes=60, phase_title=phase.title))
+            day += datetime.timedelta(days=1)
+
+async def measure(system_instruction, prompt, count_tokens, live):
+    client = get_llm_client(DAILIES_API_KEY) if (count_tokens or live) else None
+    if count_tokens:
+        tokens = (await client.models.count_tokens(model=LLM_MODEL, contents=system_instruction + prompt)).total_tokens
+    else:
+        tokens = estimate_tokens(system_instruction + prompt)
+    latency = None
+    if live:
+        start = time.perf_counter()
+        await client.models.generate_content(model=LLM_MODEL, contents=prompt, config={
+            "system_instruction": system_instruction, "response_mime_type": "application/json", "response_schema": DailiesGeneration})
+        latency = (time.perf_counter() - start) * 1000
+    return tokens, latency
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--phases", type=int, default=4)
+    parser.add_argument("--weeks-per-phase", type=int, default=8)
+    parser.add_argument("--tasks-per-day", type=int, default=2)
+    parser.add_argument("--count-tokens", action="store_true", help="count tokens with the Gemini API instead of estimating")
+    parser.add_argument("--live", action="store_true", help="also time a real generate_content call per window")
+    args = parser.parse_args()
+
+    phases, dailies = build_plan(args.phases, args.weeks_per_phase, args.tasks_per_day)
+    goal_json = json.dumps({"title": "Pass the certification exam", "metric": "Score above 80%", "purpose": "Career change", "deadline": str(phases.phases[-1].end_date)})
+    prereq_json = json.dumps({"related_experience": ["Some scripting"], "time_commitment_per_week_hours": 10, "blocked_time_blocks": ["Weekdays 9am-5pm"], "budget": 100.0})
+
+    print(f"{len(dailies)} confirmed dailies before the last phase")
+    print(f"{'window':<12}{'tokens before':>15}{'tokens after':>14}{'ms before':>11}{'ms after':>10}")
+    for window_start, before, after in window_prompts(phases, dailies, goal_json, prereq_json):
+        before_tokens, before_ms = await measure(*before, args.count_tokens, args.live)
+        after_tokens, after_ms = await measure(*after, args.count_tokens, args.live)
+        fmt = lambda ms: f"{ms:.0f}" if ms is not None else "-"
+        print(f"{str(window_start):<12}{before_tokens:>15}{after_tokens:>14}{fmt(before_ms):>11}{fmt(after_ms):>10}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,173 @@
+"""
+Dashboard throughput under many concurrent clients, sync database stack against the async (asyncpg) one.
+
+Seeds synthetic users with goals, phases and dailies (see benchmarks.dailies_indexes), then starts the API with
+uvicorn twice on the same database:
+  before - the tree at --before-ref, checked out in a temporary git worktree. Defaults to the commit before the
+           async engine was introduced, where every route is a plain def run in the thread pool
+  after  - this tree
+Each run opens --clients concurrent clients that log in as the synthetic users and loop over /dashboard/stats,
+/dashboard/goal_progress and /goals/titles for --duration seconds after a short warm up, and reports requests/sec
+and latency percentiles. The in-process response cache is disabled (RESPONSE_CACHE_SIZE=0) and no If-None-Match is
+sent, so every request reaches the database. The synthetic rows are deleted at the end unless --keep is given.
+Needs an upgraded database in DATABASE_URL. The clients share the machine with the server, so compare runs
+against each other rather than reading the numbers as absolute capacity.
+
+Run from backend/:
+    python -m benchmarks.dashboard_load --clients 200 --duration 20
+"""
+import argparse, asyncio, json, os, subprocess, sys, tempfile, time
+from pathlib import Path
+
+import httpx
+from sqlalchemy import text
+
+from db import SessionLocal
+from utils.auth import create_access_token
+from benchmarks.dailies_indexes import EMAIL_DOMAIN, seed, cleanup
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+ENDPOINTS = [ # (method, path, json body)
+    ("GET", "/dashboard/stats", None),
+    ("POST", "/dashboard/goal_progress", {"goal_id": None}),
+    ("POST", "/goals/titles", None),
+]
+
+def default_before_ref(): # parent of the commit that introduced the async engine
+    introduced = subprocess.run(
+        ["git", "log", "--format=%H", "-S", "create_async_engine", "--", "db/session.py"],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout.split()
+    return f"{introduced[-1]}^" if introduced else None
+
+def start_server(backend_dir, port, env=None): # env overrides the server's environment, the response cache is off unless it says otherwise
+    env = {**os.environ, "RESPONSE_CACHE_SIZE": "0", **(env or {})}
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=backend_dir, env=env, stdout=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/").status_code == 200:
+                return server
+        except httpx.TransportError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"server in {backend_dir} did not start")
+
+def encode_request(method, path, body, token, host): # raw HTTP/1.1 keep-alive request, httpx costs more CPU per request than the server does
+    payload = json.dumps(body).encode() if body is not None else b""
+    head = (f"{method} {path} HTTP/1.1\r\nHost: {host}\r\nAuthorization: Bearer {token}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n")
+    return head.encode() + payload
+
+async def send(reader, writer, request) -> int: # status code of the response, whose body is read and dropped
+    writer.write(request)
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    length = next((int(line.split(":", 1)[1]) for line in lines if line.lower().startswith("content-length:")), 0)
+    await reader.readexactly(length)
+    return int(lines[0].split()[1])
+
+async def run_load(host, port, tokens, clients, duration, warmup):
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    async def client_loop(token, offset):
+        nonlocal errors
+        requests = [encode_request(method, path, body, token, f"{host}:{port}") for method, path, body in ENDPOINTS]
+        reader, writer = await asyncio.open_connection(host, port)
+        i = offset
+        try:
+            while True:
+                request = requests[i % len(requests)]
+                i += 1
+                sent = time.perf_counter()
+                if sent >= stop_at:
+                    return
+                try:
+                    ok = await send(reader, writer, request) == 200
+                except (OSError, asyncio.IncompleteReadError):
+                    ok = False
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+                if sent >= measure_from:
+                    if ok:
+                        latencies.append(time.perf_counter() - sent)
+                    else:
+                        errors += 1
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client_loop(tokens[i % len(tokens)], i) for i in range(clients)))
+
+    latencies.sort()
+    def percentile(p):
+        return latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000 if latencies else float("nan")
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": len(latencies) / duration,
+        "p50": percentile(0.50),
+        "p95": percentile(0.95),
+        "p99": percentile(0.99),
+    }
+
+def bench(label, backend_dir, port, tokens, args):
+    server = start_server(backend_dir, port)
+    try:
+        result = asyncio.run(run_load("127.0.0.1", port, tokens, args.clients, args.duration, args.warmup))
+    finally:
+        server.terminate()
+        server.wait()
+    print(f"{label:<7} {result['rps']:>9.0f} req/s  p50 {result['p50']:>7.1f} ms  p95 {result['p95']:>7.1f} ms  "
+          f"p99 {result['p99']:>7.1f} ms  ({result['requests']} ok, {result['errors']} errors)")
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=200, help="concurrent clients")
+    parser.add_argument("--duration", type=float, default=20, help="measured seconds per run")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--goals-per-user", type=int, default=2)
+    parser.add_argument("--phases-per-goal", type=int, default=5)
+    parser.add_argument("--dailies-per-phase", type=int, default=20)
+    parser.add_argument("--before-ref", default=None, help="git ref of the 'before' tree, defaults to the last sync commit")
+    parser.add_argument("--skip-before", action="store_true", help="only run this tree")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--keep", action="store_true", help="keep the synthetic rows for another run")
+    parser.add_argument("--reuse", action="store_true", help="use synthetic rows kept by an earlier --keep run")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if not args.reuse:
+            seed(db, args.users, args.goals_per_user, args.phases_per_goal, args.dailies_per_phase)
+            with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+                connection.execute(text("VACUUM ANALYZE users, goals, phases, dailies"))
+        users = db.execute(text("SELECT id, username FROM users WHERE email LIKE '%' || :domain ORDER BY id"), {"domain": EMAIL_DOMAIN}).all()
+        tokens = [create_access_token({"uid": user.id, "username": user.username}) for user in users]
+        print(f"{len(users)} users, {args.clients} clients, {args.duration:.0f} s per run")
+
+        if not args.skip_before:
+            before_ref = args.before_ref or default_before_ref()
+            with tempfile.TemporaryDirectory() as worktree:
+                subprocess.run(["git", "worktree", "add", "--detach", worktree, before_ref], cwd=BACKEND_DIR, check=True, capture_output=True)
+                try:
+                    bench("before", Path(worktree) / "backend", args.port, tokens, args)
+                finally:
+                    subprocess.run(["git", "worktree", "remove", "--force", worktree], cwd=BACKEND_DIR, capture_output=True)
+        bench("after", BACKEND_DIR, args.port + 1, tokens, args)
+    finally:
+        if not args.keep:
+            cleanup(db)
+        db.close()
+
+if __name__ == "__main__":
+    main()
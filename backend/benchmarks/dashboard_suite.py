@@ -0,0 +1,199 @@
+"""
+Repeatable load test of the dashboard endpoints against a production sized dataset, with results that can be kept
+as JSON and compared across commits.
+
+Uses the users seeded by benchmarks.seed_data, seeding them first (--dailies and the other seed_data options)
+when the database has none. The seeded rows are kept for the next run, so successive runs measure the same data;
+--reseed starts over and --clean deletes them at the end. Starts the API with uvicorn and runs each scenario for
+--duration seconds after --warmup seconds, with --clients concurrent clients, each logged in as its own seeded
+user (picked with --seed, so runs use the same users):
+  stats, goal_progress, get_dailies, mark_complete, titles - one endpoint alone
+  mix  - the endpoints in the proportions of MIX, about what the dashboard and goal pages send
+get_dailies asks for the open or the completed dailies of one of the user's ongoing goals, all of them like the
+goal page does unless --page-size is given. mark_complete ticks off or reopens one of the user's overdue
+tasks. The tasks ticked off are reopened after each scenario, so the dataset stays the same between runs. The
+response cache is off unless --response-cache is given, and no If-None-Match is sent.
+
+Reports requests/sec, errors and latency percentiles per scenario and per endpoint. --json writes them with the
+commit, the dataset size and the options, --compare prints the change against such a file.
+
+Run from backend/:
+    python -m benchmarks.dashboard_suite --dailies 1000000 --json before.json
+    python -m benchmarks.dashboard_suite --compare before.json --json after.json
+"""
+import argparse, asyncio, datetime, json, random, subprocess, time
+from types import SimpleNamespace
+
+from sqlalchemy import text
+
+from db import SessionLocal
+from utils.auth import create_access_token
+from benchmarks import seed_data
+from benchmarks.dashboard_load import BACKEND_DIR, start_server, encode_request, send
+
+ENDPOINTS = ["stats", "goal_progress", "get_dailies", "mark_complete", "titles"]
+MIX = {"stats": 30, "goal_progress": 20, "titles": 20, "get_dailies": 25, "mark_complete": 5} # relative weights
+SCENARIOS = {**{endpoint: {endpoint: 1} for endpoint in ENDPOINTS}, "mix": MIX}
+OVERDUE_TASKS = 20 # open tasks per user that mark_complete picks from
+
+def build_request(endpoint, user, rng, page_size): # (method, path, json body)
+    if endpoint == "stats":
+        return "GET", "/dashboard/stats", None
+    if endpoint == "goal_progress":
+        return "POST", "/dashboard/goal_progress", {"goal_id": None}
+    if endpoint == "titles":
+        return "POST", "/goals/titles", None
+    if endpoint == "get_dailies":
+        return "POST", "/dashboard/get_dailies", {"goal_id": rng.choice(user.goal_ids), "completed": rng.random() < 0.5, "limit": page_size}
+    daily_id = rng.choice(user.task_ids)
+    completed = daily_id not in user.ticked
+    (user.ticked.add if completed else user.ticked.discard)(daily_id)
+    return "PATCH", "/dashboard/mark_complete", {"ids": [daily_id], "completed": completed}
+
+def load_users(db, clients, seed): # a seeded user with an ongoing goal and overdue tasks for each client
+    candidates = db.execute(text("""
+        SELECT u.id FROM users u
+        WHERE u.email LIKE '%' || :domain
+          AND EXISTS (SELECT 1 FROM dailies d WHERE d.owner_id = u.id AND d.is_completed = false AND d.dailies_date < current_date)
+        ORDER BY u.id"""), {"domain": seed_data.EMAIL_DOMAIN}).scalars().all()
+    chosen = sorted(random.Random(seed).sample(candidates, min(clients, len(candidates))))
+    rows = db.execute(text("""
+        SELECT u.id, u.username,
+               ARRAY(SELECT g.id FROM goals g WHERE g.owner_id = u.id AND g.is_completed = false ORDER BY g.id) AS goal_ids,
+               ARRAY(SELECT d.id FROM dailies d WHERE d.owner_id = u.id AND d.is_completed = false AND d.dailies_date < current_date
+                     ORDER BY d.dailies_date DESC, d.id LIMIT :tasks) AS task_ids
+        FROM users u WHERE u.id = ANY(:ids) ORDER BY u.id"""), {"ids": chosen, "tasks": OVERDUE_TASKS}).all()
+    return [SimpleNamespace(id=row.id, token=create_access_token({"uid": row.id, "username": row.username}),
+                            goal_ids=row.goal_ids, task_ids=row.task_ids, ticked=set()) for row in rows]
+
+def dataset_size(db) -> dict:
+    owners = "SELECT id FROM users WHERE email LIKE '%' || :domain"
+    params = {"domain": seed_data.EMAIL_DOMAIN}
+    return {
+        "users": db.execute(text(f"SELECT count(*) FROM ({owners}) u"), params).scalar(),
+        "goals": db.execute(text(f"SELECT count(*) FROM goals WHERE owner_id IN ({owners})"), params).scalar(),
+        "dailies": db.execute(text(f"SELECT count(*) FROM dailies WHERE owner_id IN ({owners})"), params).scalar(),
+    }
+
+def summarize(latencies, errors, duration) -> dict:
+    latencies = sorted(latencies)
+    def percentile(p):
+        return round(latencies[min(int(len(latencies) * p), len(latencies) - 1)] * 1000, 2) if latencies else None
+    return {"requests": len(latencies), "errors": errors, "rps": round(len(latencies) / duration, 1),
+            "p50": percentile(0.50), "p95": percentile(0.95), "p99": percentile(0.99)}
+
+async def run_scenario(host, port, users, weights, args) -> dict:
+    latencies = {endpoint: [] for endpoint in weights}
+    errors = dict.fromkeys(weights, 0)
+    start = time.perf_counter()
+    measure_from = start + args.warmup
+    stop_at = measure_from + args.duration
+    endpoints, cumulative = list(weights), []
+    for weight in weights.values():
+        cumulative.append((cumulative[-1] if cumulative else 0) + weight)
+
+    async def client_loop(index, user):
+        rng = random.Random(args.seed + index)
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            while time.perf_counter() < stop_at:
+                endpoint = rng.choices(endpoints, cum_weights=cumulative)[0]
+                request = encode_request(*build_request(endpoint, user, rng, args.page_size), user.token, f"{host}:{port}")
+                sent = time.perf_counter()
+                try:
+                    ok = await send(reader, writer, request) == 200
+                except (OSError, asyncio.IncompleteReadError):
+                    ok = False
+                    writer.close()
+                    reader, writer = await asyncio.open_connection(host, port)
+                if sent >= measure_from:
+                    if ok:
+                        latencies[endpoint].append(time.perf_counter() - sent)
+                    else:
+                        errors[endpoint] += 1
+            if user.ticked: # back to the seeded state, not measured
+                body = {"ids": sorted(user.ticked), "completed": False}
+                await send(reader, writer, encode_request("PATCH", "/dashboard/mark_complete", body, user.token, f"{host}:{port}"))
+                user.ticked.clear()
+        finally:
+            writer.close()
+
+    await asyncio.gather(*(client_loop(index, user) for index, user in enumerate(users)))
+    result = summarize([latency for values in latencies.values() for latency in values], sum(errors.values()), args.duration)
+    if len(weights) > 1:
+        result["endpoints"] = {endpoint: summarize(latencies[endpoint], errors[endpoint], args.duration) for endpoint in weights}
+    return result
+
+def print_result(name, result, baseline=None):
+    line = (f"{name:<24}{result['rps']:>9.1f}{result['errors']:>7}"
+            + "".join(f"{result[p]:>9.1f}" if result[p] is not None else f"{'-':>9}" for p in ("p50", "p95", "p99")))
+    if baseline and baseline.get("rps") and baseline.get("p95") and result["p95"] is not None:
+        line += f"   rps {(result['rps'] / baseline['rps'] - 1) * 100:+6.1f}%  p95 {(result['p95'] / baseline['p95'] - 1) * 100:+6.1f}%"
+    print(line)
+
+def git_revision() -> dict:
+    def git(*command):
+        return subprocess.run(["git", *command], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD"), "subject": git("log", "-1", "--format=%s"), "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=50, help="concurrent clients, each logged in as its own user")
+    parser.add_argument("--duration", type=float, default=15, help="measured seconds per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds before measuring, per scenario")
+    parser.add_argument("--scenarios", nargs="+", choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--page-size", type=int, default=None, help="limit of get_dailies requests, every matching daily when left out")
+    parser.add_argument("--response-cache", type=int, default=0, help="RESPONSE_CACHE_SIZE of the server, 0 sends every request to the database")
+    parser.add_argument("--port", type=int, default=8775)
+    parser.add_argument("--json", default=None, help="write the results to this file")
+    parser.add_argument("--compare", default=None, help="results file of an earlier run to compare against")
+    parser.add_argument("--reseed", action="store_true", help="delete the seeded users and seed them again first")
+    parser.add_argument("--clean", action="store_true", help="delete the seeded users at the end")
+    seed_data.add_arguments(parser)
+    args = parser.parse_args()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    db = SessionLocal()
+    try:
+        if args.reseed:
+            seed_data.cleanup(db)
+        if not seed_data.seeded_users(db):
+            start = time.perf_counter()
+            seed_data.seed(db, args)
+            seed_data.vacuum(db)
+            print(f"seeded in {time.perf_counter() - start:.1f} s")
+        dataset = dataset_size(db)
+        users = load_users(db, args.clients, args.seed)
+        print(f"{dataset['dailies']} dailies of {dataset['users']} users, {len(users)} clients, {args.duration:.0f} s per scenario")
+        if baseline and baseline["dataset"] != dataset:
+            print(f"the baseline was measured on another dataset: {baseline['dataset']}")
+
+        server = start_server(BACKEND_DIR, args.port, {"RESPONSE_CACHE_SIZE": str(args.response_cache)})
+        results = {}
+        try:
+            print(f"{'scenario':<24}{'req/s':>9}{'errors':>7}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+            for name in args.scenarios:
+                results[name] = asyncio.run(run_scenario("127.0.0.1", args.port, users, SCENARIOS[name], args))
+                previous = (baseline or {}).get("scenarios", {}).get(name)
+                print_result(name, results[name], previous)
+                for endpoint, result in results[name].get("endpoints", {}).items():
+                    print_result(f"  {endpoint}", result, (previous or {}).get("endpoints", {}).get(endpoint))
+        finally:
+            server.terminate()
+            server.wait()
+
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({**git_revision(), "date": datetime.datetime.now().isoformat(timespec="seconds"), "dataset": dataset,
+                           "options": vars(args), "scenarios": results}, f, indent=1)
+    finally:
+        if args.clean:
+            seed_data.cleanup(db)
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Latency of saving a finished plan (goal, phases and dailies) when the last DailiesPost is confirmed.
+
+"before" repeats what finalization used to do: insert_goal, insert_phases and insert_dailies each added ORM
+objects and committed on their own, then refreshed every inserted phase and daily with a SELECT.
+"after" goes through finalize_goal, which inserts the phases and dailies with bulk INSERT ... RETURNING, maps
+phase ids in memory and commits once. Both run against the same synthetic user for plans of each --sizes
+dailies spread over --phases phases, and report the median wall time and the statements sent per finalization.
+The synthetic rows are deleted at the end. Needs an upgraded database in DATABASE_URL.
+
+Run from backend/:
+    python -m benchmarks.goal_finalization --sizes 50 500 5000 --runs 5
+"""
+import argparse, asyncio, datetime, json, statistics, time
+from types import SimpleNamespace
+
+from sqlalchemy import event, update
+
+from db import SessionLocal, AsyncSessionLocal
+from db.session import async_engine
+from models import User, Goal, Phase, Daily
+from schemas import DailiesPost
+from utils import finalize_goal
+from benchmarks.dailies_indexes import EMAIL_DOMAIN, cleanup
+
+statements = 0
+
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    global statements
+    statements += 1
+
+def make_plan(dailies, phases): # chat session objs and the final DailiesPost for a plan of the given size
+    start = datetime.date.today()
+    phase_days = max(dailies // phases // 2, 1)
+    phase_list = [{"title": f"Phase {i}", "description": "Build up weekly distance",
+                   "start_date": str(start + datetime.timedelta(days=i * phase_days)),
+                   "end_date": str(start + datetime.timedelta(days=(i + 1) * phase_days - 1))} for i in range(phases)]
+    session = SimpleNamespace(
+        goal_obj=json.dumps({"status": "definitions_extracted", "title": "Run a marathon", "metric": "Finish under 4 hours", "purpose": "Health", "deadline": "2027-06-01"}),
+        prereq_obj=json.dumps({"status": "prerequisites_extracted", "related_experience": ["5k runs"], "time_commitment_per_week_hours": 6, "blocked_time_blocks": ["Weekdays 9am-5pm"],
+                               "budget": 200.0, "required_resources": ["Running shoes"], "possible_gap_assessment": ["Endurance"]}),
+        phases_obj=json.dumps({"status": "phases_generated", "phases": phase_list}),
+    )
+    tasks = [{"task_description": f"task {n}", "dailies_date": str(start + datetime.timedelta(days=n // 2)), "start_time": "09:00:00" if n % 2 else "12:00:00",
+              "estimated_time_minutes": 60, "phase_title": phase_list[min(n * phases // dailies, phases - 1)]["title"]} for n in range(dailies)]
+    dailies_post = DailiesPost.model_validate({"status": "dailies_generated", "dailies": tasks,
+                                               "goal_phases": [p["title"] for p in phase_list], "curr_phase": phase_list[-1]["title"]})
+    return session, dailies_post
+
+async def before(session, dailies_post, user_id, db):
+    goal_data, prereq_data = json.loads(session.goal_obj), json.loads(session.prereq_obj)
+    db_goal = Goal(title=goal_data["title"], metric=goal_data["metric"], purpose=goal_data["purpose"],
+                   deadline=datetime.date.fromisoformat(goal_data["deadline"]), owner_id=user_id,
+                   related_experience=prereq_data["related_experience"], possible_gap_assessment=prereq_data["possible_gap_assessment"],
+                   time_commitment_per_week_hours=prereq_data["time_commitment_per_week_hours"], budget=prereq_data["budget"],
+                   required_resources=prereq_data["required_resources"], blocked_time_blocks=prereq_data["blocked_time_blocks"])
+    db.add(db_goal)
+    await db.commit()
+    await db.refresh(db_goal)
+
+    db_phases_list = [Phase(title=p["title"], description=p["description"], start_date=datetime.date.fromisoformat(p["start_date"]),
+                            estimated_end_date=datetime.date.fromisoformat(p["end_date"]), goal_id=db_goal.id)
+                      for p in json.loads(session.phases_obj)["phases"]]
+    db.add_all(db_phases_list)
+    await db.commit()
+    for db_phase in db_phases_list:
+        await db.refresh(db_phase)
+
+    phase_title_to_phase = {phase.title: phase for phase in db_phases_list}
+    db_dailies_list = [Daily(task_description=d.task_description, dailies_date=d.dailies_date, start_time=d.start_time,
+                             estimated_time_minutes=d.estimated_time_minutes, phase_id=phase_title_to_phase[d.phase_title].id,
+                             goal_id=db_goal.id, owner_id=user_id) for d in dailies_post.dailies]
+    db.add_all(db_dailies_list)
+    await db.execute(update(User).where(User.id == user_id).values(data_version=User.data_version + 1))
+    await db.commit()
+    for db_daily in db_dailies_list:
+        await db.refresh(db_daily)
+
+async def after(session, dailies_post, user_id, db):
+    await finalize_goal(session, dailies_post, user_id, db)
+    await db.commit()
+
+async def measure(fn, session, dailies_post, user_id, runs): # (median ms, statements per finalization)
+    global statements
+    times = []
+    for _ in range(runs):
+        async with AsyncSessionLocal() as db:
+            statements = 0
+            start = time.perf_counter()
+            await fn(session, dailies_post, user_id, db)
+            times.append((time.perf_counter() - start) * 1000)
+    return statistics.median(times), statements
+
+async def run(args):
+    async with AsyncSessionLocal() as db:
+        user = User(username="bench finalize", email="finalize" + EMAIL_DOMAIN, hashed_password="x")
+        db.add(user)
+        await db.commit()
+        user_id = user.id
+
+    print(f"{'dailies':>8}{'before ms':>11}{'stmts':>7}{'after ms':>10}{'stmts':>7}{'speedup':>9}")
+    for size in args.sizes:
+        session, dailies_post = make_plan(size, args.phases)
+        await measure(after, session, dailies_post, user_id, 1) # warm up the connection pool and statement caches
+        before_ms, before_statements = await measure(before, session, dailies_post, user_id, args.runs)
+        after_ms, after_statements = await measure(after, session, dailies_post, user_id, args.runs)
+        print(f"{size:>8}{before_ms:>11.1f}{before_statements:>7}{after_ms:>10.1f}{after_statements:>7}{before_ms / after_ms:>8.1f}x")
+    await async_engine.dispose()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 500, 5000], help="dailies per plan")
+    parser.add_argument("--phases", type=int, default=5)
+    parser.add_argument("--runs", type=int, default=5, help="finalizations timed per size and variant")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    finally:
+        db = SessionLocal()
+        cleanup(db)
+        db.close()
+
+if __name__ == "__main__":
+    main()
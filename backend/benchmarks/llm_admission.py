@@ -0,0 +1,121 @@
+"""
+Gemini calls under a burst of users, with and without the per-key admission control in utils.llm_scheduler.
+
+Gemini is replaced by a simulated model that enforces a request quota per key as a token bucket (--quota requests
+per --period seconds, a shortened "minute" so runs stay short) and answers over-quota calls with a 429 carrying a
+RetryInfo delay, like the real API. Every call takes --latency ms. Scenarios:
+  burst    - --users users each make --calls chat turns one after another, all starting together.
+             before: calls go straight to the model, as they used to, so a 429 fails the request
+             after:  calls go through llm_utils.generate_content, which queues them on the key's bucket and
+                     retries 429s with jittered backoff. run again with the scheduler assuming twice the real
+                     quota, so that the model does answer with 429s
+  fairness - one user starts a dailies generation of --heavy-calls windows at once while the other users keep
+             chatting on the same key. Latency of the light users' calls with a single FIFO queue
+             (every call queued for the same caller) against the round robin queue per caller
+
+Run from backend/:
+    python -m benchmarks.llm_admission --users 60 --calls 4 --quota 40 --period 5
+"""
+import argparse, asyncio, random, time
+from types import SimpleNamespace
+
+from google.genai.errors import ClientError
+from google.genai.types import GenerateContentResponse, GenerateContentResponseUsageMetadata
+
+from utils import llm_utils, llm_scheduler
+from utils.llm_scheduler import KeyScheduler, TokenBucket, llm_caller, llm_queue_stats
+
+API_KEY = "simulated-key"
+
+class SimulatedGemini:
+    """models.generate_content of a genai AsyncClient with a request quota"""
+    def __init__(self, quota, period, latency):
+        self.quota = TokenBucket(quota, period)
+        self.latency = latency
+        self.models = self
+
+    async def generate_content(self, model, contents, config):
+        if self.quota.wait_time(1, time.monotonic()) > 0:
+            await asyncio.sleep(0.02) # a rejection still costs a round trip
+            raise ClientError(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED", "message": "quota exceeded",
+                                              "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "1s"}]}})
+        self.quota.take(1)
+        await asyncio.sleep(self.latency * random.uniform(0.8, 1.2))
+        return GenerateContentResponse(usage_metadata=GenerateContentResponseUsageMetadata(total_token_count=1500))
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else float("nan")
+
+async def user_calls(user, calls, call, latencies, errors):
+    llm_caller.set(user)
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            await call()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(user)
+        await asyncio.sleep(random.uniform(0, 0.2)) # the user reads the reply
+
+def setup(args, assumed_quota=None): # assumed_quota is what the scheduler is configured with, the model's real one by default
+    model = SimulatedGemini(args.quota, args.period, args.latency / 1000)
+    llm_utils.get_llm_models = lambda api_key: model
+    llm_queue_stats.clear()
+    llm_scheduler._schedulers[API_KEY] = KeyScheduler("simulated", rpm=assumed_quota or args.quota, tpm=0, period=args.period)
+    return model
+
+async def burst(args, admitted, label, assumed_quota=None):
+    model = setup(args, assumed_quota)
+    call = (lambda: llm_utils.generate_content(API_KEY, "hello", {})) if admitted else (lambda: model.models.generate_content(model="m", contents="hello", config={}))
+    latencies, errors = [], []
+    start = time.perf_counter()
+    await asyncio.gather(*(user_calls(user, args.calls, call, latencies, errors) for user in range(args.users)))
+    elapsed = time.perf_counter() - start
+    stats = llm_queue_stats.get("simulated", {})
+    print(f"{label:<16}{len(latencies):>5} ok {len(errors):>5} failed  in {elapsed:>5.1f} s  "
+          f"p50 {percentile(latencies, 0.5):>7.0f} ms  p95 {percentile(latencies, 0.95):>7.0f} ms  p99 {percentile(latencies, 0.99):>7.0f} ms  "
+          f"429s retried {stats.get('retries', 0)}  max queued {stats.get('max_queued', 0)}")
+
+async def fairness(args, fair):
+    setup(args)
+    call = lambda: llm_utils.generate_content(API_KEY, "hello", {})
+    heavy, light, errors = [], [], []
+
+    async def dailies_job():
+        llm_caller.set("heavy")
+        async def window():
+            start = time.perf_counter()
+            await call()
+            heavy.append(time.perf_counter() - start)
+        await asyncio.gather(*(window() for _ in range(args.heavy_calls)))
+
+    async def light_user(user):
+        await asyncio.sleep(0.1) # the generation is queued first
+        await user_calls(user if fair else "heavy", args.calls, call, light, errors)
+
+    await asyncio.gather(dailies_job(), *(light_user(user) for user in range(args.users // 4)))
+    print(f"{'fair' if fair else 'fifo':<16}light users p50 {percentile(light, 0.5):>7.0f} ms  p95 {percentile(light, 0.95):>7.0f} ms   "
+          f"dailies windows p50 {percentile(heavy, 0.5):>7.0f} ms  last {max(heavy) * 1000:>7.0f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--calls", type=int, default=4, help="chat turns per user")
+    parser.add_argument("--heavy-calls", type=int, default=60, help="window calls of the dailies generation in the fairness run")
+    parser.add_argument("--quota", type=int, default=40, help="requests per period the simulated key allows")
+    parser.add_argument("--period", type=float, default=5, help="seconds the quota refills over")
+    parser.add_argument("--latency", type=float, default=300, help="ms per model call")
+    args = parser.parse_args()
+    llm_scheduler.LLM_BACKOFF_BASE_SECONDS = 0.25 # the shortened period recovers in seconds, not a minute
+
+    print(f"burst: {args.users} users x {args.calls} calls, quota {args.quota} per {args.period:.0f}s")
+    asyncio.run(burst(args, False, "before"))
+    asyncio.run(burst(args, True, "after"))
+    asyncio.run(burst(args, True, "after, quota 2x", args.quota * 2)) # the 429s the configured quota does not prevent are retried
+    print(f"fairness: a {args.heavy_calls} window generation and {args.users // 4} users x {args.calls} calls")
+    for fair in (False, True):
+        asyncio.run(fairness(args, fair))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Tail latency of gemini calls with hedging, and fail fast behaviour of the per-key circuit breaker and the phase
+deadlines in utils.llm_scheduler.
+
+Gemini is replaced by a simulated model whose latency has a long tail: calls take --latency ms give or take 20%,
+and --slow-share of them --slow-factor times as long. The key's quota is left off. Scenarios:
+  hedging - --users users each make --calls calls one after another. Without hedging, then with hedges sent once a
+            call is slower than the p95 of the calls before it, at most --hedge-rate of the calls
+  outage  - the model stops answering for --outage seconds, its calls hang until cut by a --deadline second deadline.
+            Calls made during the outage with the breaker off, then on: how long they took to fail,
+            and how many reached the model
+
+Run from backend/:
+    python -m benchmarks.llm_tail --users 20 --calls 30 --latency 200 --slow-share 0.05 --slow-factor 10
+"""
+import argparse, asyncio, random, time
+
+from google.genai.types import GenerateContentResponse
+
+from utils import llm_utils, llm_scheduler
+from utils.llm_scheduler import KeyScheduler, llm_caller, llm_queue_stats
+
+API_KEY = "simulated-key"
+PHASE = "define_goal"
+
+class SlowTailGemini:
+    """models.generate_content of a genai AsyncClient with a long tail, or hanging while down"""
+    def __init__(self, latency, slow_share, slow_factor):
+        self.latency = latency
+        self.slow_share = slow_share
+        self.slow_factor = slow_factor
+        self.down = False
+        self.calls = 0
+        self.models = self
+
+    async def generate_content(self, model, contents, config):
+        self.calls += 1
+        if self.down:
+            await asyncio.Event().wait() # never answers
+        latency = self.latency * random.uniform(0.8, 1.2)
+        if random.random() < self.slow_share:
+            latency *= self.slow_factor
+        await asyncio.sleep(latency)
+        return GenerateContentResponse()
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)] * 1000 if values else float("nan")
+
+def setup(args):
+    model = SlowTailGemini(args.latency / 1000, args.slow_share, args.slow_factor)
+    llm_utils.get_llm_models = lambda api_key: model
+    llm_queue_stats.clear()
+    llm_scheduler._latencies.clear()
+    llm_scheduler._schedulers[API_KEY] = KeyScheduler("simulated", rpm=0, tpm=0)
+    return model
+
+async def timed_calls(user, calls, latencies, errors, pause=0.0):
+    llm_caller.set(user)
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            await llm_utils.generate_content(API_KEY, "hello", {}, phase_tag=PHASE)
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(time.perf_counter() - start)
+        await asyncio.sleep(pause)
+
+async def hedging(args, hedge_rate, label):
+    setup(args)
+    llm_scheduler.LLM_HEDGE_MAX_RATE = hedge_rate
+    latencies, errors = [], []
+    await asyncio.gather(*(timed_calls(user, args.calls, latencies, errors) for user in range(args.users)))
+    stats = llm_queue_stats["simulated"]
+    print(f"{label:<14}{len(latencies):>5} ok {len(errors):>3} failed  p50 {percentile(latencies, 0.5):>6.0f} ms  "
+          f"p95 {percentile(latencies, 0.95):>6.0f} ms  p99 {percentile(latencies, 0.99):>6.0f} ms  max {max(latencies) * 1000:>6.0f} ms  "
+          f"hedges {stats['hedges']} ({stats['hedges'] / max(len(latencies), 1) * 100:.1f}%), {stats['hedge_wins']} won")
+
+async def outage(args, breaker, label):
+    model = setup(args)
+    llm_scheduler.LLM_HEDGE_MAX_RATE = 0
+    llm_scheduler.LLM_BREAKER_FAILURES = 5 if breaker else 10**9
+    model.down = True
+    failed, answered = [], []
+    stop_at = time.perf_counter() + args.outage
+
+    async def user(index):
+        llm_caller.set(index)
+        while time.perf_counter() < stop_at:
+            await timed_calls(index, 1, answered, failed, pause=0.05)
+
+    await asyncio.gather(*(user(index) for index in range(args.users)))
+    stats = llm_queue_stats["simulated"]
+    print(f"{label:<14}{len(failed):>5} calls failed  p50 {percentile(failed, 0.5):>7.0f} ms  p95 {percentile(failed, 0.95):>7.0f} ms   "
+          f"{model.calls} reached the model, {stats['deadline_exceeded']} missed the deadline, {stats['breaker_rejected']} refused")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--calls", type=int, default=30, help="calls per user in the hedging run")
+    parser.add_argument("--latency", type=float, default=200, help="ms per model call")
+    parser.add_argument("--slow-share", type=float, default=0.05, help="share of calls in the tail")
+    parser.add_argument("--slow-factor", type=float, default=10, help="how many times slower a call in the tail is")
+    parser.add_argument("--hedge-rate", type=float, default=0.1, help="LLM_HEDGE_MAX_RATE of the hedged run")
+    parser.add_argument("--outage", type=float, default=10, help="seconds the model hangs in the outage run")
+    parser.add_argument("--deadline", type=float, default=5, help="deadline of each call in seconds")
+    args = parser.parse_args()
+    llm_scheduler.LLM_DEADLINE_SECONDS = {PHASE: args.deadline}
+    llm_scheduler.LLM_HEDGE_MIN_SECONDS = 0 # simulated calls are much faster than the real ones
+    llm_scheduler.LLM_BREAKER_COOLDOWN_SECONDS = args.outage # the circuit stays open for the whole outage once it opens
+
+    print(f"hedging: {args.users} users x {args.calls} calls, {args.slow_share:.0%} of them {args.slow_factor:.0f}x slower")
+    asyncio.run(hedging(args, 0, "no hedging"))
+    asyncio.run(hedging(args, args.hedge_rate, "hedged"))
+    print(f"outage: the model hangs for {args.outage:.0f}s, calls are cut at {args.deadline:.0f}s")
+    asyncio.run(outage(args, False, "no breaker"))
+    asyncio.run(outage(args, True, "breaker"))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+CPU time the creation pipeline spends per request outside the network: building the system
+instruction and contents of a chat turn, and validating the structured reply.
+
+"before" repeats what every request used to do (model_json_schema() and str.format of the whole
+template, a new TypeAdapter per parse), "after" goes through build_llm_request and parse_response_text,
+which use the prebuilt prompt registry. The chat history read is replaced by a fixed history so that
+only CPU work is timed.
+
+Run from backend/:
+    python -m benchmarks.prompt_overhead --iterations 2000
+"""
+import argparse, datetime, json, time
+from types import SimpleNamespace
+
+from pydantic import TypeAdapter
+from google.genai.types import Content, Part
+
+from schemas import FollowUp, DefinitionsCreate, GoalPrerequisites, PhaseGeneration, DailiesGeneration
+from utils import llm_utils
+from utils.instruction_chain import BASE_INSTRUCTION, PHASE_INSTRUCTIONS
+
+GOAL = json.dumps({"status": "definitions_extracted", "title": "Run a marathon", "metric": "Finish under 4 hours", "purpose": "Health", "deadline": "2027-06-01"})
+PREREQ = json.dumps({"status": "prerequisites_extracted", "related_experience": ["5k runs"], "time_commitment_per_week_hours": 6, "blocked_time_blocks": ["Weekdays 9am-5pm"],
+                     "budget": 200.0, "required_resources": ["Running shoes"], "possible_gap_assessment": ["Endurance"]})
+REPLIES = {
+    "define_goal": GOAL,
+    "get_prerequisites": PREREQ,
+    "generate_phases": json.dumps({"status": "phases_generated", "phases": [
+        {"title": f"Phase {i}", "description": "Build up weekly distance", "start_date": f"2027-0{i}-01", "end_date": f"2027-0{i}-28"} for i in range(1, 6)]}),
+}
+HISTORY = [Content(role="user" if i % 2 == 0 else "model", parts=[Part.from_text(text=f"turn {i}")]) for i in range(6)]
+
+def before(session, reply):
+    format_args = {"goal_context": session.goal_obj, "prereq_context": session.prereq_obj,
+                   "followUp": FollowUp.model_json_schema(), "definitionsCreate": DefinitionsCreate.model_json_schema(),
+                   "goalPrerequisites": GoalPrerequisites.model_json_schema(), "phaseGeneration": PhaseGeneration.model_json_schema()}
+    instruction = BASE_INSTRUCTION.format(current_date_str=datetime.date.today().strftime('%Y-%m-%d')) + PHASE_INSTRUCTIONS[session.phase_tag].format(**format_args)
+    contents = list(HISTORY) + [Content(parts=[Part.from_text(text="hello")], role="user")]
+    models = TypeAdapter(FollowUp | DefinitionsCreate | GoalPrerequisites | PhaseGeneration | DailiesGeneration)
+    return instruction, contents, models.validate_python(json.loads(reply))
+
+def after(session, reply):
+    _, contents, config = llm_utils.build_llm_request(session, "hello", None)
+    return config["system_instruction"], contents, llm_utils.parse_response_text(reply)
+
+def cpu_us_per_request(fn, session, reply, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        fn(session, reply)
+    return (time.process_time() - start) / iterations * 1e6
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    llm_utils.get_chat_history = lambda session, db: list(HISTORY)
+
+    print(f"{'phase':<20}{'before us/req':>15}{'after us/req':>14}{'speedup':>9}")
+    for phase_tag, reply in REPLIES.items():
+        session = SimpleNamespace(phase_tag=phase_tag, goal_obj=GOAL, prereq_obj=PREREQ)
+        assert before(session, reply)[0] == after(session, reply)[0] # same prompt text either way
+        before_us = cpu_us_per_request(before, session, reply, args.iterations)
+        after_us = cpu_us_per_request(after, session, reply, args.iterations)
+        print(f"{phase_tag:<20}{before_us:>15.1f}{after_us:>14.1f}{before_us/after_us:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+"""
+Fills users, goals, phases and dailies with synthetic accounts shaped like real ones, from 1k to 10M dailies, for
+load tests against a production sized database (see benchmarks.dashboard_suite).
+
+Every user gets a Poisson number of ongoing (--ongoing-goals) and completed (--completed-goals) goals. A plan
+lasts a log-normal number of days around --plan-days, split into phases of about a month, with one to a few tasks
+a day (--tasks-per-day). Ongoing goals are somewhere between their start and their deadline, completed ones ended
+in the past year with every task done. Each user completes a share of their past tasks drawn from a beta
+distribution around --completion, and falls behind lately: in the last --backlog-days days another
+--backlog-share of the tasks is left open, which makes up the overdue backlog. Users are generated until there
+are --dailies tasks, or exactly --users users if given. The same --seed gives the same data.
+
+Rows are written with COPY in batches, in one transaction. Ids of users, goals and phases are reserved from
+their sequences first, so the batches need no RETURNING. The users are marked by EMAIL_DOMAIN and can all log
+in with --password. Needs an upgraded database in DATABASE_URL.
+
+Run from backend/:
+    python -m benchmarks.seed_data --dailies 1000000
+    python -m benchmarks.seed_data --clean              # deletes every seeded user and their rows
+"""
+import argparse, datetime, io, math, random, time
+
+from sqlalchemy import text
+
+from db import SessionLocal
+from utils.auth import hash_password
+
+EMAIL_DOMAIN = "@seed.example.com" # marks the seeded users
+BATCH_DAILIES = 200_000 # dailies buffered before a batch is copied
+ID_BLOCK = 10_000 # ids reserved from a sequence at a time
+NULL = r"\N" # COPY text format
+START_TIMES = [f"{hour:02}:{minute:02}:00" for hour in range(7, 21) for minute in (0, 15, 30, 45)]
+DURATIONS = (15, 30, 45, 60, 90) # estimated minutes of a task
+
+GOALS = [ # (title, metric, purpose, task descriptions)
+    ("Run a half marathon", "Finish 21.1 km under 2 hours", "Health", ["Easy 5k run", "Interval training", "Long run", "Stretching and mobility", "Strength training"]),
+    ("Learn Spanish", "Pass the B2 exam", "Travel", ["Vocabulary flashcards", "Grammar exercises", "Listen to a podcast", "Conversation practice", "Read a short story"]),
+    ("Get a cloud certification", "Pass the associate exam", "Career", ["Watch a course module", "Hands-on lab", "Practice questions", "Review notes"]),
+    ("Write a novel", "A finished 60k word draft", "Creativity", ["Write 1000 words", "Outline a chapter", "Edit yesterday's pages", "Character notes"]),
+    ("Learn the piano", "Play a full Chopin nocturne", "Hobby", ["Scales and arpeggios", "Sight reading", "Practice the piece", "Music theory lesson"]),
+    ("Save for a house", "A 20k deposit", "Finance", ["Track expenses", "Review the budget", "Compare savings accounts", "Sell unused items"]),
+]
+
+class IdBlock:
+    """Hands out ids reserved from a table's sequence ID_BLOCK at a time"""
+    def __init__(self, db, table):
+        self.db = db
+        self.sequence = db.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+        self.ids = []
+
+    def next(self) -> int:
+        if not self.ids:
+            self.ids = self.db.execute(text("SELECT nextval(:sequence) FROM generate_series(1, :n)"),
+                                       {"sequence": self.sequence, "n": ID_BLOCK}).scalars().all()[::-1]
+        return self.ids.pop()
+
+def poisson(rng, mean) -> int:
+    limit, k, p = math.exp(-mean), 0, rng.random()
+    while p > limit:
+        k += 1
+        p *= rng.random()
+    return k
+
+def copy(db, table, columns, buffer: io.StringIO):
+    if buffer.tell():
+        buffer.seek(0)
+        db.connection().connection.cursor().copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buffer)
+    buffer.seek(0)
+    buffer.truncate()
+
+class Seeder:
+    TABLES = { # COPY columns, in foreign key order
+        "users": ("id", "username", "email", "hashed_password"),
+        "goals": ("id", "title", "metric", "purpose", "deadline", "is_completed", "owner_id", "time_commitment_per_week_hours"),
+        "phases": ("id", "title", "description", "start_date", "estimated_end_date", "is_completed", "goal_id"),
+        "dailies": ("task_description", "dailies_date", "start_time", "estimated_time_minutes", "is_completed", "completed_date", "phase_id", "goal_id", "owner_id"),
+    }
+
+    def __init__(self, db, args):
+        self.db = db
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.today = datetime.date.today()
+        self.hashed_password = hash_password(args.password)
+        self.ids = {table: IdBlock(db, table) for table in ("users", "goals", "phases")}
+        self.buffers = {table: io.StringIO() for table in self.TABLES}
+        self.counts = dict.fromkeys(self.TABLES, 0)
+        self.copied_dailies = 0
+
+    def flush(self):
+        for table, columns in self.TABLES.items():
+            copy(self.db, table, columns, self.buffers[table])
+        self.copied_dailies = self.counts["dailies"]
+
+    def add(self, table, *values):
+        self.buffers[table].write("\t".join(NULL if value is None else str(value) for value in values) + "\n")
+        self.counts[table] += 1
+
+    def user(self):
+        user_id = self.ids["users"].next()
+        self.add("users", user_id, f"seed{user_id}", f"seed{user_id}{EMAIL_DOMAIN}", self.hashed_password)
+        args, rng = self.args, self.rng
+        # share of past tasks this user completes, beta distributed around --completion
+        concentration = 8
+        completion = rng.betavariate(max(args.completion * concentration, 0.01), max((1 - args.completion) * concentration, 0.01))
+        for completed in [False] * poisson(rng, args.ongoing_goals) + [True] * poisson(rng, args.completed_goals):
+            self.goal(user_id, completed, completion)
+        if self.counts["dailies"] - self.copied_dailies >= BATCH_DAILIES: # a user's rows always go in the same batch
+            self.flush()
+
+    def goal(self, user_id, completed, completion):
+        args, rng = self.args, self.rng
+        plan_days = min(max(round(rng.lognormvariate(math.log(args.plan_days), 0.5)), 7), 730)
+        if completed:
+            start = self.today - datetime.timedelta(days=rng.randint(1, 365) + plan_days)
+        else:
+            start = self.today - datetime.timedelta(days=rng.randrange(plan_days)) # how far into the plan the user is
+        deadline = start + datetime.timedelta(days=plan_days - 1)
+        title, metric, purpose, tasks = rng.choice(GOALS)
+        tasks_per_day = max(1, poisson(rng, args.tasks_per_day))
+        goal_id = self.ids["goals"].next()
+        self.add("goals", goal_id, title, metric, purpose, deadline, completed, user_id, tasks_per_day * 5)
+
+        phases = max(1, round(plan_days / 30))
+        for n in range(phases):
+            phase_id = self.ids["phases"].next()
+            phase_start = start + datetime.timedelta(days=plan_days * n // phases)
+            phase_end = start + datetime.timedelta(days=plan_days * (n + 1) // phases - 1)
+            phase_done = True
+            dailies = self.buffers["dailies"]
+            day = phase_start
+            while day <= phase_end:
+                days_ago = (self.today - day).days
+                if completed:
+                    done = True
+                elif days_ago > args.backlog_days:
+                    done = rng.random() < completion
+                elif days_ago > 0:
+                    done = rng.random() < completion * (1 - args.backlog_share)
+                elif days_ago == 0: # part of today's tasks are done already
+                    done = rng.random() < completion / 2
+                else:
+                    done = False
+                for task in range(tasks_per_day):
+                    # a busy day's extra tasks are skipped more often, unless the whole goal is done
+                    task_done = done if task == 0 or completed else done and rng.random() < 0.9
+                    completed_date = min(day + datetime.timedelta(days=poisson(rng, 0.3)), self.today) if task_done else None
+                    # written directly rather than through add(), this loop makes nearly every row
+                    dailies.write(f"{rng.choice(tasks)}\t{day}\t{rng.choice(START_TIMES)}\t{rng.choice(DURATIONS)}\t{task_done}\t"
+                                  f"{completed_date or NULL}\t{phase_id}\t{goal_id}\t{user_id}\n")
+                    phase_done = phase_done and task_done
+                day += datetime.timedelta(days=1)
+            self.counts["dailies"] += tasks_per_day * ((phase_end - phase_start).days + 1)
+            self.add("phases", phase_id, f"Phase {n + 1}", f"Part {n + 1} of {phases} of the plan", phase_start, phase_end, phase_done, goal_id)
+
+def seed(db, args) -> dict:
+    """Inserts the synthetic users and their rows, returns the rows added per table"""
+    seeder = Seeder(db, args)
+    while (seeder.counts["users"] < args.users) if args.users else (seeder.counts["dailies"] < args.dailies):
+        seeder.user()
+        if seeder.counts["users"] % 1000 == 0:
+            print(f"\r{seeder.counts['dailies']} dailies", end="", flush=True)
+    seeder.flush()
+    db.commit()
+    print("\r" + " " * 30 + "\r", end="")
+    return seeder.counts
+
+def cleanup(db):
+    owners = "SELECT id FROM users WHERE email LIKE '%' || :domain"
+    params = {"domain": EMAIL_DOMAIN}
+    db.execute(text(f"DELETE FROM dailies WHERE owner_id IN ({owners})"), params)
+    db.execute(text(f"DELETE FROM phases WHERE goal_id IN (SELECT id FROM goals WHERE owner_id IN ({owners}))"), params)
+    db.execute(text(f"DELETE FROM goals WHERE owner_id IN ({owners})"), params)
+    db.execute(text("DELETE FROM users WHERE email LIKE '%' || :domain"), params)
+    db.commit()
+
+def seeded_users(db) -> int:
+    return db.execute(text("SELECT count(*) FROM users WHERE email LIKE '%' || :domain"), {"domain": EMAIL_DOMAIN}).scalar()
+
+def vacuum(db): # fresh statistics and visibility map, as after autovacuum
+    with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+        connection.execute(text("VACUUM ANALYZE users, goals, phases, dailies"))
+
+def add_arguments(parser):
+    parser.add_argument("--dailies", type=int, default=100_000, help="dailies to generate, users are added until there are this many")
+    parser.add_argument("--users", type=int, default=None, help="generate exactly this many users instead")
+    parser.add_argument("--ongoing-goals", type=float, default=1.5, help="mean ongoing goals per user")
+    parser.add_argument("--completed-goals", type=float, default=1.0, help="mean completed goals per user")
+    parser.add_argument("--plan-days", type=int, default=90, help="median plan length in days")
+    parser.add_argument("--tasks-per-day", type=float, default=2, help="mean tasks a day of a plan")
+    parser.add_argument("--completion", type=float, default=0.8, help="mean share of past tasks users complete")
+    parser.add_argument("--backlog-days", type=int, default=14, help="recent days in which users fall behind")
+    parser.add_argument("--backlog-share", type=float, default=0.4, help="share of the recent tasks left open on top of the usual ones")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--password", default="seed-password", help="password of every seeded user")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--clean", action="store_true", help="delete the seeded users and their rows instead")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.clean:
+            cleanup(db)
+            return
+        if seeded_users(db):
+            print(f"adding to the {seeded_users(db)} seeded users already in the database, --clean deletes them")
+        start = time.perf_counter()
+        counts = seed(db, args)
+        print(f"seeded {', '.join(f'{n} {table}' for table, n in counts.items())} in {time.perf_counter() - start:.1f} s")
+        vacuum(db)
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -1 +1 @@
-from .session import SessionLocal, Base, get_db
\ No newline at end of file
+from .session import SessionLocal, Base, get_db, AsyncSessionLocal, get_async_db, commit_stats, on_commit
@@ -1 +1 @@
-from models import User, Goal, Phase, Daily, ChatSession
+from models import User, Goal, Phase, Daily, ChatSession, ChatMessage, GenerationJob, GroundingCache, LLMResponseCache
@@ -1,22 +1,53 @@
-from fastapi import FastAPI
+import math
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from db.session import Base, engine
+from fastapi.responses import JSONResponse
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from db.session import Base, engine, async_engine
 from routers import creation, auth, dashboard, goals
+from utils import (LLM_API_KEYS, init_llm_clients, close_llm_clients, start_job_workers, stop_job_workers, init_hash_pool, close_hash_pool, LLMOverloadedError,
+                   MetricsMiddleware, init_sql_profiler, SQLProfilerMiddleware, SQL_PROFILE_HEADER)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    init_llm_clients(LLM_API_KEYS)
+    init_hash_pool()
+    init_sql_profiler()
+    await start_job_workers()
+    yield
+    await stop_job_workers()
+    close_hash_pool()
+    await close_llm_clients()
+    await async_engine.dispose()
 
-app = FastAPI(title="Goal Tracker API")
+app = FastAPI(title="Goal Tracker API", lifespan=lifespan)
 app.include_router(creation.router)
 app.include_router(auth.router)
 app.include_router(dashboard.router)
 app.include_router(goals.router)
 
+app.add_middleware(SQLProfilerMiddleware) # statements per request, off unless SQL_PROFILER is set
+app.add_middleware(MetricsMiddleware) # request latency per route, served on /metrics
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "https://jumpstarter-five.vercel.app"],  # frontend address
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", SQL_PROFILE_HEADER], # ETag is read by the frontend for If-None-Match
 )
 
+@app.exception_handler(LLMOverloadedError)
+async def llm_overloaded(request: Request, exc: LLMOverloadedError): # gemini quota still exhausted after the retries, or a key's circuit open, or a missed deadline. the client can try again later
+    return JSONResponse(status_code=503, content={"detail": "The planner is busy, please try again shortly"},
+                        headers={"Retry-After": str(math.ceil(exc.retry_after))})
+
 @app.get("/")
 def root():
     return {"message": "Goal Tracker API is running!"}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics(): # prometheus scrape: request, gemini, grounding and db pool timings, see utils/metrics.py
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
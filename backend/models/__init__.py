@@ -1,3 +1,5 @@
 from .goal import Goal, Phase, Daily
 from .user import User
-from .session import ChatSession
\ No newline at end of file
+from .session import ChatSession, ChatMessage
+from .job import GenerationJob
+from .cache import GroundingCache, LLMResponseCache
\ No newline at end of file
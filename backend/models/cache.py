@@ -0,0 +1,24 @@
+from sqlalchemy import Column, String, DateTime, Integer, Float, func
+from sqlalchemy.dialects.postgresql import JSON
+from db.session import Base
+
+class GroundingCache(Base):
+    __tablename__ = "grounding_cache"
+    key = Column(String(64), primary_key=True) # sha256 of goal, prereqs, phase title and search instruction version
+    resource_links = Column(JSON, nullable=False) # {chunk index: uri}
+    reference_text_map = Column(JSON, nullable=False) # [[chunk indices], text], json has no tuple keys
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class LLMResponseCache(Base):
+    __tablename__ = "llm_response_cache"
+    key = Column(String(64), primary_key=True) # sha256 of model, system instruction, contents and response schema
+    phase_tag = Column(String, nullable=False) # pipeline step the response was cached for, see LLM_CACHE_PHASES
+    response = Column(JSON, nullable=False) # GenerateContentResponse.model_dump(mode="json")
+    latency_ms = Column(Float, nullable=False) # how long the model took, what every hit saves
+    hits = Column(Integer, nullable=False, server_default="0")
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    last_hit_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=True) # least recently used go first once the table is full
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, ForeignKey, Date, Boolean, Float, Time
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, Date, Boolean, Float, Time, Index
 from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from db.session import Base
@@ -51,3 +51,13 @@ class Daily(Base):
     
     phase_id = Column(Integer, ForeignKey("phases.id"), nullable=False, index=True) 
     phase = relationship("Phase", back_populates="dailies")
+
+    # copies of phase.goal_id and phase.goal.owner_id, set when the daily is inserted, so dashboard queries filter dailies without joining up to goals
+    goal_id = Column(Integer, ForeignKey("goals.id"), nullable=False)
+    owner_id = Column(Integer, ForeignKey("users.id"))
+
+    __table_args__ = (
+        Index("ix_dailies_owner_id_is_completed_dailies_date", "owner_id", "is_completed", "dailies_date"), # open tasks up to a date
+        Index("ix_dailies_owner_id_completed_date", "owner_id", "completed_date"), # tasks completed on a date
+        Index("ix_dailies_owner_id_goal_id_is_completed_dailies_date", "owner_id", "goal_id", "is_completed", "dailies_date"), # a goal's dailies, and progress per goal from the index alone
+    )
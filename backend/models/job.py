@@ -0,0 +1,29 @@
+from sqlalchemy import Column, Integer, String, Text, ForeignKey, DateTime, CheckConstraint, Index, func
+from sqlalchemy.dialects.postgresql import JSON
+from db.session import Base
+
+job_status_list = ["queued", "running", "completed", "failed", "cancelled"] # cancelled: superseded by a job for another phase of the session
+
+class GenerationJob(Base):
+    __tablename__ = "generation_jobs"
+    id = Column(String, primary_key=True, index=True) # uuid hex, handed to the client to poll with
+    status = Column(String, default="queued", nullable=False)
+    phase_index = Column(Integer, nullable=False) # index into the session's phases_obj of the phase being generated
+    windows_total = Column(Integer, default=0, nullable=False)
+    windows_done = Column(Integer, default=0, nullable=False)
+
+    window_results = Column(JSON, nullable=True, default=None) # {window index: [DailyCreate json]}, finished windows are skipped when a job is resumed
+    result_obj = Column(JSON, nullable=True, default=None) # DailiesPost json, partial until the job completes
+    error = Column(Text, nullable=True)
+    claim_token = Column(String, nullable=True) # of the worker running the job, its writes to the job only apply while it still holds the claim
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id"), nullable=False, index=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=False)
+
+    __table_args__ = (
+        CheckConstraint(status.in_(job_status_list), name="check_job_status"),
+        Index("ix_generation_jobs_session_id_active", "session_id", unique=True, postgresql_where=status.in_(["queued", "running"])), # one generation at a time per session
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, LargeBinary, String, CheckConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, CheckConstraint, Index
 from sqlalchemy.dialects.postgresql import JSON
 from sqlalchemy.orm import relationship
 from db.session import Base
@@ -8,8 +8,9 @@ phase_tag_list =  ["define_goal", "get_prerequisites", "generate_phases", "refin
 class ChatSession(Base):
     __tablename__ = "sessions"
     id = Column(Integer, primary_key=True, index=True)
-    session_data = Column(LargeBinary, nullable=False) # pickled chat object
     phase_tag = Column(String, default="define_goal", nullable=False)
+    message_count = Column(Integer, default=0, server_default="0", nullable=False) # seq of the next chat message
+    history_start = Column(Integer, default=0, server_default="0", nullable=False) # messages before this seq were cleared from the chat history
     
     goal_obj = Column(JSON, nullable=True, default=None) # note on json: has to be python dict, if not, need to store as string
     prereq_obj = Column(JSON, nullable=True, default=None)
@@ -21,3 +22,15 @@ class ChatSession(Base):
     __table_args__ = (
         CheckConstraint(phase_tag.in_(phase_tag_list), name="check_phase_tag"),
     )
+
+class ChatMessage(Base):
+    __tablename__ = "chat_messages"
+    id = Column(Integer, primary_key=True, index=True)
+    session_id = Column(Integer, ForeignKey("sessions.id", ondelete="CASCADE"), nullable=False)
+    seq = Column(Integer, nullable=False) # position of the turn in the session's chat history
+    role = Column(String, nullable=False) # "user" or "model"
+    content = Column(JSON, nullable=False) # google.genai Content dumped as json
+
+    __table_args__ = (
+        Index("ix_chat_messages_session_id_seq", "session_id", "seq", unique=True),
+    )
@@ -8,6 +8,7 @@ class User(Base):
     username = Column(String, nullable=False)
     email = Column(String, unique=True, index=True, nullable=False)
     hashed_password = Column(String, nullable=False)
+    data_version = Column(Integer, nullable=False, default=0, server_default="0") # bumped by every write to the user's goals, phases or dailies
 
     session_id = Column(Integer, ForeignKey("sessions.id"), index=True, nullable=True)
     session = relationship("ChatSession", back_populates="user")
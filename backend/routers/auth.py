@@ -1,33 +1,55 @@
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 import models, schemas
-from utils import hash_password, verify_password, create_access_token
+from utils import hash_password_async, verify_and_update_password_async, create_access_token, create_refresh_token, decode_token
 
 router = APIRouter(prefix="/auth", tags=["Auth"])
 
+# bcrypt is slow on purpose, so it runs in the hashing process pool instead of on the event loop
+
+def token_response(uid: int, username: str, auth_time: int | None = None): # auth_time of the token being refreshed, a login starts a new one
+    claims = {"uid": uid, "username": username}
+    return {"access_token": create_access_token(claims), "refresh_token": create_refresh_token(claims, auth_time), "token_type": "bearer"}
+
 @router.post("/signup")
-def signup(user: schemas.UserCreate, db: Session=Depends(get_db)):
-    if db.query(models.User).filter(models.User.email == user.email).first():
+async def signup(user: schemas.UserCreate, db: AsyncSession=Depends(get_async_db)):
+    if (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first():
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already registered")
     
     new_user = models.User(
         username=user.username,
         email=user.email,
-        hashed_password=hash_password(user.password),
+        hashed_password=await hash_password_async(user.password),
     )
     db.add(new_user)
-    db.flush()
-    db.commit()
-    db.refresh(new_user)
-    token = create_access_token({"uid": new_user.id, "username": user.username})
-    return {"access_token": token, "token_type": "bearer"}
+    await db.commit() # the id is assigned by the flush inside the commit, nothing else needs reloading
+    return token_response(new_user.id, user.username)
 
 @router.post("/login")
-def login(user: schemas.UserLogin, db: Session=Depends(get_db)):
-    db_user = db.query(models.User).filter(models.User.email == user.email).first()
-    if not db_user or not verify_password(user.password, db_user.hashed_password):
+async def login(user: schemas.UserLogin, db: AsyncSession=Depends(get_async_db)):
+    db_user = (await db.execute(select(models.User).where(models.User.email == user.email))).scalars().first()
+    if not db_user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
+    valid, new_hash = await verify_and_update_password_async(user.password, db_user.hashed_password)
+    if not valid:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid credentials")
     
-    token = create_access_token({"uid": db_user.id, "username": db_user.username})
-    return {"access_token": token, "token_type": "bearer"}
+    if new_hash: # stored with another BCRYPT_ROUNDS, the password is at hand so upgrade it now
+        db_user.hashed_password = new_hash
+        await db.commit()
+    return token_response(db_user.id, db_user.username)
+
+@router.post("/refresh")
+async def refresh(request: schemas.TokenRefresh, db: AsyncSession=Depends(get_async_db)):
+    """New access and refresh tokens for a valid refresh token, no password check. The new refresh token keeps the old one's
+    auth_time, so a session is renewed for at most SESSION_MAX_AGE_HOURS after the login before the password is asked again"""
+    claims = decode_token(request.refresh_token, token_type="refresh")
+    uid, auth_time = claims["uid"], claims.get("auth_time")
+    if auth_time is None: # issued before sessions had a maximum age
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Session expired")
+    username = (await db.execute(select(models.User.username).where(models.User.id == uid))).scalar()
+    if username is None: # deleted since the token was issued
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+    return token_response(uid, username, auth_time)
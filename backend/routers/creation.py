@@ -1,109 +1,169 @@
-import json
-
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from google.genai.types import Content, Part
 
 from utils import (get_current_user,
-                            insert_user, insert_goal, insert_phases, insert_dailies,
+                            finalize_goal,
                             insert_session, get_user_session, change_user_session,
-                            update_session_data, update_session_phase_tag, update_session_goal, update_session_prereq, update_session_phases, update_session_dailies,
+                            clear_session_chat_history, update_session_phase_tag, update_session_goal, update_session_prereq, update_session_phases, update_session_dailies,
                             get_model_latest_response, update_session_chat_history,
-                            get_llm_response, generate_dailies, parse_response
+                            get_llm_response, stream_llm_response, parse_response, parse_response_text,
+                            StreamingResponseParser, sse_event,
+                            get_generation_job, get_latest_generation_job, enqueue_dailies_job, retry_dailies_job, get_job_status
                             )
-from db import get_db
+from db import get_async_db
 
 from schemas import (FollowUp, APIResponse, APIRequest, ConfirmRequest,
                             DefinitionsCreate, 
                             GoalPrerequisites, 
                             PhaseGeneration,
                             DailiesGeneration, DailiesPost,
-                            GoalCompleted)
+                            GoalCompleted, DailiesJob, JobStatus)
 
 router = APIRouter(prefix="/create", tags=["Creation", "Goals"])
 
 @router.post("/reset", response_model=None)
-def load(user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    change_user_session(user_id, db)
+async def load(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    await change_user_session(user_id, db)
+    await db.commit()
     return None
 
 @router.post("/load", response_model=APIResponse)
-def load(user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    last_response = get_model_latest_response(user_id, db)
+async def load(user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    last_response = await get_model_latest_response(user_id, db)
+    await db.commit() # a user without a session just got one
     if last_response == None:
         default = FollowUp(status='follow_up_required', question_to_user="What would you like to achieve today?")
         return APIResponse(phase_tag="define_goal", ret_obj=default)
-    user_db_session = get_user_session(user_id, db)
+    user_db_session = await get_user_session(user_id, db)
     if user_db_session.phase_tag == "generate_dailies":
-        dailies_obj = DailiesPost.model_validate_json(user_db_session.dailies_obj)
-        return APIResponse(phase_tag="generate_dailies", ret_obj=dailies_obj)
+        job = await get_latest_generation_job(user_db_session.id, db)
+        if job and job.status in ("failed", "cancelled"): # retried on load, otherwise the session would be stuck without dailies to show
+            await retry_dailies_job(job, db)
+            await db.commit()
+        if job and job.status != "completed": # dailies being generated, client resumes polling
+            return APIResponse(phase_tag="generate_dailies", ret_obj=DailiesJob(job_id=job.id))
+        if user_db_session.dailies_obj:
+            dailies_obj = DailiesPost.model_validate_json(user_db_session.dailies_obj)
+            return APIResponse(phase_tag="generate_dailies", ret_obj=dailies_obj)
+        job = await enqueue_dailies_job(user_id, user_db_session, 0, db) # nothing generated nor generating, start with the first phase
+        await db.commit()
+        return APIResponse(phase_tag="generate_dailies", ret_obj=DailiesJob(job_id=job.id))
     return APIResponse(phase_tag=user_db_session.phase_tag, ret_obj=last_response)
 
+# the routes below are the unit of work: _query, _confirm and the db_utils helpers they call only stage changes,
+# and each request commits once at its end. a failed model call leaves nothing half written
+
 @router.post("/query", response_model=APIResponse)
-def query(request: APIRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def query(request: APIRequest, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    api_response = await _query(request, user_id, db)
+    await db.commit()
+    return api_response
+
+async def _query(request: APIRequest, user_id, db: AsyncSession, user_db_session=None) -> APIResponse: # user_db_session when the caller already loaded it
     user_input = request.user_input
-    user_db_session = get_user_session(user_id, db)
-    response_raw = get_llm_response(user_db_session, user_input, db)
+    user_db_session = user_db_session or await get_user_session(user_id, db)
+    response_raw = await get_llm_response(user_db_session, user_input, db)
     response_parsed = parse_response(response_raw)
-    update_session_chat_history(user_db_session, user_input, response_raw, db)
-    db.commit()
+    await update_session_chat_history(user_db_session, user_input, response_raw.candidates[0].content, db)
+    return await route_query_response(user_db_session, response_parsed, user_id, db)
+
+@router.post("/query/stream")
+async def query_stream(request: APIRequest, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Streaming variant of /query over server-sent events. Sends "question_delta" events with the growing question_to_user text
+    and a "phase" event per generated phase as soon as they can be parsed, then a "done" event with the same APIResponse /query returns
+    """
+    user_input = request.user_input
+    user_db_session = await get_user_session(user_id, db)
+
+    async def event_stream():
+        yield sse_event("start", {"phase_tag": user_db_session.phase_tag})
+        try:
+            parser = StreamingResponseParser()
+            async for chunk in stream_llm_response(user_db_session, user_input, db):
+                for event, data in parser.feed(chunk.text or ""):
+                    yield sse_event(event, data)
 
+            response_parsed = parse_response_text(parser.text)
+            model_content = Content(parts=[Part.from_text(text=parser.text)], role='model')
+            await update_session_chat_history(user_db_session, user_input, model_content, db)
+            api_response = await route_query_response(user_db_session, response_parsed, user_id, db)
+            await db.commit()
+            yield sse_event("done", api_response.model_dump(mode="json"))
+        except Exception as e:
+            print("error while streaming query response: ", e)
+            await db.rollback()
+            yield sse_event("error", {"detail": "Failed to generate a response"})
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+async def route_query_response(user_db_session, response_parsed, user_id, db: AsyncSession) -> APIResponse: # phase transitions that follow a model reply
     if isinstance(response_parsed, GoalPrerequisites): # auto transition
         confirm_request = ConfirmRequest(user_id=user_id, confirm_obj=response_parsed)
-        return confirm(confirm_request, user_id, db)
+        return await _confirm(confirm_request, user_id, db, user_db_session)
     
     elif isinstance(response_parsed, PhaseGeneration):
-        update_session_phase_tag(user_db_session, "refine_phases", db)
+        await update_session_phase_tag(user_db_session, "refine_phases", db)
     return APIResponse(phase_tag=user_db_session.phase_tag, ret_obj=response_parsed)
     
 @router.post("/confirm", response_model=APIResponse) # consider clearing the chat history
-def confirm(request: ConfirmRequest, user_id = Depends(get_current_user), db: Session = Depends(get_db)):
-    user_db_session = get_user_session(user_id, db)
+async def confirm(request: ConfirmRequest, user_id = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    api_response = await _confirm(request, user_id, db)
+    await db.commit()
+    return api_response
+
+async def _confirm(request: ConfirmRequest, user_id, db: AsyncSession, user_db_session=None) -> APIResponse:
+    user_db_session = user_db_session or await get_user_session(user_id, db)
     confirm_obj = request.confirm_obj
     if isinstance(confirm_obj, DefinitionsCreate):
-        update_session_goal(user_db_session, confirm_obj, db)
-        update_session_phase_tag(user_db_session, "get_prerequisites", db)
+        await update_session_goal(user_db_session, confirm_obj, db)
+        await update_session_phase_tag(user_db_session, "get_prerequisites", db)
         user_input=f'Based on your expertise on the subject, ask me questions about my current knowledge to help your planning for my goal.'
         query_request=APIRequest(user_input=user_input)
-        return query(query_request, user_id, db)
+        return await _query(query_request, user_id, db, user_db_session)
     elif isinstance(confirm_obj, GoalPrerequisites):
-        update_session_prereq(user_db_session, confirm_obj, db)
-        update_session_phase_tag(user_db_session, "refine_phases", db)
-        update_session_data(user_db_session, [], db) # clear chat history
+        await update_session_prereq(user_db_session, confirm_obj, db)
+        await update_session_phase_tag(user_db_session, "refine_phases", db)
+        await clear_session_chat_history(user_db_session, db)
         user_input=f'Generate the most suitable initial plan according to my goal, deadline and limitations.'
         query_request=APIRequest(user_input=user_input)
-        return query(query_request, user_id, db)
+        return await _query(query_request, user_id, db, user_db_session)
     elif isinstance(confirm_obj, PhaseGeneration): # and user_db_session.phase_tag != "refine_phases": forgot why i added this condition.
-        update_session_phases(user_db_session, confirm_obj, db)
-        update_session_phase_tag(user_db_session, "generate_dailies", db)
-
-        phase_titles = [p.title for p in confirm_obj.phases]
-        new_dailies = generate_dailies(user_db_session, confirm_obj.phases[0], db)
-        dailies_post_obj = DailiesPost(**(new_dailies.model_dump()), goal_phases=phase_titles, curr_phase=confirm_obj.phases[0].title)
-        update_session_dailies(user_db_session, dailies_post_obj, db)
-        return APIResponse(phase_tag="generate_dailies", ret_obj=dailies_post_obj)
+        await update_session_phases(user_db_session, confirm_obj, db)
+        await update_session_phase_tag(user_db_session, "generate_dailies", db)
+
+        job = await enqueue_dailies_job(user_id, user_db_session, 0, db) # generated in the background, poll /create/jobs/{job_id}
+        return APIResponse(phase_tag="generate_dailies", ret_obj=DailiesJob(job_id=job.id))
     elif isinstance(confirm_obj, DailiesPost):
-        update_session_dailies(user_db_session, confirm_obj, db)
+        await update_session_dailies(user_db_session, confirm_obj, db)
         curr_phase = confirm_obj.curr_phase
         phase_titles = confirm_obj.goal_phases
 
         if curr_phase == phase_titles[-1]: # last daily is from the final phase -- goal is completed
-            goal_json = json.loads(user_db_session.goal_obj)
-            prereq_json = json.loads(user_db_session.prereq_obj)
-            phases_json = json.loads(user_db_session.phases_obj)
-            goal_db = insert_goal(goal_json, prereq_json, user_id, db)
-            db_phases_list = insert_phases(phases_json, goal_db.id, db)
-            insert_dailies(confirm_obj, db_phases_list, db)
-            change_user_session(user_id, db)
-
-            return APIResponse(phase_tag="goal_completed", ret_obj=GoalCompleted(goal_title=goal_json['title'], goal_id=goal_db.id) )
+            try:
+                goal_db = await finalize_goal(user_db_session, confirm_obj, user_id, db) # committed with the rest of the request, a failure leaves no partial goal
+            except Exception:
+                raise HTTPException(status_code=500, detail="Unable to save the goal")
+            await change_user_session(user_id, db)
+
+            return APIResponse(phase_tag="goal_completed", ret_obj=GoalCompleted(goal_title=goal_db.title, goal_id=goal_db.id) )
             #return load(user_id, db)
         else: # transition to generating next phase's dailies
             next_phase = phase_titles.index(curr_phase)+1
             
             print(curr_phase, phase_titles[next_phase], phase_titles)
-            user_phases = PhaseGeneration.model_validate_json(user_db_session.phases_obj)
-            new_dailies = generate_dailies(user_db_session, user_phases.phases[next_phase], db)
+            job = await enqueue_dailies_job(user_id, user_db_session, next_phase, db)
+            return APIResponse(phase_tag="generate_dailies", ret_obj=DailiesJob(job_id=job.id))
 
-            next_dailies_post_obj = DailiesPost(**(new_dailies.model_dump()), goal_phases=phase_titles, curr_phase=phase_titles[next_phase])
-            update_session_dailies(user_db_session, next_dailies_post_obj, db)
-            return APIResponse(phase_tag="generate_dailies", ret_obj=next_dailies_post_obj)
+@router.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job(job_id: str, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    """
+    Progress of a background dailies generation. dailies holds the tasks generated so far,
+    and the full DailiesPost for the phase once status is completed
+    """
+    job = await get_generation_job(job_id, user_id, db)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return get_job_status(job)
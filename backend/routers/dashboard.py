@@ -1,210 +1,318 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy import func, case
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response, status
+from sqlalchemy import func, case, select, update, true
+from sqlalchemy.ext.asyncio import AsyncSession
 # from sqlalchemy.exc import SQLAlchemyError
-from db import get_db
+from db import get_async_db
 import models, schemas
-from utils import get_current_user
+from utils import get_current_user, keyset_page, split_page, date_bounds, conditional_read, bump_data_version
 from datetime import date
 
 router = APIRouter(prefix="/dashboard", tags=["Dashboard"])
 
+# the DailyRead fields, selected directly so task lists are validated from rows without loading Daily or Phase objects.
+# phase_title is a lookup per row: joining phases lets the planner hash the whole table
+DAILY_READ_COLUMNS = (
+    models.Daily.id,
+    models.Daily.task_description,
+    models.Daily.dailies_date,
+    models.Daily.start_time,
+    models.Daily.estimated_time_minutes,
+    models.Daily.is_completed,
+    models.Daily.phase_id,
+    select(models.Phase.title).where(models.Phase.id == models.Daily.phase_id).scalar_subquery().label("phase_title"),
+)
+
 @router.get("/stats")
-def get_stats(user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_stats(
+    response: Response,
+    from_date: date | None = Query(default=None, alias="from"),
+    limit: int | None = Query(default=None, ge=1, le=schemas.DAILIES_PAGE_MAX),
+    cursor: str | None = None,
+    if_none_match: str | None = Header(default=None),
+    user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db),
+):
     """Returns stats of top row cards (
         remaining tasks today,
         completed tasks today,
         goals in progress (ongoing goals),
         completed goals,
     ) and the tasks for the day.
+    The task list holds every open task up to today unless it is bounded by from, or paged with limit and cursor (next_cursor).
+    The counters always cover every task.
     """
     current_date = date.today()
-    goals = (
-        db.query(
-            func.sum(case((models.Goal.is_completed == False, 1)), else_=0).label("ongoing"),
-            func.sum(case((models.Goal.is_completed == True, 1)), else_=0).label("completed"),
+    async def build():
+        # one round trip: the counters are computed in CTEs and repeated on every task row,
+        # a LEFT JOIN keeps a single row of counters when there are no tasks
+        goal_counts = (
+            select(
+                func.coalesce(func.sum(case((models.Goal.is_completed == False, 1), else_=0)), 0).label("ongoing_goals"),
+                func.coalesce(func.sum(case((models.Goal.is_completed == True, 1), else_=0)), 0).label("completed_goals"),
+            )
+            .where(models.Goal.owner_id == user_id)
+            .cte("goal_counts")
         )
-        .filter(models.Goal.owner_id == user_id)
-        .first()
-    )
-    ongoing_goals = goals.ongoing if goals.ongoing != None else 0
-    completed_goals = goals.completed if goals.completed != None else 0
-    tasks_list = (
-        db.query(models.Daily)
-        .join(models.Daily.phase)
-        .join(models.Phase.goal)
-        .filter(
-            models.Goal.owner_id == user_id,
-            models.Daily.dailies_date <= current_date,
-            models.Daily.is_completed == False,
+        completed_today = (
+            select(func.count(models.Daily.id).label("completed_tasks_today"))
+            .where(
+                models.Daily.owner_id == user_id,
+                models.Daily.is_completed == True,
+                models.Daily.completed_date == current_date,
             )
-        .order_by(models.Daily.dailies_date)
-        .all()
-    )
-    tasks_list = [schemas.DailyRead.model_validate(task, from_attributes=True) for task in tasks_list]
-    completed_tasks_today = (
-        db.query(
-            func.sum(case((models.Daily.is_completed == True, 1), else_=0))
+            .cte("completed_today")
+        )
+        open_tasks = (
+            models.Daily.owner_id == user_id,
+            models.Daily.is_completed == False,
+            models.Daily.dailies_date <= current_date,
         )
-        .join(models.Daily.phase)
-        .join(models.Phase.goal)
-        .filter(
-            models.Goal.owner_id == user_id,
-            models.Daily.completed_date == current_date,
+        remaining_today = (
+            select(func.count(models.Daily.id).label("remaining_tasks_today"))
+            .where(*open_tasks)
+            .cte("remaining_today")
         )
-        .first()
-    )
-    remaining_tasks_today = len(tasks_list)
-    completed_tasks_today = completed_tasks_today[0] if completed_tasks_today != None and completed_tasks_today[0] != None else 0
-    return {
-        "remaining_tasks_today": remaining_tasks_today,
-        "completed_tasks_today": completed_tasks_today,
-        "ongoing_goals": ongoing_goals,
-        "completed_goals": completed_goals,
-        "tasks_today_list": tasks_list,
-    }
+        tasks = keyset_page(
+            select(*DAILY_READ_COLUMNS).where(*open_tasks),
+            models.Daily.dailies_date, models.Daily.id,
+            cursor=cursor, limit=limit, from_date=from_date,
+        ).cte("tasks")
+        rows = (await db.execute(
+            select(goal_counts, completed_today, remaining_today, tasks)
+            .select_from(goal_counts.join(completed_today, true()).join(remaining_today, true()).outerjoin(tasks, true()))
+            .order_by(tasks.c.dailies_date, tasks.c.id)
+        )).mappings().all()
+
+        counters = rows[0]
+        tasks_list, next_cursor = split_page([row for row in rows if row["id"] is not None], limit)
+        tasks_list = schemas.DailyReadList.validate_python(tasks_list)
+        return {
+            "remaining_tasks_today": counters["remaining_tasks_today"],
+            "completed_tasks_today": counters["completed_tasks_today"],
+            "ongoing_goals": counters["ongoing_goals"],
+            "completed_goals": counters["completed_goals"],
+            "tasks_today_list": tasks_list,
+            "next_cursor": next_cursor,
+        }
+
+    return await conditional_read("stats", {"date": current_date, "from": from_date, "limit": limit, "cursor": cursor},
+                            user_id, if_none_match, response, db, build)
 
 @router.post("/goal_progress", response_model=schemas.GoalProgressRead)
-def get_goal_progress(request: schemas.TitleRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_goal_progress(request: schemas.TitleRequest, response: Response, if_none_match: str | None = Header(default=None), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Returns stats for the dashboard goal progress card
     """
-    goals = (
-        db.query(
-            models.Goal.title,
-            models.Goal.deadline,
-            func.count(models.Daily.id).label("total_dailies"),
-            func.sum(case((models.Daily.is_completed == True, 1), else_=0)).label("completed_dailies")
+    async def build():
+        # counted per goal straight off the (owner_id, goal_id, is_completed, ...) index, then joined to the few goals
+        dailies_per_goal = (
+            select(
+                models.Daily.goal_id,
+                func.count(models.Daily.id).label("total_dailies"),
+                func.sum(case((models.Daily.is_completed == True, 1), else_=0)).label("completed_dailies")
+            )
+            .where(models.Daily.owner_id == user_id)
         )
-        .join(models.Daily.phase)
-        .join(models.Phase.goal)
-        .filter(
-            models.Goal.owner_id == user_id,
+        if request.goal_id != None:
+            dailies_per_goal = dailies_per_goal.where(models.Daily.goal_id == request.goal_id)
+        dailies_per_goal = dailies_per_goal.group_by(models.Daily.goal_id).subquery()
+
+        goals = (
+            select(
+                models.Goal.title,
+                models.Goal.deadline,
+                dailies_per_goal.c.total_dailies,
+                dailies_per_goal.c.completed_dailies,
+            )
+            .join(dailies_per_goal, dailies_per_goal.c.goal_id == models.Goal.id)
+            .where(
+                models.Goal.owner_id == user_id,
+            )
         )
-    )
-    if request.goal_id != None:
-        goals = goals.filter(models.Goal.id == request.goal_id)
-
-    else:
-        goals = goals.filter(models.Goal.is_completed == False)
-        
-    goals = goals.group_by(models.Goal.id).all()
-    for goal in goals:
-        if goal.completed_dailies == None:
-            goal.completed_dailies = 0
-    
-    return { "goals": goals }
+        if request.goal_id != None:
+            goals = goals.where(models.Goal.id == request.goal_id)
+
+        else:
+            goals = goals.where(models.Goal.is_completed == False)
+
+        goals = (await db.execute(goals)).all()
+        for goal in goals:
+            if goal.completed_dailies == None:
+                goal.completed_dailies = 0
+
+        return { "goals": goals }
+
+    return await conditional_read("goal_progress", {"goal_id": request.goal_id}, user_id, if_none_match, response, db, build)
 
 @router.post("/get_title")
-def get_title(request: schemas.TitleRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    title = (
-        db.query(models.Goal.title)
-        .filter(
-            models.Goal.id == request.goal_id,
-            models.Goal.owner_id == user_id,
-        )
-        .first()
-    )
-    if title != None:
-        title = title[0]
-        
-    return title
+async def get_title(request: schemas.TitleRequest, response: Response, if_none_match: str | None = Header(default=None), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        title = (await db.execute(
+            select(models.Goal.title)
+            .where(
+                models.Goal.id == request.goal_id,
+                models.Goal.owner_id == user_id,
+            )
+        )).first()
+        if title != None:
+            title = title[0]
+
+        return title
+
+    return await conditional_read("get_title", {"goal_id": request.goal_id}, user_id, if_none_match, response, db, build)
 
 @router.post("/get_phases", response_model = schemas.PhaseResponse)
-def get_phases(request: schemas.TitleRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
-    goal_phases = (
-        db.query(models.Phase.title)
-        .join(models.Phase.goal)
-        .filter(
-            models.Goal.owner_id == user_id,
-            models.Goal.id == request.goal_id,
-        )
-        .order_by(models.Phase.start_date)
-        .all()
-    )
-    goal_phases = [phase[0] for phase in goal_phases]
-    return schemas.PhaseResponse(goal_phases=goal_phases)
+async def get_phases(request: schemas.TitleRequest, response: Response, if_none_match: str | None = Header(default=None), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
+    async def build():
+        goal_phases = (await db.execute(
+            select(models.Phase.title)
+            .join(models.Phase.goal)
+            .where(
+                models.Goal.owner_id == user_id,
+                models.Goal.id == request.goal_id,
+            )
+            .order_by(models.Phase.start_date)
+        )).all()
+        goal_phases = [phase[0] for phase in goal_phases]
+        return schemas.PhaseResponse(goal_phases=goal_phases)
+
+    return await conditional_read("get_phases", {"goal_id": request.goal_id}, user_id, if_none_match, response, db, build)
 
 @router.post("/get_dailies", response_model = schemas.DailiesResponse)
-def get_dailies(request: schemas.DailiesRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_dailies(request: schemas.DailiesRequest, response: Response, if_none_match: str | None = Header(default=None), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Gets all completed or uncompleted dailies with a specified goal id
     If DailiesRequest.completed == True, gets completed dailies, and vice versa
+    Optionally bounded by from/to and paged with limit and cursor, see DailiesRequest
     """
-    dailies_list = (
-        db.query(models.Daily)
-        .join(models.Daily.phase)
-        .join(models.Phase.goal)
-        .filter(
-            models.Goal.owner_id == user_id,
-            models.Goal.id == request.goal_id,
+    async def build():
+        goal_dailies = (
+            models.Daily.owner_id == user_id,
+            models.Daily.goal_id == request.goal_id,
             models.Daily.is_completed == request.completed,
-            )
-        .order_by(models.Daily.dailies_date)
-        .all()
-    )
-    
-    dailies_list = schemas.DailiesResponse(
-        dailies=[schemas.DailyRead.model_validate(task, from_attributes=True) for task in dailies_list]
-    )
-    
-    return dailies_list
+        )
+        dailies_list = (await db.execute(keyset_page(
+            select(*DAILY_READ_COLUMNS).where(*goal_dailies),
+            models.Daily.dailies_date, models.Daily.id,
+            cursor=request.cursor, limit=request.limit, from_date=request.from_date, to_date=request.to_date,
+        ))).mappings().all()
+        dailies_list, next_cursor = split_page(dailies_list, request.limit)
+
+        total = None
+        if request.include_total: # index only count, separate so that pages stay cheap
+            total = (await db.execute(
+                select(func.count(models.Daily.id))
+                .where(*goal_dailies)
+                .where(*date_bounds(models.Daily.dailies_date, request.from_date, request.to_date))
+            )).scalar()
+
+        dailies_list = schemas.DailiesResponse(
+            dailies=schemas.DailyReadList.validate_python(dailies_list),
+            next_cursor=next_cursor,
+            total=total,
+        )
+
+        return dailies_list
+
+    return await conditional_read("get_dailies", request.model_dump(), user_id, if_none_match, response, db, build)
+
+@router.get("/calendar", response_model = schemas.DailiesResponse)
+async def get_calendar(
+    response: Response,
+    from_date: date = Query(alias="from"),
+    to_date: date = Query(alias="to"),
+    goal_id: int | None = None,
+    if_none_match: str | None = Header(default=None),
+    user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db),
+):
+    """
+    Gets the completed and uncompleted dailies dated from..to (inclusive), of one goal if goal_id is given or else of every goal.
+    Meant for calendars, which only fetch the range they show.
+    """
+    if to_date < from_date:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="to must not be before from")
+    async def build():
+        calendar_dailies = select(*DAILY_READ_COLUMNS).where(models.Daily.owner_id == user_id)
+        if goal_id is not None:
+            calendar_dailies = calendar_dailies.where(models.Daily.goal_id == goal_id)
+        dailies_list = (await db.execute(keyset_page(
+            calendar_dailies,
+            models.Daily.dailies_date, models.Daily.id,
+            from_date=from_date, to_date=to_date,
+        ))).mappings().all()
+        return schemas.DailiesResponse(dailies=schemas.DailyReadList.validate_python(dailies_list))
+
+    return await conditional_read("calendar", {"from": from_date, "to": to_date, "goal_id": goal_id}, user_id, if_none_match, response, db, build)
 
 @router.patch("/mark_complete")
-def mark_complete(update_req: schemas.UpdateRequest, user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def mark_complete(update_req: schemas.UpdateRequest, user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     """
     Marks selected dailies as complete or incomplete. If UpdateRequest.completed == True, marks as complete and vice versa
+    Dailies are selected by ids, or by phase_id / goal_id and optionally up_to (see UpdateRequest).
+    The completion of the affected phases and goals is recomputed in the same transaction.
     """
     current_date = date.today()
     try:
-        dailies = (
-            db.query(models.Goal, models.Daily)
-            .join(models.Daily.phase)
-            .join(models.Phase.goal)
-            .filter(
-                models.Daily.id.in_(update_req.ids),
-                models.Goal.owner_id == user_id,
+        mark_dailies = (
+            update(models.Daily)
+            .where(
+                models.Daily.owner_id == user_id,
                 models.Daily.is_completed == (not update_req.completed),
             )
-            .all()
+            .values(is_completed=update_req.completed, completed_date=current_date)
+            .returning(models.Daily.id, models.Daily.phase_id)
         )
-        if not dailies:
+        if update_req.ids is not None:
+            mark_dailies = mark_dailies.where(models.Daily.id.in_(update_req.ids))
+        if update_req.phase_id is not None:
+            mark_dailies = mark_dailies.where(models.Daily.phase_id == update_req.phase_id)
+        if update_req.goal_id is not None:
+            mark_dailies = mark_dailies.where(models.Daily.goal_id == update_req.goal_id)
+        if update_req.up_to is not None:
+            mark_dailies = mark_dailies.where(models.Daily.dailies_date <= update_req.up_to)
+        updated = (await db.execute(mark_dailies)).all()
+
+        if not updated:
             return {
                 "message": "No dailies found",
                 "updated": 0,
             }
-        goals_to_check = set[models.Goal]()
-        for goal, daily in dailies:
-            daily.is_completed = update_req.completed
-            daily.completed_date = current_date
-            goals_to_check.add(goal)
-            
-        db.commit()
-        print(f"Goals: {goals_to_check}")
-        for goal in goals_to_check:
-            uncompleted_goals = (
-                db.query(models.Daily)
-                .join(models.Daily.phase)
-                .join(models.Phase.goal)
-                .filter(
-                    models.Goal.owner_id == user_id,
-                    models.Goal.id == goal.id,
-                    models.Daily.is_completed == False,
-                )
-                .count()
-            )
-            
-            goal.is_completed = uncompleted_goals == 0
-        
-        db.commit()
-        
+
+        # one statement recomputes the affected phases and their goals. the goals are checked against the
+        # dailies rather than the phases, since the phase updates are not visible within the same statement
+        phase_ids = {row.phase_id for row in updated}
+        phase_state = (
+            select(models.Daily.phase_id, func.bool_and(models.Daily.is_completed).label("is_completed"))
+            .where(models.Daily.phase_id.in_(phase_ids))
+            .group_by(models.Daily.phase_id)
+            .cte("phase_state")
+        )
+        updated_phases = (
+            update(models.Phase)
+            .where(models.Phase.id == phase_state.c.phase_id)
+            .values(is_completed=phase_state.c.is_completed)
+            .returning(models.Phase.goal_id)
+            .cte("updated_phases")
+        )
+        open_dailies = (
+            select(models.Daily.id)
+            .where(models.Daily.owner_id == user_id, models.Daily.goal_id == models.Goal.id, models.Daily.is_completed == False)
+            .exists()
+        )
+        await db.execute(
+            update(models.Goal)
+            .where(models.Goal.id.in_(select(updated_phases.c.goal_id)))
+            .values(is_completed=~open_dailies)
+        )
+        await bump_data_version(user_id, db)
+        await db.commit()
+
         return {
             "message": "Dailies markead as completed",
-            "updated": len(dailies),
+            "updated": len(updated),
         }
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         print(e)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
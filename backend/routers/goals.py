@@ -1,17 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from db import get_db
+from fastapi import APIRouter, Depends, Header, HTTPException, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from db import get_async_db
 from models import Goal
-from utils import get_current_user
+from utils import get_current_user, conditional_read
 
 router = APIRouter(prefix="/goals", tags=["Goals"])
 
 @router.post("/titles")
-def get_stats(user_id: int = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_stats(response: Response, if_none_match: str | None = Header(default=None), user_id: int = Depends(get_current_user), db: AsyncSession = Depends(get_async_db)):
     # returns list of all user goals
-    goals = (
-        db.query(Goal.id, Goal.title)
-        .filter(Goal.owner_id == user_id)
-        .all()
-    )
-    return [{"id": gid, "title": title} for gid, title in goals]
+    async def build():
+        goals = (await db.execute(
+            select(Goal.id, Goal.title)
+            .where(Goal.owner_id == user_id)
+        )).all()
+        return [{"id": gid, "title": title} for gid, title in goals]
+
+    return await conditional_read("titles", {}, user_id, if_none_match, response, db, build)
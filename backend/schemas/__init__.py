@@ -1,6 +1,6 @@
 """
 This is how the user will interact with the database
 """
-from .api import FollowUp, GoalCompleted, APIResponse, APIRequest, ConfirmRequest
-from .goal import DefinitionsBase, DefinitionsCreate, Definitions, GoalPrerequisites, PhaseGeneration, PhaseCreate, DailiesGeneration, DailiesPost, DailyRead, DailiesRequest, DailiesResponse, UpdateRequest, GoalProgressRead, TitleRequest, PhaseResponse
-from .user import User, UserCreate, UserBase, UserLogin
+from .api import FollowUp, GoalCompleted, DailiesJob, JobStatus, APIResponse, APIRequest, ConfirmRequest
+from .goal import DefinitionsBase, DefinitionsCreate, Definitions, GoalPrerequisites, PhaseGeneration, PhaseCreate, DailyCreate, DailiesGeneration, DailiesPost, DailyRead, DailyReadList, DAILIES_PAGE_MAX, DailiesRequest, DailiesResponse, UpdateRequest, GoalProgressRead, TitleRequest, PhaseResponse
+from .user import User, UserCreate, UserBase, UserLogin, TokenRefresh
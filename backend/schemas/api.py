@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Literal, Union
+from typing import Literal, Union, Optional
 from schemas.goal import DefinitionsCreate, GoalPrerequisites, PhaseGeneration, DailiesGeneration, DailiesPost
 
 # possibly add response models here
@@ -12,12 +12,25 @@ class GoalCompleted(BaseModel):
     goal_title: str
     goal_id: int
 
+class DailiesJob(BaseModel):
+    status: Literal['dailies_pending'] = 'dailies_pending'
+    job_id: str
+
 class APIResponse(BaseModel):
     phase_tag: Literal["define_goal", "get_prerequisites", "refine_phases", "generate_dailies", "goal_completed"]
-    ret_obj: Union[FollowUp , DefinitionsCreate , GoalPrerequisites , PhaseGeneration , DailiesPost, GoalCompleted]
+    ret_obj: Union[FollowUp , DefinitionsCreate , GoalPrerequisites , PhaseGeneration , DailiesPost, GoalCompleted, DailiesJob]
 
 class APIRequest(BaseModel):
     user_input: str
 
 class ConfirmRequest(BaseModel):
     confirm_obj: DefinitionsCreate | GoalPrerequisites | PhaseGeneration | DailiesPost # goal prereq only used by backend to transition
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: Literal["queued", "running", "completed", "failed", "cancelled"]
+    windows_done: int
+    windows_total: int
+    percent_done: float
+    dailies: Optional[DailiesPost] = None # partial until status is completed
+    error: Optional[str] = None
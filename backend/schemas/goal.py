@@ -1,4 +1,4 @@
-from pydantic import BaseModel, Field, model_validator
+from pydantic import BaseModel, Field, TypeAdapter, model_validator
 from typing import List, Literal, Any
 from datetime import date, time
     
@@ -86,42 +86,53 @@ class DailyRead(DailyBase):
 
     class Config:
         from_attributes = True
-        
-    @model_validator(mode="before")
-    def compute_phase_title(cls, data):
-        if not isinstance(data, dict):
-            obj = data
-            data = {
-                "id": obj.id,
-                "dailies_date": obj.dailies_date,
-                "estimated_time_minutes": obj.estimated_time_minutes,
-                "is_completed": obj.is_completed,
-                "phase_id": obj.phase_id,
-                "phase_title": obj.phase.title,
-                "start_time": obj.start_time,
-                "task_description": obj.task_description,
-            }
-        
-        return data
+
+DailyReadList = TypeAdapter(List[DailyRead]) # validates rows selected with exactly the DailyRead columns, phase_title included
                 
 class DailiesPost(DailiesGeneration):
     goal_phases: List[str]
     curr_phase: str
 
+DAILIES_PAGE_MAX = 500 # most dailies one page can ask for
+
 class DailiesRequest(BaseModel):
+    """Without limit every matching daily is returned, otherwise pages of limit dailies ordered by date and id"""
     goal_id: int
     completed: bool
+    from_date: date | None = Field(default=None, alias="from") # inclusive bounds on dailies_date
+    to_date: date | None = Field(default=None, alias="to")
+    limit: int | None = Field(default=None, ge=1, le=DAILIES_PAGE_MAX)
+    cursor: str | None = None # next_cursor of the previous page
+    include_total: bool = False # count every matching daily, ignoring the page
+
+    class Config:
+        populate_by_name = True
     
 class PhaseResponse(BaseModel):
     goal_phases: List[str]
     
 class DailiesResponse(BaseModel):
     dailies: List[DailyRead]
+    next_cursor: str | None = None # None on the last page
+    total: int | None = None
 
 class UpdateRequest(BaseModel):
-    ids: List[int]
+    """
+    Selects dailies by ids, or by every task of a phase or goal, optionally only those dated up to up_to.
+    Selectors given together are combined, e.g. phase_id and up_to marks "all tasks in phase X up to date D".
+    """
+    ids: List[int] | None = None
+    phase_id: int | None = None
+    goal_id: int | None = None
+    up_to: date | None = None
     completed: bool
 
+    @model_validator(mode="after")
+    def check_selector(self):
+        if self.ids is None and self.phase_id is None and self.goal_id is None:
+            raise ValueError("one of ids, phase_id or goal_id is required")
+        return self
+
 class GoalProgress(BaseModel):
     title: str
     total_dailies: int
@@ -2,7 +2,7 @@ from typing import Any
 from pydantic import BaseModel, Json
 
 class SessionBase(BaseModel):
-    session_data: bytes
+    phase_tag: str
 
 class Session(SessionBase):
     id: int
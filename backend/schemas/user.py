@@ -10,6 +10,9 @@ class UserCreate(UserBase):
 class UserLogin(UserBase):
     password: str
 
+class TokenRefresh(BaseModel):
+    refresh_token: str
+
 class User(UserBase):
     id: int
     class Config:
@@ -0,0 +1,87 @@
+"""
+Fixtures of the API tests. They run against the database in DATABASE_URL, which has to be upgraded to head, and
+remove the rows they add. Run from backend/:
+    python -m pytest tests
+"""
+import datetime, uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import main
+from db import SessionLocal, AsyncSessionLocal, get_async_db
+from db.session import async_engine
+from utils import stop_job_workers
+from models import User, Goal, Phase, Daily, ChatSession, GenerationJob
+from utils.auth import create_access_token
+
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(main.app) as client: # one event loop for every request, the async engine's connections belong to it
+        client.portal.call(stop_job_workers) # jobs the tests queue stay queued, no generation runs next to them
+        yield client
+
+@pytest.fixture
+def request_commits():
+    """Commits of each request's own session, in request order, from the session.info counter of the after_commit hook"""
+    commits = []
+    async def counting_db():
+        async with AsyncSessionLocal() as db:
+            try:
+                yield db
+            finally:
+                commits.append(db.sync_session.info.get("commits", 0))
+    main.app.dependency_overrides[get_async_db] = counting_db
+    yield commits
+    del main.app.dependency_overrides[get_async_db]
+
+@pytest.fixture
+def statements():
+    """Statements the app sends to the database while the test runs"""
+    sent = []
+    def record(conn, cursor, statement, parameters, context, executemany):
+        sent.append(statement)
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record)
+    yield sent
+    event.remove(async_engine.sync_engine, "before_cursor_execute", record)
+
+@pytest.fixture
+def make_user():
+    """make_user(dailies=n) adds a user with one ongoing goal and n open tasks due today, returns its id, goal_id and auth headers"""
+    db = SessionLocal()
+    user_ids = []
+
+    def make(dailies=0):
+        today = datetime.date.today()
+        name = f"test-{uuid.uuid4().hex[:12]}"
+        user = User(username=name, email=f"{name}@tests.example.com", hashed_password="-")
+        db.add(user)
+        db.flush()
+        goal = Goal(title="Run a half marathon", metric="Under 2 hours", purpose="Health", deadline=today + datetime.timedelta(days=90),
+                    is_completed=False, owner_id=user.id, time_commitment_per_week_hours=5)
+        db.add(goal)
+        db.flush()
+        phase = Phase(title="Phase 1", description="Base building", start_date=today, estimated_end_date=today + datetime.timedelta(days=30),
+                      is_completed=False, goal_id=goal.id)
+        db.add(phase)
+        db.flush()
+        db.add_all(Daily(task_description=f"Easy run {n}", dailies_date=today, start_time=datetime.time(7), estimated_time_minutes=30,
+                         is_completed=False, phase_id=phase.id, goal_id=goal.id, owner_id=user.id) for n in range(dailies))
+        db.commit()
+        user_ids.append(user.id)
+        token = create_access_token({"uid": user.id, "username": name})
+        return SimpleNamespace(id=user.id, goal_id=goal.id, headers={"Authorization": f"Bearer {token}"})
+
+    yield make
+    for user_id in user_ids:
+        db.query(Daily).filter(Daily.owner_id == user_id).delete()
+        db.query(Phase).filter(Phase.goal_id.in_(db.query(Goal.id).filter(Goal.owner_id == user_id))).delete(synchronize_session=False)
+        db.query(Goal).filter(Goal.owner_id == user_id).delete()
+        session_id = db.query(User.session_id).filter(User.id == user_id).scalar()
+        db.query(GenerationJob).filter(GenerationJob.user_id == user_id).delete()
+        db.query(User).filter(User.id == user_id).delete()
+        db.query(ChatSession).filter(ChatSession.id == session_id).delete()
+    db.commit()
+    db.close()
@@ -0,0 +1,28 @@
+import time
+
+from jose import jwt
+
+from utils.auth import create_refresh_token, SECRET_KEY, ALGORITHM, SESSION_MAX_AGE_HOURS
+
+def claims_of(token):
+    return jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+
+def test_refresh_keeps_the_login_time(client, make_user):
+    # renewed refresh tokens expire no later than SESSION_MAX_AGE_HOURS after the login, however often they are used
+    user = make_user()
+    auth_time = int(time.time()) - SESSION_MAX_AGE_HOURS * 3600 + 60 # a minute of the session left
+    response = client.post("/auth/refresh", json={"refresh_token": create_refresh_token({"uid": user.id}, auth_time)})
+    assert response.status_code == 200
+    claims = claims_of(response.json()["refresh_token"])
+    assert claims["auth_time"] == auth_time
+    assert claims["exp"] == auth_time + SESSION_MAX_AGE_HOURS * 3600
+
+def test_refresh_refuses_old_sessions(client, make_user):
+    user = make_user()
+    auth_time = int(time.time()) - SESSION_MAX_AGE_HOURS * 3600 - 60
+    response = client.post("/auth/refresh", json={"refresh_token": create_refresh_token({"uid": user.id}, auth_time)})
+    assert response.status_code == 401
+
+    without_auth_time = jwt.encode({"uid": user.id, "type": "refresh", "exp": int(time.time()) + 3600}, SECRET_KEY, algorithm=ALGORITHM)
+    response = client.post("/auth/refresh", json={"refresh_token": without_auth_time})
+    assert response.status_code == 401
@@ -0,0 +1,54 @@
+import datetime
+
+from db import SessionLocal
+from models import User, Goal, Daily, ChatSession
+from schemas import DefinitionsCreate, GoalPrerequisites, PhaseGeneration
+
+def final_phase_session(user_id, phases_obj=None):
+    """Gives the user a chat session which has gone through every step but confirming the last phase's dailies"""
+    today = datetime.date.today()
+    db = SessionLocal()
+    session = ChatSession(
+        phase_tag="generate_dailies",
+        goal_obj=DefinitionsCreate(title="Run a 10k", metric="Under 60 minutes", purpose="Health", deadline=today + datetime.timedelta(days=60)).model_dump_json(),
+        prereq_obj=GoalPrerequisites(time_commitment_per_week_hours=5).model_dump_json(),
+        phases_obj=phases_obj or PhaseGeneration.model_validate({"phases": [
+            {"title": "Base", "description": "Run 5k", "start_date": today, "end_date": today + datetime.timedelta(days=20)},
+            {"title": "Build", "description": "Run 10k", "start_date": today + datetime.timedelta(days=21), "end_date": today + datetime.timedelta(days=60)},
+        ]}).model_dump_json(),
+    )
+    db.add(session)
+    db.flush()
+    db.get(User, user_id).session_id = session.id
+    db.commit()
+    db.close()
+    return {"status": "dailies_generated", "goal_phases": ["Base", "Build"], "curr_phase": "Build", "dailies": [
+        {"task_description": f"Run {n}", "dailies_date": str(today + datetime.timedelta(days=n)), "start_time": "07:00:00",
+         "estimated_time_minutes": 30, "phase_title": "Base" if n < 21 else "Build"} for n in (0, 1, 30)
+    ]}
+
+def test_confirm_commits_once(client, make_user, request_commits):
+    # goal, phases, dailies and the new chat session are staged by the helpers and committed by the request together
+    user = make_user()
+    dailies_post = final_phase_session(user.id)
+    response = client.post("/create/confirm", json={"confirm_obj": dailies_post}, headers=user.headers)
+    assert response.status_code == 200
+    assert response.json()["phase_tag"] == "goal_completed"
+    assert request_commits == [1]
+
+    db = SessionLocal()
+    goal_id = response.json()["ret_obj"]["goal_id"]
+    assert db.query(Daily).filter(Daily.goal_id == goal_id).count() == 3
+    db.close()
+
+def test_failed_confirm_commits_nothing(client, make_user, request_commits):
+    # a phase without a description fails the insert after the goal is staged, the request rolls all of it back
+    user = make_user()
+    dailies_post = final_phase_session(user.id, phases_obj='{"phases": [{"title": "Build", "start_date": "2030-01-01", "end_date": "2030-02-01"}]}')
+    db = SessionLocal()
+    goals_before = db.query(Goal).filter(Goal.owner_id == user.id).count()
+    response = client.post("/create/confirm", json={"confirm_obj": dailies_post}, headers=user.headers)
+    assert response.status_code == 500
+    assert request_commits == [0]
+    assert db.query(Goal).filter(Goal.owner_id == user.id).count() == goals_before
+    db.close()
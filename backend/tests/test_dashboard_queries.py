@@ -0,0 +1,28 @@
+def test_stats_is_one_query(client, make_user, statements):
+    user = make_user(dailies=3)
+    response = client.get("/dashboard/stats", headers=user.headers)
+    assert response.status_code == 200
+    assert response.json()["remaining_tasks_today"] == 3
+    # besides the data version read for the ETag (see conditional_read), the counters and the task list are one statement
+    stats_queries = [s for s in statements if "users.data_version" not in s]
+    assert len(statements) == 2
+    assert len(stats_queries) == 1
+
+def test_dailies_reads_do_not_grow_with_rows(client, make_user, statements):
+    # dailies lists are read as projected rows with their phase title in the same statement, so no query per row
+    counts = {}
+    for dailies in (1, 25):
+        user = make_user(dailies=dailies)
+        statements.clear()
+        response = client.post("/dashboard/get_dailies", json={"goal_id": user.goal_id, "completed": False}, headers=user.headers)
+        assert response.status_code == 200
+        assert len(response.json()["dailies"]) == dailies
+        assert all(daily["phase_title"] == "Phase 1" for daily in response.json()["dailies"])
+        get_dailies = len(statements)
+
+        statements.clear()
+        response = client.get("/dashboard/stats", headers=user.headers)
+        assert response.status_code == 200
+        assert len(response.json()["tasks_today_list"]) == dailies
+        counts[dailies] = (get_dailies, len(statements))
+    assert counts[1] == counts[25]
@@ -0,0 +1,80 @@
+import datetime, uuid
+
+from google.genai.types import Content, Part
+
+from db import SessionLocal
+from models import User, ChatSession, ChatMessage, GenerationJob
+from schemas import DefinitionsCreate, GoalPrerequisites, PhaseGeneration, DailyCreate
+from utils import job_utils
+
+def dailies_session(user_id):
+    """Gives the user a chat session whose phases were confirmed, so it is generating the first phase's dailies. Returns its id"""
+    today = datetime.date.today()
+    phases = PhaseGeneration.model_validate({"phases": [
+        {"title": "Base", "description": "Run 5k", "start_date": today, "end_date": today + datetime.timedelta(days=20)},
+    ]})
+    db = SessionLocal()
+    session = ChatSession(
+        phase_tag="generate_dailies", message_count=1,
+        goal_obj=DefinitionsCreate(title="Run a 10k", metric="Under 60 minutes", purpose="Health", deadline=today + datetime.timedelta(days=60)).model_dump_json(),
+        prereq_obj=GoalPrerequisites(time_commitment_per_week_hours=5).model_dump_json(),
+        phases_obj=phases.model_dump_json(),
+    )
+    db.add(session)
+    db.flush()
+    db.add(ChatMessage(session_id=session.id, seq=0, role="model",
+                       content=Content(role="model", parts=[Part.from_text(text=phases.model_dump_json())]).model_dump(mode="json")))
+    session_id = db.get(User, user_id).session_id = session.id
+    db.commit()
+    db.close()
+    return session_id
+
+def add_job(user_id, session_id, **values):
+    db = SessionLocal()
+    job_id = uuid.uuid4().hex
+    db.add(GenerationJob(id=job_id, phase_index=0, user_id=user_id, session_id=session_id, **values))
+    db.commit()
+    db.close()
+    return job_id
+
+def get_job(job_id):
+    db = SessionLocal()
+    job = db.get(GenerationJob, job_id)
+    db.close()
+    return job
+
+def test_load_retries_failed_job(client, make_user):
+    # the session's only job failed before any dailies were saved, load queues it again rather than failing on the missing dailies
+    user = make_user()
+    session_id = dailies_session(user.id)
+    job_id = add_job(user.id, session_id, status="failed", error="quota exhausted")
+
+    response = client.post("/create/load", headers=user.headers)
+    assert response.status_code == 200
+    assert response.json() == {"phase_tag": "generate_dailies", "ret_obj": {"status": "dailies_pending", "job_id": job_id}}
+    job = get_job(job_id)
+    assert (job.status, job.error) == ("queued", None)
+
+    response = client.post("/create/load", headers=user.headers) # still queued, polled again rather than queued twice
+    assert response.json()["ret_obj"]["job_id"] == job_id
+
+def test_sequential_resume_drops_saved_windows(client, make_user, monkeypatch):
+    # the sequential path regenerates every window, so the progress of a resumed job only counts the windows of this run
+    user = make_user()
+    session_id = dailies_session(user.id)
+    saved = [DailyCreate(task_description="Old run", dailies_date=datetime.date.today(), start_time=datetime.time(7),
+                         estimated_time_minutes=30, phase_title="Base").model_dump(mode="json")]
+    job_id = add_job(user.id, session_id, status="queued", windows_total=3, windows_done=2, window_results={"0": saved, "1": saved})
+    progress = []
+
+    async def generate_dailies(session, phase, db, mode=None, on_window_done=None, done_windows=None):
+        assert done_windows == {}
+        await on_window_done(0, [], 3)
+        progress.append(get_job(job_id).windows_done)
+        raise RuntimeError("stopped after the first window")
+
+    monkeypatch.setattr(job_utils, "DAILIES_GENERATION_MODE", "sequential")
+    monkeypatch.setattr(job_utils, "generate_dailies", generate_dailies)
+    client.portal.call(job_utils.run_dailies_job, job_id)
+    assert progress == [1]
+    assert list(get_job(job_id).window_results) == ["0"]
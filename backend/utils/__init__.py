@@ -1,6 +1,16 @@
-from .auth import hash_password, verify_password, create_access_token, get_current_user
-from .db_utils import (insert_user, insert_goal, insert_phases, insert_dailies,
+from .auth import (hash_password, verify_password, create_access_token, get_current_user,
+                   init_hash_pool, close_hash_pool, hash_password_async, verify_and_update_password_async, create_refresh_token, get_user_id_from_token, decode_token)
+from .db_utils import (insert_goal, insert_phases, insert_dailies, finalize_goal,
                        insert_session, get_user_session, change_user_session,
-                       update_session_data, update_session_phase_tag, update_session_goal, update_session_prereq, update_session_phases, update_session_dailies,
-                       get_model_latest_response, update_session_chat_history)
-from .llm_utils import (get_llm_response, generate_dailies, parse_response)
\ No newline at end of file
+                       clear_session_chat_history, update_session_phase_tag, update_session_goal, update_session_prereq, update_session_phases, update_session_dailies,
+                       get_model_latest_response, get_chat_history, append_chat_messages, update_session_chat_history,
+                       get_generation_job, get_active_generation_job, get_latest_generation_job, get_data_version, bump_data_version)
+from .pagination_utils import keyset_page, split_page, date_bounds, encode_cursor, decode_cursor
+from .llm_clients import init_llm_clients, close_llm_clients
+from .llm_scheduler import LLMOverloadedError, llm_queue_stats
+from .cache_utils import LRUCache, grounding_cache_stats, response_cache_stats, llm_cache_stats, conditional_read
+from .llm_utils import (LLM_API_KEYS, get_llm_response, stream_llm_response, generate_dailies, parse_response, parse_response_text)
+from .metrics import MetricsMiddleware
+from .sql_profiler import init_sql_profiler, SQLProfilerMiddleware, SQL_PROFILE_HEADER
+from .stream_utils import StreamingResponseParser, sse_event
+from .job_utils import start_job_workers, stop_job_workers, enqueue_dailies_job, retry_dailies_job, get_job_status
\ No newline at end of file
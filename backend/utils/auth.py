@@ -2,6 +2,8 @@ from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
 from passlib.context import CryptContext
 from jose import exceptions, JWTError, jwt
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
 import datetime
 import os
 from dotenv import load_dotenv
@@ -9,10 +11,14 @@ from dotenv import load_dotenv
 if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
     load_dotenv()
 
-pwd_context = CryptContext(schemes=["bcrypt"])
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12")) # cost factor of new hashes, stored hashes with another cost are rehashed on login
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2")) # processes hashing passwords, bounds how much CPU a signup/login burst can take
+pwd_context = CryptContext(schemes=["bcrypt"], bcrypt__rounds=BCRYPT_ROUNDS)
 SECRET_KEY = os.getenv("SECRET_KEY", "secret_key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60
+REFRESH_TOKEN_EXPIRE_HOURS = int(os.getenv("REFRESH_TOKEN_EXPIRE_HOURS", "24")) # renews access tokens without the password
+SESSION_MAX_AGE_HOURS = int(os.getenv("SESSION_MAX_AGE_HOURS", str(24 * 30))) # refresh tokens are not renewed past this long after the password was checked
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
@@ -22,13 +28,49 @@ def hash_password(password: str):
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
+def verify_and_update_password(plain_password, hashed_password) -> tuple[bool, str | None]: # (valid, new hash when the stored one was made with another cost)
+    return pwd_context.verify_and_update(plain_password, hashed_password)
+
+# bcrypt holds the GIL for part of each hash, so it runs in a separate process pool rather than the thread pool.
+# the pool is started and shut down with the app, see main.lifespan. without it (scripts) the default thread pool is used
+_hash_pool: ProcessPoolExecutor | None = None
+
+def init_hash_pool(workers: int = HASH_WORKERS):
+    global _hash_pool
+    _hash_pool = ProcessPoolExecutor(max_workers=workers)
+
+def close_hash_pool():
+    global _hash_pool
+    if _hash_pool is not None:
+        _hash_pool.shutdown(cancel_futures=True)
+        _hash_pool = None
+
+async def hash_password_async(password: str) -> str:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, hash_password, password)
+
+async def verify_and_update_password_async(plain_password, hashed_password) -> tuple[bool, str | None]:
+    return await asyncio.get_running_loop().run_in_executor(_hash_pool, verify_and_update_password, plain_password, hashed_password)
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.datetime.now(datetime.UTC) + datetime.timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": int(expire.timestamp())})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def get_user_id_from_token(token: str) -> int:
+def create_refresh_token(data: dict, auth_time: int | None = None): # only accepted by /auth/refresh, see decode_token
+    """auth_time is when the password was last checked, kept as is through refreshes. The token expires
+    REFRESH_TOKEN_EXPIRE_HOURS from now, or SESSION_MAX_AGE_HOURS after auth_time if that comes first"""
+    now = datetime.datetime.now(datetime.UTC)
+    auth_time = int(now.timestamp()) if auth_time is None else auth_time
+    expire = min(int((now + datetime.timedelta(hours=REFRESH_TOKEN_EXPIRE_HOURS)).timestamp()), auth_time + SESSION_MAX_AGE_HOURS * 3600)
+    to_encode = data.copy()
+    to_encode.update({"exp": expire, "type": "refresh", "auth_time": auth_time})
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def get_user_id_from_token(token: str, token_type: str = "access") -> int:
+    return decode_token(token, token_type)["uid"]
+
+def decode_token(token: str, token_type: str = "access") -> dict: # the claims of a valid, unexpired token of token_type
     try:
         payload = jwt.decode(
             token,
@@ -36,15 +78,19 @@ def get_user_id_from_token(token: str) -> int:
             algorithms=[ALGORITHM]
         )
         
-        user_id = payload.get("uid")
+        if payload.get("type", "access") != token_type: # access tokens carry no type
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid token",
+            )
         
-        if user_id is None:
+        if payload.get("uid") is None:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token missing user ID",
             )
         
-        return user_id
+        return payload
     
     except exceptions.ExpiredSignatureError:
         raise HTTPException(
@@ -0,0 +1,180 @@
+import datetime, functools, hashlib, json, os, time
+from collections import OrderedDict
+
+from fastapi import Response
+from pydantic import BaseModel, TypeAdapter
+from google.genai.types import GenerateContentResponse
+
+from db import AsyncSessionLocal
+
+from utils.db_utils import get_grounding_cache_entry, upsert_grounding_cache_entry, get_data_version, hit_llm_cache_entry, upsert_llm_cache_entry
+from utils.instruction_chain import SEARCH_INSTRUCTION_VERSION
+
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+GROUNDING_CACHE_TTL_HOURS = float(os.getenv("GROUNDING_CACHE_TTL_HOURS", "168")) # search results older than this are fetched again
+GROUNDING_CACHE_SIZE = int(os.getenv("GROUNDING_CACHE_SIZE", "256")) # entries kept in memory in front of the db table
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024")) # dashboard read responses kept in memory
+# exact-match gemini response cache, opt-in per phase tag: define_goal, get_prerequisites, generate_phases, refine_phases, generate_dailies
+LLM_CACHE_PHASES = {tag.strip() for tag in os.getenv("LLM_CACHE_PHASES", "").split(",") if tag.strip()}
+LLM_CACHE_TTL_HOURS = float(os.getenv("LLM_CACHE_TTL_HOURS", "24"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000")) # rows kept in llm_response_cache, least recently used are evicted
+
+class LRUCache:
+    """Small in-process LRU with an optional per-entry expiry. Not shared between processes."""
+    def __init__(self, maxsize, ttl_seconds=None):
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (expires at in time.monotonic(), value)
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at is not None and expires_at < time.monotonic():
+            del self._entries[key]
+            return default
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl_seconds=None):
+        ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = time.monotonic() + ttl_seconds if ttl_seconds is not None else None
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+_grounding_lru = LRUCache(GROUNDING_CACHE_SIZE, ttl_seconds=GROUNDING_CACHE_TTL_HOURS * 3600)
+grounding_cache_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+def grounding_cache_key(goal_obj, prereq_obj, phase_title) -> str:
+    raw = json.dumps([goal_obj, prereq_obj, phase_title, SEARCH_INSTRUCTION_VERSION], sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def get_cached_grounding(key):
+    """(resource_links, reference_text_map) stored for key, from memory first and then the db, or None on a miss"""
+    value = _grounding_lru.get(key)
+    if value is not None:
+        grounding_cache_stats["memory_hits"] += 1
+        return value
+
+    async with AsyncSessionLocal() as db:
+        try:
+            entry = await get_grounding_cache_entry(key, db)
+        except Exception as e:
+            print("error reading grounding cache: ", e)
+            entry = None
+    if entry is None:
+        grounding_cache_stats["misses"] += 1
+        return None
+
+    value = (
+        {int(i): uri for i, uri in entry.resource_links.items()},
+        {tuple(indices): text for indices, text in entry.reference_text_map},
+    )
+    remaining = (entry.expires_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds()
+    _grounding_lru.set(key, value, ttl_seconds=remaining)
+    grounding_cache_stats["db_hits"] += 1
+    return value
+
+async def store_grounding(key, resource_links, reference_text_map):
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=GROUNDING_CACHE_TTL_HOURS)
+    _grounding_lru.set(key, (resource_links, reference_text_map))
+    async with AsyncSessionLocal() as db:
+        await upsert_grounding_cache_entry(
+            key,
+            {str(i): uri for i, uri in resource_links.items()},
+            [[list(indices), text] for indices, text in reference_text_map.items()],
+            expires_at,
+            db,
+        )
+
+
+_response_lru = LRUCache(RESPONSE_CACHE_SIZE)
+response_cache_stats = {"not_modified": 0, "hits": 0, "misses": 0}
+_MISSING = object()
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+async def conditional_read(endpoint, params: dict, user_id, if_none_match, response: Response, db, build):
+    """
+    Serves a read endpoint from the user's data version (users.data_version, bumped with every write).
+    Answers 304 when If-None-Match still holds the ETag of that version, otherwise returns the body cached for
+    (user, endpoint, params, version) or awaits build() to compute it.
+    params must hold everything besides the user and their data that the body depends on, e.g. today's date.
+    """
+    version = await get_data_version(user_id, db)
+    if version is None:
+        return await build()
+    params_key = json.dumps(params, sort_keys=True, default=str)
+    digest = hashlib.sha256(f"{user_id}:{endpoint}:{params_key}".encode()).hexdigest()[:16]
+    headers = {"ETag": f'"{version}-{digest}"', "Cache-Control": "private, no-cache"}
+
+    if if_none_match and _etag_matches(if_none_match, headers["ETag"]):
+        response_cache_stats["not_modified"] += 1
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+
+    key = (user_id, endpoint, params_key, version) # older versions of the key are never asked for again and age out
+    body = _response_lru.get(key, _MISSING)
+    if body is _MISSING:
+        response_cache_stats["misses"] += 1
+        body = await build()
+        _response_lru.set(key, body)
+    else:
+        response_cache_stats["hits"] += 1
+    return body
+
+
+llm_cache_stats: dict[str, dict] = {} # phase tag -> {"hits", "misses", "saved_seconds"}, saved_seconds being the model latency the hits skipped
+
+@functools.lru_cache(maxsize=64)
+def _schema_fingerprint(schema) -> str: # json schema of a response_schema type, built once per type
+    if schema is None:
+        return ""
+    return json.dumps(TypeAdapter(schema).json_schema(), sort_keys=True)
+
+def _jsonable(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+def llm_cache_key(model, contents, config) -> str | None:
+    """Key of a gemini request for the response cache, or None when it cannot be cached (e.g. search grounded calls)"""
+    if "tools" in config:
+        return None
+    raw = json.dumps(
+        [model, config.get("system_instruction"), contents, config.get("response_mime_type"), _schema_fingerprint(config.get("response_schema"))],
+        sort_keys=True, default=_jsonable,
+    )
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+async def get_cached_llm_response(key, phase_tag) -> GenerateContentResponse | None:
+    stats = llm_cache_stats.setdefault(phase_tag, {"hits": 0, "misses": 0, "saved_seconds": 0.0})
+    async with AsyncSessionLocal() as db:
+        row = await hit_llm_cache_entry(key, db)
+    if row is None:
+        stats["misses"] += 1
+        return None
+    stats["hits"] += 1
+    stats["saved_seconds"] += row.latency_ms / 1000
+    return GenerateContentResponse.model_validate(row.response)
+
+async def store_llm_response(key, phase_tag, response: GenerateContentResponse, latency_seconds):
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=LLM_CACHE_TTL_HOURS)
+    async with AsyncSessionLocal() as db:
+        await upsert_llm_cache_entry(key, phase_tag, response.model_dump(mode="json", exclude_none=True), latency_seconds * 1000,
+                                     expires_at, LLM_CACHE_MAX_ENTRIES, db)
@@ -0,0 +1,90 @@
+import json, os, re
+
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+DAILIES_CONTEXT_TOKEN_BUDGET = int(os.getenv("DAILIES_CONTEXT_TOKEN_BUDGET", "3000")) # max tokens of prior tasks sent with each dailies window
+DAILIES_CONTEXT_TASK_CHARS = int(os.getenv("DAILIES_CONTEXT_TASK_CHARS", "90")) # task descriptions are cut to this many characters
+CHARS_PER_TOKEN = 4 # rough average for gemini tokenizers on english text
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def _task_text(task_description: str) -> str: # drops the resource links attach_citations appended, they mean nothing to the model
+    text = task_description.split("\n Resources:")[0]
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) > DAILIES_CONTEXT_TASK_CHARS:
+        text = text[:DAILIES_CONTEXT_TASK_CHARS-3].rstrip() + "..."
+    return text
+
+def _group_by_phase(dailies): # {phase title: [dailies sorted by date]}, phases in the order they were planned
+    phases = {}
+    for daily in sorted(dailies, key=lambda d: (d.dailies_date, d.start_time)):
+        phases.setdefault(daily.phase_title, []).append(daily)
+    return phases
+
+def _phase_detail_lines(phase_title, tasks): # one line per date, tasks of the day separated by ';'
+    lines = [f"## {phase_title}"]
+    days = {}
+    for task in tasks:
+        days.setdefault(task.dailies_date, []).append(task)
+    for day, day_tasks in days.items():
+        cells = "; ".join(f"{t.start_time.strftime('%H:%M')} {t.estimated_time_minutes}m {_task_text(t.task_description)}" for t in day_tasks)
+        lines.append(f"{day}: {cells}")
+    return lines
+
+def _phase_summary_line(phase_title, tasks):
+    total_minutes = sum(t.estimated_time_minutes for t in tasks)
+    return (f"## {phase_title} (summary): {len(tasks)} tasks from {tasks[0].dailies_date} to {tasks[-1].dailies_date}, "
+            f"{total_minutes} minutes in total. Last task: {_task_text(tasks[-1].task_description)}")
+
+def encode_dailies_context(dailies, token_budget=DAILIES_CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Compact digest of the confirmed dailies for the dailies generation prompt.
+    Tasks are grouped by phase and date, one line per day with columns "start duration task".
+    Once the digest is over token_budget, the oldest phases are replaced by one-line summaries,
+    and if that is still not enough only the latest days of the most recent phase are kept.
+    """
+    if not dailies:
+        return "None"
+    header = "Columns per task: start time, duration in minutes, task. Tasks of one day are separated by ';'."
+
+    phases = _group_by_phase(dailies)
+    blocks = [_phase_detail_lines(title, tasks) for title, tasks in phases.items()]
+    summaries = [[_phase_summary_line(title, tasks)] for title, tasks in phases.items()]
+
+    def size(lines): # characters once joined with newlines
+        return sum(len(line) + 1 for line in lines)
+    budget_chars = token_budget * CHARS_PER_TOKEN
+    total = len(header) + sum(size(block) for block in blocks)
+
+    for i in range(len(blocks) - 1): # summarise from the oldest phase, keeping the latest in detail
+        if total <= budget_chars:
+            break
+        total += size(summaries[i]) - size(blocks[i])
+        blocks[i] = summaries[i]
+
+    if total > budget_chars: # keep only the latest days of the most recent phase
+        title_line, day_lines = blocks[-1][0], blocks[-1][1:]
+        omitted = "(earlier days of this phase omitted)"
+        total += len(omitted) + 1
+        dropped = 0
+        while dropped < len(day_lines) and total > budget_chars:
+            total -= len(day_lines[dropped]) + 1
+            dropped += 1
+        blocks[-1] = [title_line, omitted] + day_lines[dropped:] if dropped < len(day_lines) else summaries[-1]
+
+    return "\n".join([header] + [line for block in blocks for line in block])
+
+def encode_phases_outline(phases_obj, current_phase_title) -> str:
+    """Every phase's title and dates, with the description only for the phase being planned"""
+    phases = json.loads(phases_obj)["phases"] if isinstance(phases_obj, str) else phases_obj["phases"]
+    lines = []
+    for phase in phases:
+        line = f"- {phase['title']}: {phase['start_date']} to {phase['end_date']}"
+        if phase["title"] == current_phase_title:
+            line += f". Target: {phase['description']}"
+        lines.append(line)
+    return "\n".join(lines)
@@ -1,18 +1,19 @@
-import datetime, pickle, json
+import datetime, json, uuid
 from datetime import date
 
 from fastapi import Depends, HTTPException
-from pydantic import TypeAdapter
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import select, insert, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from google.genai.types import Content, Part
 
-from utils import (hash_password,
-                           
-                           )
-from db import get_db
+from db import get_async_db
+from utils.prompt_registry import RESPONSE_ADAPTER
 
-from models import User, ChatSession, Goal, Phase, Daily
+from models import User, ChatSession, ChatMessage, Goal, Phase, Daily, GenerationJob, GroundingCache, LLMResponseCache
 from schemas import (FollowUp,
                             DefinitionsCreate,
                             GoalPrerequisites, 
@@ -20,183 +21,139 @@ from schemas import (FollowUp,
                             DailiesGeneration,
                             DailiesPost)
 
-def insert_session(db: Session=Depends(get_db)): # will not commit in this function. commits should happen with what calls it.
+async def insert_session(db: AsyncSession=Depends(get_async_db)): # will not commit in this function. commits should happen with what calls it.
     try:
-        new_session = ChatSession(session_data=pickle.dumps([]))
+        new_session = ChatSession()
         db.add(new_session)
-        db.flush()
-        db.refresh(new_session)
+        await db.flush() # assigns the id, the other columns are known from their defaults
         print(f"new session with id: {new_session.id} added")
         return new_session
     except Exception as e:
         print("error with new session: ", e)
-        return False
+        raise
     
-def insert_user(username, email, password, db: Session=Depends(get_db)): # insert new user into db
-    try:
-        new_session = insert_session(db)
-        new_user = User(
-            username=username,
-            email=email,
-            hashed_password=hash_password(password),
-            session=new_session
-        )
-        db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
-        print(f"User new user with uid: {new_user.id} added")
-        return new_user.id
-    except Exception as e:
-        print("error with new user: ", e)
-        return False
-
-def change_user_session(uid, db: Session=Depends(get_db)): # creates new session and updates user to a new session
+async def change_user_session(uid, db: AsyncSession=Depends(get_async_db)): # creates new session and updates user to a new session
     try:
-        user = db.get(User, uid)
-        new_session = insert_session(db)
+        user = await db.get(User, uid, options=[joinedload(User.session)])
+        new_session = await insert_session(db)
         user.session = new_session
-        db.commit()
-        db.refresh(user)
         print(f"User {user.username} (uid: {uid}), successfully updated session")
         return new_session
 
     except Exception as e:
-        print(e)
-        return False
+        print("error with changing user session: ", e)
+        raise
     
-def get_user_session(uid, db: Session=Depends(get_db)) -> ChatSession: # returns the entire user session object
+async def get_user_session(uid, db: AsyncSession=Depends(get_async_db)) -> ChatSession: # returns the entire user session object
     try:
-        user = db.query(User).options(
-            joinedload(User.session)
-        ).filter(User.id == uid).first()
+        user = (await db.execute(
+            select(User).options(joinedload(User.session)).where(User.id == uid)
+        )).scalars().first()
         
         if not user:
             raise HTTPException(status_code=500, detail=f"User with ID {uid} not found.")
         
         if not user.session:
             print(f"User {uid} does not have an active session.")
-            return change_user_session(uid, db)
+            return await change_user_session(uid, db)
         print("user session found: ", user.session)
         return user.session
     
     except Exception as e:
         print("unable to get user session: ", e)
-        return False
+        raise
 
-def get_model_latest_response(uid, db: Session=Depends(get_db)): # returns last message in chat history
-    models = TypeAdapter(FollowUp | DefinitionsCreate | GoalPrerequisites | PhaseGeneration | DailiesGeneration)
-    session = get_user_session(uid, db)
-    chat_history = pickle.loads(session.session_data)
-    if len(chat_history) == 0:
+async def get_model_latest_response(uid, db: AsyncSession=Depends(get_async_db)): # returns last message in chat history
+    session = await get_user_session(uid, db)
+    last_message = (await db.execute(
+        select(ChatMessage.content)
+        .where(ChatMessage.session_id == session.id, ChatMessage.seq >= session.history_start)
+        .order_by(ChatMessage.seq.desc())
+        .limit(1)
+    )).first()
+    if last_message is None:
         return None
-    text_obj = json.loads(chat_history[-1].parts[0].text)
-    return models.validate_python(text_obj)
+    return RESPONSE_ADAPTER.validate_json(Content.model_validate(last_message.content).parts[0].text)
 
-def update_session_phase_tag(session: ChatSession, phase_tag, db: Session=Depends(get_db)):
-    try:
-        session.phase_tag = phase_tag
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return True
-    except Exception as e:
-        print("Error with updating session data: ", e)
-        db.rollback() 
-        return False
+async def get_chat_history(session: ChatSession, db: AsyncSession=Depends(get_async_db)) -> list[Content]: # the session's chat history in order, one range scan on (session_id, seq)
+    messages = (await db.execute(
+        select(ChatMessage.content)
+        .where(ChatMessage.session_id == session.id, ChatMessage.seq >= session.history_start)
+        .order_by(ChatMessage.seq)
+    )).all()
+    return [Content.model_validate(message.content) for message in messages]
+
+async def update_session_phase_tag(session: ChatSession, phase_tag, db: AsyncSession=Depends(get_async_db)):
+    session.phase_tag = phase_tag
+    return True
     
-def update_session_data(session: ChatSession, session_data, db: Session=Depends(get_db)): # updates the pickled chat object
+async def clear_session_chat_history(session: ChatSession, db: AsyncSession=Depends(get_async_db)): # old messages are kept, the history just starts after them
+    session.history_start = session.message_count
+    return True
+
+async def append_chat_messages(session: ChatSession, contents: list[Content], db: AsyncSession=Depends(get_async_db)): # appends turns to the chat history without reading it
     try:
-        session.session_data = pickle.dumps(session_data)
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
+        # reserve the seqs atomically so concurrent turns on one session cannot collide
+        message_count = (await db.execute(
+            update(ChatSession)
+            .where(ChatSession.id == session.id)
+            .values(message_count=ChatSession.message_count + len(contents))
+            .returning(ChatSession.message_count)
+        )).scalar_one()
+        set_committed_value(session, "message_count", message_count) # keeps the loaded session current without marking it dirty
+        next_seq = message_count - len(contents)
+        db.add_all([
+            ChatMessage(
+                session_id=session.id,
+                seq=next_seq + i,
+                role=content.role or "model",
+                content=content.model_dump(mode="json", exclude_none=True),
+            )
+            for i, content in enumerate(contents)
+        ])
         return True
     except Exception as e:
-        print("Error with updating session data: ", e)
-        db.rollback() 
-        return False
+        print("Error with appending chat messages: ", e)
+        raise
     
-def update_session_chat_history(session: ChatSession, user_input, response, db: Session=Depends(get_db)):
-    chat_history = pickle.loads(session.session_data)
+async def update_session_chat_history(session: ChatSession, user_input, model_content: Content, db: AsyncSession=Depends(get_async_db)): # model_content is the model's reply, e.g. response.candidates[0].content
     new_user_message = Content(
         parts=[Part.from_text(text=f'CURRENT_PHASE = "{session.phase_tag}"\n{user_input}')],
         role='user'
     )
-    chat_history.append(new_user_message)
-    chat_history.append(response.candidates[0].content)
-    update_session_data(session, chat_history, db)
+    await append_chat_messages(session, [new_user_message, model_content], db)
 
-def update_session_goal(session: ChatSession, goal, db: Session=Depends(get_db)): # after user completes goal_def phase, dump the DefinitionsCreate object into the session
-    try:
-        if isinstance(goal, DefinitionsCreate):
-            goal = goal.model_dump_json()
-        session.goal_obj = goal
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return True
-    except Exception as e:
-        print("Error with updating session goal_obj: ", e)
-        db.rollback() 
-        return False
+async def update_session_goal(session: ChatSession, goal, db: AsyncSession=Depends(get_async_db)): # after user completes goal_def phase, dump the DefinitionsCreate object into the session
+    if isinstance(goal, DefinitionsCreate):
+        goal = goal.model_dump_json()
+    session.goal_obj = goal
+    return True
     
-def update_session_prereq(session: ChatSession, prereq, db: Session=Depends(get_db)): # after user completes prereq phase, dump the GoalPrerequisites object into the session
-    try:
-        if isinstance(prereq, GoalPrerequisites):
-            prereq = prereq.model_dump_json()
-        session.prereq_obj = prereq
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return True
-    except Exception as e:
-        print("Error with updating session prereq_obj: ", e)
-        db.rollback() 
-        return False
+async def update_session_prereq(session: ChatSession, prereq, db: AsyncSession=Depends(get_async_db)): # after user completes prereq phase, dump the GoalPrerequisites object into the session
+    if isinstance(prereq, GoalPrerequisites):
+        prereq = prereq.model_dump_json()
+    session.prereq_obj = prereq
+    return True
 
-def update_session_phases(session: ChatSession, phases, db: Session=Depends(get_db)): # after user completes phase_gen phase, dump the PhaseGeneration object into the session
-    try:
-        if isinstance(phases, PhaseGeneration):
-            phases = phases.model_dump_json()
-        session.phases_obj = phases
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return True
-    
-    except Exception as e:
-        print("Error with updating session phases_obj: ", e)
-        db.rollback() 
-        return False
+async def update_session_phases(session: ChatSession, phases, db: AsyncSession=Depends(get_async_db)): # after user completes phase_gen phase, dump the PhaseGeneration object into the session
+    if isinstance(phases, PhaseGeneration):
+        phases = phases.model_dump_json()
+    session.phases_obj = phases
+    return True
 
-def update_session_dailies(session: ChatSession, dailies, db: Session=Depends(get_db)): # each time use confirms the dailies for given phase, update the new set of all dailies
-    try:
-        if isinstance(dailies, DailiesPost):
-            dailies = json.dumps(dailies.model_dump(mode="json")) # nested pydantic models
-        session.dailies_obj = dailies
-        
-        db.add(session)
-        db.commit()
-        db.refresh(session)
-        return True
-    
-    except Exception as e:
-        print("Error with updating session phases_obj: ", e)
-        db.rollback() 
-        return False
+async def update_session_dailies(session: ChatSession, dailies, db: AsyncSession=Depends(get_async_db)): # each time use confirms the dailies for given phase, update the new set of all dailies
+    if isinstance(dailies, DailiesPost):
+        dailies = json.dumps(dailies.model_dump(mode="json")) # nested pydantic models
+    session.dailies_obj = dailies
+    return True
 
-def insert_goal(goal_data, prereq_data, user_id, db: Session=Depends(get_db)): # inserts goal into db table. anytime we insert goal, it would be from chat session objs
+async def insert_goal(goal_data, prereq_data, user_id, db: AsyncSession=Depends(get_async_db)): # inserts goal into db table. anytime we insert goal, it would be from chat session objs
     try:
         db_goal = Goal(
             title=goal_data["title"],
             metric=goal_data["metric"],
             purpose=goal_data["purpose"],
-            deadline=goal_data["deadline"],
+            deadline=date.fromisoformat(goal_data["deadline"]), # the session objs hold json strings, asyncpg wants dates
             owner_id=user_id,
 
             related_experience=prereq_data["related_experience"],
@@ -208,78 +165,245 @@ def insert_goal(goal_data, prereq_data, user_id, db: Session=Depends(get_db)): #
         )
 
         db.add(db_goal)
-        db.commit()
-        db.refresh(db_goal)
+        await db.flush() # the phases need the goal id
         
         return db_goal
     except Exception as e:
         print("error with inserting goals: ", e)
-        db.rollback() 
-        return False
+        raise
 
-def insert_phases(phases_data, goal_id, db: Session=Depends(get_db)): # insert phases into phase table. same logic as insert_data
+async def insert_phases(phases_data, goal_id, db: AsyncSession=Depends(get_async_db)): # insert phases into phase table with one INSERT ... RETURNING. returns (id, title, goal_id) rows in plan order
     try:
-        db_phases_list = []
-        
-        for phase in phases_data["phases"]:
-
-            db_phase = Phase(
-                title=phase["title"],
-                description=phase["description"],
-                start_date=phase["start_date"],
-                estimated_end_date=phase["end_date"],
-                goal_id=goal_id,
-            )
-            db_phases_list.append(db_phase)
-
-        db.add_all(db_phases_list)
-        db.commit()
-        
-        for db_phase in db_phases_list:
-            db.refresh(db_phase)
-            
-        return db_phases_list
+        phase_rows = [
+            {
+                "title": phase["title"],
+                "description": phase["description"],
+                "start_date": date.fromisoformat(phase["start_date"]),
+                "estimated_end_date": date.fromisoformat(phase["end_date"]),
+                "goal_id": goal_id,
+            }
+            for phase in phases_data["phases"]
+        ]
+        return (await db.execute(
+            insert(Phase).returning(Phase.id, Phase.title, Phase.goal_id, sort_by_parameter_order=True), phase_rows
+        )).all()
     except Exception as e:
         print("error with inserting phases: ", e)
-        db.rollback() 
-        return False
+        raise
 
-def insert_dailies(dailies_data: DailiesPost, db_phases_list, db: Session=Depends(get_db)): # insert dailies into dailies table. same logic as insert_data
+async def insert_dailies(dailies_data: DailiesPost, db_phases_list, user_id, db: AsyncSession=Depends(get_async_db)): # insert dailies into dailies table as batched multi-row INSERT ... RETURNING. returns the new ids
     try:
-        phase_title_to_id = {
-            phase.title: phase.id 
+        phase_title_to_phase = {
+            phase.title: phase
             for phase in db_phases_list
         }
         
-        db_dailies_list = []
+        daily_rows = []
         
         for daily_task in dailies_data.dailies:
             
             phase_title = daily_task.phase_title
-            phase_id = phase_title_to_id.get(phase_title)
+            phase = phase_title_to_phase.get(phase_title)
             
-            if phase_id is None:
+            if phase is None:
                 print(f"Error: Could not find Phase ID for title: {phase_title}")
                 continue
             
-            db_daily = Daily(
-                task_description=daily_task.task_description,
-                dailies_date=daily_task.dailies_date,
-                start_time=daily_task.start_time,
-                estimated_time_minutes=daily_task.estimated_time_minutes,
-                phase_id=phase_id,
-            )
-            db_dailies_list.append(db_daily)
+            daily_rows.append({
+                "task_description": daily_task.task_description,
+                "dailies_date": daily_task.dailies_date,
+                "start_time": daily_task.start_time,
+                "estimated_time_minutes": daily_task.estimated_time_minutes,
+                "phase_id": phase.id,
+                "goal_id": phase.goal_id,
+                "owner_id": user_id,
+            })
 
-        db.add_all(db_dailies_list)
-        db.commit()
+        daily_ids = (await db.execute(insert(Daily).returning(Daily.id, sort_by_parameter_order=True), daily_rows)).scalars().all() if daily_rows else []
+        await bump_data_version(user_id, db) # committed together with the goal, phases and dailies
         
-        for db_daily in db_dailies_list:
-            db.refresh(db_daily)
-            
-        return db_dailies_list
+        return daily_ids
         
     except Exception as e:
         print("Error with inserting dailies: ", e)
-        db.rollback() 
+        raise
+
+async def finalize_goal(session: ChatSession, dailies_data: DailiesPost, user_id, db: AsyncSession=Depends(get_async_db)): # goal, phases and dailies of a finished session, staged as one unit. returns the goal
+    # the helpers raise rather than roll back, so a failure reaches the request, which commits all of it or none
+    goal_db = await insert_goal(json.loads(session.goal_obj), json.loads(session.prereq_obj), user_id, db)
+    db_phases_list = await insert_phases(json.loads(session.phases_obj), goal_db.id, db)
+    await insert_dailies(dailies_data, db_phases_list, user_id, db)
+    return goal_db
+
+async def get_data_version(uid, db: AsyncSession=Depends(get_async_db)) -> int | None: # version of the user's goals, phases and dailies, see bump_data_version
+    return (await db.execute(select(User.data_version).where(User.id == uid))).scalar()
+
+async def bump_data_version(uid, db: AsyncSession=Depends(get_async_db)): # will not commit in this function, so that the bump lands in the same transaction as the write
+    await db.execute(update(User).where(User.id == uid).values(data_version=User.data_version + 1))
+
+async def insert_generation_job(user_id, session: ChatSession, phase_index, db: AsyncSession=Depends(get_async_db)): # queues generation of the dailies of the session's phase_index-th phase
+    try:
+        job = GenerationJob(
+            id=uuid.uuid4().hex,
+            status="queued",
+            phase_index=phase_index,
+            windows_total=0,
+            windows_done=0,
+            user_id=user_id,
+            session_id=session.id,
+        )
+        db.add(job)
+        return job
+    except Exception as e:
+        print("Error with inserting generation job: ", e)
+        raise
+
+async def get_generation_job(job_id, user_id, db: AsyncSession=Depends(get_async_db)) -> GenerationJob | None:
+    return (await db.execute(
+        select(GenerationJob).where(GenerationJob.id == job_id, GenerationJob.user_id == user_id)
+    )).scalars().first()
+
+async def get_active_generation_job(session_id, db: AsyncSession=Depends(get_async_db)) -> GenerationJob | None: # job still generating dailies for the session, if any
+    return (await db.execute(
+        select(GenerationJob)
+        .where(
+            GenerationJob.session_id == session_id,
+            GenerationJob.status.in_(["queued", "running"]),
+        )
+        .order_by(GenerationJob.created_at.desc())
+        .limit(1)
+    )).scalars().first()
+
+async def get_latest_generation_job(session_id, db: AsyncSession=Depends(get_async_db)) -> GenerationJob | None: # the session's newest job whatever its status, if any
+    return (await db.execute(
+        select(GenerationJob)
+        .where(GenerationJob.session_id == session_id)
+        .order_by(GenerationJob.created_at.desc())
+        .limit(1)
+    )).scalars().first()
+
+async def get_unfinished_generation_jobs(db: AsyncSession=Depends(get_async_db)) -> list[GenerationJob]: # queued or running jobs, the running ones may have been left by a process that stopped
+    return (await db.execute(
+        select(GenerationJob)
+        .where(GenerationJob.status.in_(["queued", "running"]))
+        .order_by(GenerationJob.created_at)
+    )).scalars().all()
+
+async def cancel_active_generation_jobs(session_id, reason, db: AsyncSession=Depends(get_async_db)): # staged, their workers stop at their next write
+    await db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.session_id == session_id, GenerationJob.status.in_(["queued", "running"]))
+        .values(status="cancelled", error=reason)
+    )
+    await db.flush()
+
+async def requeue_generation_job(job_id, db: AsyncSession=Depends(get_async_db)) -> bool: # staged, a failed or cancelled job queued again. False when it was not either
+    result = await db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id, GenerationJob.status.in_(["failed", "cancelled"]))
+        .values(status="queued", error=None, claim_token=None, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+async def claim_generation_job(job_id, claim_token, lease_seconds, db: AsyncSession=Depends(get_async_db)) -> GenerationJob | None:
+    """Marks the job running under claim_token if it is queued, or running without a write for lease_seconds (its process stopped).
+    One statement, so of several workers or processes picking up the same job only one gets it. None when another one did"""
+    claimed = (await db.execute(
+        update(GenerationJob)
+        .where(
+            GenerationJob.id == job_id,
+            (GenerationJob.status == "queued")
+            | ((GenerationJob.status == "running") & (GenerationJob.updated_at < func.now() - datetime.timedelta(seconds=lease_seconds))),
+        )
+        .values(status="running", claim_token=claim_token, updated_at=func.now())
+        .returning(GenerationJob.id)
+    )).scalar()
+    if claimed is None:
+        return None
+    return await db.get(GenerationJob, job_id, populate_existing=True)
+
+async def update_claimed_generation_job(job_id, claim_token, db: AsyncSession=Depends(get_async_db), **values) -> bool:
+    """Stages values on the job while claim_token still holds it. False once it was cancelled or claimed by another worker"""
+    result = await db.execute(
+        update(GenerationJob)
+        .where(GenerationJob.id == job_id, GenerationJob.claim_token == claim_token, GenerationJob.status == "running")
+        .values(**values, updated_at=func.now())
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount == 1
+
+
+async def get_grounding_cache_entry(key, db: AsyncSession=Depends(get_async_db)) -> GroundingCache | None: # unexpired cached search results for key, if any
+    return (await db.execute(
+        select(GroundingCache).where(GroundingCache.key == key, GroundingCache.expires_at > func.now())
+    )).scalars().first()
+
+async def upsert_grounding_cache_entry(key, resource_links, reference_text_map, expires_at, db: AsyncSession=Depends(get_async_db)): # also clears out expired entries
+    try:
+        statement = pg_insert(GroundingCache).values(
+            key=key,
+            resource_links=resource_links,
+            reference_text_map=reference_text_map,
+            expires_at=expires_at,
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[GroundingCache.key],
+            set_={
+                "resource_links": statement.excluded.resource_links,
+                "reference_text_map": statement.excluded.reference_text_map,
+                "created_at": func.now(),
+                "expires_at": statement.excluded.expires_at,
+            },
+        ))
+        await db.execute(delete(GroundingCache).where(GroundingCache.expires_at <= func.now()))
+        await db.commit()
+        return True
+    except Exception as e:
+        print("Error with caching grounding results: ", e)
+        await db.rollback()
+        return False
+
+async def hit_llm_cache_entry(key, db: AsyncSession=Depends(get_async_db)): # (response, latency_ms) cached for key if unexpired, marking it recently used in the same statement
+    try:
+        row = (await db.execute(
+            update(LLMResponseCache)
+            .where(LLMResponseCache.key == key, LLMResponseCache.expires_at > func.now())
+            .values(hits=LLMResponseCache.hits + 1, last_hit_at=func.now())
+            .returning(LLMResponseCache.response, LLMResponseCache.latency_ms)
+        )).first()
+        await db.commit()
+        return row
+    except Exception as e:
+        print("Error with reading llm response cache: ", e)
+        await db.rollback()
+        return None
+
+async def upsert_llm_cache_entry(key, phase_tag, response, latency_ms, expires_at, max_entries, db: AsyncSession=Depends(get_async_db)): # also evicts expired entries and the least recently used beyond max_entries
+    try:
+        statement = pg_insert(LLMResponseCache).values(
+            key=key,
+            phase_tag=phase_tag,
+            response=response,
+            latency_ms=latency_ms,
+            expires_at=expires_at,
+        )
+        await db.execute(statement.on_conflict_do_update(
+            index_elements=[LLMResponseCache.key],
+            set_={
+                "response": statement.excluded.response,
+                "latency_ms": statement.excluded.latency_ms,
+                "created_at": func.now(),
+                "last_hit_at": func.now(),
+                "expires_at": statement.excluded.expires_at,
+            },
+        ))
+        await db.execute(delete(LLMResponseCache).where(LLMResponseCache.expires_at <= func.now()))
+        overflow = select(LLMResponseCache.key).order_by(LLMResponseCache.last_hit_at.desc()).offset(max_entries)
+        await db.execute(delete(LLMResponseCache).where(LLMResponseCache.key.in_(overflow)))
+        await db.commit()
+        return True
+    except Exception as e:
+        print("Error with caching llm response: ", e)
+        await db.rollback()
         return False
@@ -160,6 +160,7 @@ Infer the existing plan structure from the chat history.
 4.  **No Questions/Chat:** You **MUST NOT** ask questions or provide conversational text. Your sole function is to output the revised JSON plan.,
 """
 
+SEARCH_INSTRUCTION_VERSION = 1 # bump whenever SEARCH_INSTRUCTION changes, cached grounding results of older versions are then ignored
 SEARCH_INSTRUCTION = """
 You are an **expert research assistant**.
 You required to perform **real-time Google Search** to find and verify the most current and relevant web resources.
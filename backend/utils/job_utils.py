@@ -0,0 +1,145 @@
+import asyncio, os, uuid
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db import AsyncSessionLocal, on_commit
+from models import ChatSession, GenerationJob
+from schemas import PhaseGeneration, DailyCreate, DailiesPost, JobStatus
+
+from utils.db_utils import (insert_generation_job, get_active_generation_job, get_unfinished_generation_jobs, cancel_active_generation_jobs,
+                            claim_generation_job, update_claimed_generation_job, requeue_generation_job, update_session_dailies)
+from utils.llm_utils import generate_dailies, merge_window_dailies, GenerationCancelled, DAILIES_GENERATION_MODE
+
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2")) # dailies generations running at once in this process
+JOB_LEASE_SECONDS = int(os.getenv("JOB_LEASE_SECONDS", "600")) # a running job without a progress write for this long is taken over, its process is gone
+
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+
+async def start_job_workers():
+    """Starts the worker pool and queues the unfinished jobs. Called once on app startup.
+    Every process queues them, the claim in run_dailies_job leaves each job to one worker and skips the ones still running elsewhere."""
+    global _queue
+    _queue = asyncio.Queue()
+    async with AsyncSessionLocal() as db:
+        for job in await get_unfinished_generation_jobs(db):
+            _queue.put_nowait(job.id)
+    for _ in range(JOB_WORKERS):
+        _workers.append(asyncio.create_task(_worker()))
+
+async def stop_job_workers():
+    """Cancels the workers. Jobs they were running stay 'running' in the db and are resumed on the next startup."""
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+async def enqueue_dailies_job(user_id, session: ChatSession, phase_index, db: AsyncSession) -> GenerationJob:
+    """Queues the generation of a phase's dailies. A session has one active job at a time: the job already generating
+    the same phase is returned, and one generating another phase is cancelled, the newer confirm wins"""
+    job = await get_active_generation_job(session.id, db)
+    if job and job.phase_index == phase_index:
+        return job
+    if job:
+        await cancel_active_generation_jobs(session.id, f"superseded by the generation of phase {phase_index + 1}", db)
+    job = await insert_generation_job(user_id, session, phase_index, db)
+    on_commit(db, lambda: _queue.put_nowait(job.id)) # the worker reads the job with its own session, so it has to be committed first
+    return job
+
+async def retry_dailies_job(job: GenerationJob, db: AsyncSession):
+    """Queues a failed or cancelled job again under the same id, the windows it saved are reused in parallel mode"""
+    if await requeue_generation_job(job.id, db): # a concurrent retry of the same job queues it once
+        on_commit(db, lambda: _queue.put_nowait(job.id))
+
+def get_job_status(job: GenerationJob) -> JobStatus:
+    if job.status == "completed":
+        percent_done = 100.0
+    elif job.windows_total:
+        percent_done = round(100 * job.windows_done / job.windows_total, 1)
+    else:
+        percent_done = 0.0
+    return JobStatus(
+        job_id=job.id,
+        status=job.status,
+        windows_done=job.windows_done,
+        windows_total=job.windows_total,
+        percent_done=percent_done,
+        dailies=DailiesPost.model_validate(job.result_obj) if job.result_obj else None,
+        error=job.error,
+    )
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await run_dailies_job(job_id)
+        except Exception as e:
+            print(f"dailies job {job_id} crashed: ", e)
+        finally:
+            _queue.task_done()
+
+async def run_dailies_job(job_id):
+    claim_token = uuid.uuid4().hex
+    mode = DAILIES_GENERATION_MODE
+    async with AsyncSessionLocal() as db:
+        job = await claim_generation_job(job_id, claim_token, JOB_LEASE_SECONDS, db)
+        if job is None: # finished, cancelled, or being run by another worker
+            await db.commit()
+            return
+        reuse_windows = mode == "parallel" and job.window_results # only the parallel path skips saved windows, sequential regenerates all of them
+        if job.window_results and not reuse_windows: # so the progress of this run does not count the saved ones
+            await update_claimed_generation_job(job_id, claim_token, db, window_results=None, windows_done=0, result_obj=None)
+        await db.commit()
+        session = await db.get(ChatSession, job.session_id)
+        user_phases = PhaseGeneration.model_validate_json(session.phases_obj)
+        phase_titles = [p.title for p in user_phases.phases]
+        phase = user_phases.phases[job.phase_index]
+        prior_dailies = DailiesPost.model_validate_json(session.dailies_obj).dailies if session.dailies_obj else []
+        window_results = { # windows finished before a restart
+            int(index): [DailyCreate.model_validate(d) for d in tasks]
+            for index, tasks in job.window_results.items()
+        } if reuse_windows else {}
+
+        def dailies_post(dailies):
+            return DailiesPost(status="dailies_generated", dailies=dailies, goal_phases=phase_titles, curr_phase=phase.title)
+
+        progress_lock = asyncio.Lock() # parallel windows can finish together, and the session takes one commit at a time
+
+        async def on_window_done(window_index, window_tasks, windows_total):
+            async with progress_lock:
+                window_results[window_index] = window_tasks
+                claimed = await update_claimed_generation_job(
+                    job_id, claim_token, db,
+                    window_results={str(i): [t.model_dump(mode="json") for t in tasks] for i, tasks in window_results.items()},
+                    windows_done=len(window_results),
+                    windows_total=windows_total,
+                    result_obj=dailies_post(prior_dailies + merge_window_dailies(window_results.values())).model_dump(mode="json"),
+                )
+                await db.commit()
+                if not claimed:
+                    raise GenerationCancelled(f"dailies job {job_id} was cancelled or taken over")
+
+        try:
+            new_dailies = await generate_dailies(session, phase, db, mode=mode, on_window_done=on_window_done, done_windows=window_results)
+            dailies_post_obj = dailies_post(new_dailies.dailies)
+            # the session's dailies are only written by the job still holding its claim, in the same commit as its completion
+            if await update_claimed_generation_job(job_id, claim_token, db, status="completed", result_obj=dailies_post_obj.model_dump(mode="json"),
+                                                   windows_done=GenerationJob.windows_total):
+                await update_session_dailies(session, dailies_post_obj, db)
+                await db.commit()
+            else:
+                await db.rollback()
+                print(f"dailies job {job_id} was cancelled or taken over, its result is dropped")
+        except GenerationCancelled as e:
+            await db.rollback()
+            print(e)
+        except Exception as e:
+            print(f"dailies job {job_id} failed: ", e)
+            await db.rollback()
+            await update_claimed_generation_job(job_id, claim_token, db, status="failed", error=str(e))
+            await db.commit()
@@ -0,0 +1,49 @@
+import os
+
+import httpx
+from google import genai
+from google.genai.client import AsyncClient
+from google.genai.types import HttpOptions
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv("LLM_KEEPALIVE_EXPIRY_SECONDS", "60"))
+
+_clients: dict[str, genai.Client] = {} # api key -> long lived client, shared by every request using that key
+
+def _new_client(api_key: str) -> genai.Client:
+    # our own httpx client so that the TLS connections to gemini are pooled and kept alive between calls
+    async_http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=LLM_MAX_CONNECTIONS,
+            max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=LLM_KEEPALIVE_EXPIRY_SECONDS,
+        ),
+    )
+    return genai.Client(api_key=api_key, http_options=HttpOptions(httpx_async_client=async_http_client))
+
+def init_llm_clients(api_keys):
+    """Creates one client per distinct API key. Called once on app startup."""
+    for api_key in api_keys:
+        if api_key and api_key not in _clients:
+            _clients[api_key] = _new_client(api_key)
+
+def get_llm_client(api_key: str) -> AsyncClient:
+    """Returns the async client for api_key, creating it if startup did not (e.g. scripts)"""
+    client = _clients.get(api_key)
+    if client is None:
+        client = _clients[api_key] = _new_client(api_key)
+    return client.aio
+
+async def close_llm_clients():
+    """Closes the pooled connections. Called once on app shutdown."""
+    for client in _clients.values():
+        try:
+            await client.aio.aclose()
+        except Exception as e:
+            print("error closing llm client: ", e)
+    _clients.clear()
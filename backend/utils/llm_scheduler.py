@@ -0,0 +1,391 @@
+import asyncio, contextvars, random, re, time
+from collections import OrderedDict, deque
+
+from google.genai.errors import APIError
+
+import os
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+# quota of each gemini api key, 0 turns that limit off. the defaults are the free tier of gemini-2.5-flash-lite
+LLM_RPM = int(os.getenv("LLM_RPM", "15"))
+LLM_TPM = int(os.getenv("LLM_TPM", "250000"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5")) # retries of a call answered with 429 or 503
+LLM_BACKOFF_BASE_SECONDS = float(os.getenv("LLM_BACKOFF_BASE_SECONDS", "1"))
+LLM_BACKOFF_MAX_SECONDS = float(os.getenv("LLM_BACKOFF_MAX_SECONDS", "30"))
+LLM_OUTPUT_TOKENS_ESTIMATE = int(os.getenv("LLM_OUTPUT_TOKENS_ESTIMATE", "2048")) # reserved per call until the real usage is known
+
+def parse_phase_seconds(value) -> dict[str, float]: # "phase=seconds,phase=seconds"
+    return {phase.strip(): float(seconds) for phase, seconds in (entry.split("=") for entry in value.split(",") if entry.strip())}
+
+# time budget of a call by phase tag, from queueing to the answer (to the first chunk for a stream), retries and hedges included
+LLM_DEADLINE_SECONDS = parse_phase_seconds(os.getenv("LLM_DEADLINE_SECONDS",
+    "define_goal=30,get_prerequisites=30,generate_phases=60,refine_phases=60,grounding=60,generate_dailies=90"))
+LLM_DEFAULT_DEADLINE_SECONDS = float(os.getenv("LLM_DEFAULT_DEADLINE_SECONDS", "60")) # phases missing from LLM_DEADLINE_SECONDS
+# a call still unanswered after the LLM_HEDGE_QUANTILE of its phase's recent latencies is sent a second time, first answer wins
+LLM_HEDGE_MAX_RATE = float(os.getenv("LLM_HEDGE_MAX_RATE", "0.05")) # hedges per call on a key at most, 0 turns hedging off
+LLM_HEDGE_BURST = float(os.getenv("LLM_HEDGE_BURST", "2")) # hedges a key can save up while calls are fast
+LLM_HEDGE_QUANTILE = float(os.getenv("LLM_HEDGE_QUANTILE", "0.95"))
+LLM_HEDGE_MIN_SECONDS = float(os.getenv("LLM_HEDGE_MIN_SECONDS", "1")) # never hedged sooner, whatever the quantile
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20")) # a phase is not hedged before this many answers
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200")) # latest answers of a phase the quantile is taken over
+# a key failing LLM_BREAKER_FAILURES calls in a row (5xx, errors, deadlines) fails its calls at once for the cooldown
+LLM_BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+LLM_BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "30"))
+
+RETRYABLE_CODES = (429, 503)
+
+# who a call is queued for. calls of different callers on the same key are admitted round robin, so one user's
+# dailies generation cannot hold back everyone else's chat turns. set per request or job, see llm_utils
+llm_caller: contextvars.ContextVar = contextvars.ContextVar("llm_caller", default=None)
+
+llm_queue_stats: dict[str, dict] = {} # key name -> counters of its scheduler, see KeyScheduler.stats
+
+class LLMOverloadedError(Exception):
+    """A call still throttled after LLM_MAX_RETRIES retries. retry_after is the last backoff in seconds"""
+    def __init__(self, key_name, retry_after):
+        super().__init__(f"gemini key {key_name} is over quota, retry after {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class LLMCircuitOpenError(LLMOverloadedError):
+    """A call refused without trying, its key failed too often lately. retry_after is the rest of the cooldown"""
+    def __init__(self, key_name, retry_after):
+        Exception.__init__(self, f"gemini key {key_name} is failing, circuit open for {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+class LLMDeadlineError(LLMOverloadedError):
+    """A call with no answer within its phase's deadline, see LLM_DEADLINE_SECONDS"""
+    def __init__(self, key_name, phase, retry_after):
+        Exception.__init__(self, f"gemini call of {phase} on key {key_name} missed its deadline")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """per_period units refilled evenly over period seconds. a take can overdraw it, which delays the next admissions"""
+    def __init__(self, per_period, period=60):
+        self.capacity = per_period
+        self.rate = per_period / period
+        self.level = float(per_period)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now) -> float: # seconds until amount can be taken, calls bigger than the bucket wait for a full one
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+class LatencyTracker:
+    """Latencies of the latest LLM_HEDGE_WINDOW answers of one phase"""
+    def __init__(self):
+        self.samples = deque(maxlen=LLM_HEDGE_WINDOW)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    def hedge_delay(self) -> float | None: # seconds after which a call of the phase is hedged, None while there are too few answers
+        if len(self.samples) < LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return max(ordered[min(int(len(ordered) * LLM_HEDGE_QUANTILE), len(ordered) - 1)], LLM_HEDGE_MIN_SECONDS)
+
+_latencies: dict[str, LatencyTracker] = {} # phase tag -> its answers, shared by every key
+
+def get_latency_tracker(phase) -> LatencyTracker:
+    return _latencies.setdefault(phase or "other", LatencyTracker())
+
+def llm_hedge_delays() -> dict[str, float]: # phase -> its current hedge delay, for the phases with enough answers
+    return {phase: delay for phase, tracker in _latencies.items() if (delay := tracker.hedge_delay()) is not None}
+
+class CircuitBreaker:
+    """Fails the calls of a key at once after LLM_BREAKER_FAILURES failures in a row, for LLM_BREAKER_COOLDOWN_SECONDS.
+    After the cooldown a single trial call goes through (half open): an answer closes the circuit, a failure opens it again.
+    Any answer from gemini counts as a success, 429s and 4xx included, only 5xx, errors and missed deadlines are failures"""
+    def __init__(self, name, stats):
+        self.name = name
+        self.stats = stats
+        self.failures = 0 # in a row
+        self.open_until = None # monotonic time the cooldown ends, None while closed
+        self.trial_started = None # of the half open trial call, a trial that never reports back is replaced after a cooldown
+
+    def check(self):
+        if self.open_until is None:
+            return
+        now = time.monotonic()
+        if now < self.open_until or (self.trial_started is not None and now - self.trial_started < LLM_BREAKER_COOLDOWN_SECONDS):
+            self.stats["breaker_rejected"] += 1
+            raise LLMCircuitOpenError(self.name, max(self.open_until - now, LLM_BACKOFF_BASE_SECONDS))
+        self.trial_started = now
+
+    def success(self):
+        self.failures = 0
+        self.open_until = self.trial_started = None
+        self.stats["circuit_open"] = 0
+
+    def failure(self):
+        self.failures += 1
+        if self.trial_started is not None or (self.open_until is None and self.failures >= LLM_BREAKER_FAILURES):
+            print(f"gemini {self.name} key failed {self.failures} calls in a row, circuit open for {LLM_BREAKER_COOLDOWN_SECONDS:.0f}s")
+            self.open_until = time.monotonic() + LLM_BREAKER_COOLDOWN_SECONDS
+            self.trial_started = None
+            self.stats["breaker_opened"] += 1
+            self.stats["circuit_open"] = 1
+
+    def record(self, error: Exception): # outcome of a call that raised
+        if isinstance(error, APIError) and error.code < 500:
+            self.success()
+        else:
+            self.failure()
+
+class KeyScheduler:
+    """Admission control for one api key: a request and a token bucket, and a queue per caller served round robin"""
+    def __init__(self, name, rpm=LLM_RPM, tpm=LLM_TPM, period=60): # period is only shortened by benchmarks
+        self.name = name
+        self.requests = TokenBucket(rpm, period)
+        self.tokens = TokenBucket(tpm, period)
+        self.paused_until = 0.0 # set from a 429's retry delay, nothing is admitted on this key before it
+        self.hedge_credit = LLM_HEDGE_BURST # earned LLM_HEDGE_MAX_RATE per call, a hedge spends 1
+        self._waiting: OrderedDict[object, deque] = OrderedDict() # caller -> [(future, tokens)], in round robin order
+        self._dispatcher: asyncio.Task | None = None
+        self.stats = llm_queue_stats.setdefault(name, { # shared by keys with the same name
+            "queued": 0, # calls waiting for admission right now
+            "max_queued": 0,
+            "admitted": 0,
+            "wait_seconds": 0.0, # total time admitted calls spent queued
+            "throttled": 0, # 429 answers
+            "unavailable": 0, # 503 answers
+            "retries": 0,
+            "failures": 0, # calls given up on after LLM_MAX_RETRIES
+            "hedges": 0, # second calls sent for a slow one
+            "hedge_wins": 0, # of them answered first
+            "deadline_exceeded": 0,
+            "breaker_opened": 0,
+            "breaker_rejected": 0, # calls failed at once while the circuit was open
+            "circuit_open": 0, # 1 while calls are refused
+        })
+        self.breaker = CircuitBreaker(name, self.stats)
+
+    async def acquire(self, caller, tokens):
+        future = asyncio.get_running_loop().create_future()
+        self._waiting.setdefault(caller, deque()).append((future, tokens))
+        self.stats["queued"] += 1
+        self.stats["max_queued"] = max(self.stats["max_queued"], self.stats["queued"])
+        if self._dispatcher is None:
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        queued_at = time.monotonic()
+        try:
+            await future
+        except asyncio.CancelledError: # the dispatcher skips it, a granted admission is lost with it
+            if future.cancelled():
+                self.stats["queued"] -= 1
+            raise
+        self.stats["wait_seconds"] += time.monotonic() - queued_at
+
+    def try_acquire(self, tokens) -> bool: # admits at once or not at all, for hedges, which are not worth queueing for
+        now = time.monotonic()
+        if self._waiting or self.paused_until > now or self.requests.wait_time(1, now) or self.tokens.wait_time(tokens, now):
+            return False
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        return True
+
+    def take_hedge(self, tokens) -> bool:
+        if self.hedge_credit < 1 or not self.try_acquire(tokens):
+            return False
+        self.hedge_credit -= 1
+        self.stats["hedges"] += 1
+        return True
+
+    async def _dispatch(self):
+        try:
+            while self._waiting:
+                caller, queue = next(iter(self._waiting.items()))
+                future, tokens = queue[0]
+                if future.cancelled():
+                    queue.popleft()
+                    if not queue:
+                        del self._waiting[caller]
+                    continue
+                now = time.monotonic()
+                wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now), self.paused_until - now)
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+                self.requests.take(1)
+                self.tokens.take(tokens)
+                queue.popleft()
+                future.set_result(None)
+                self.stats["queued"] -= 1
+                self.stats["admitted"] += 1
+                if queue:
+                    self._waiting.move_to_end(caller) # the next call of this caller goes behind every other caller's
+                else:
+                    del self._waiting[caller]
+        finally:
+            self._dispatcher = None
+
+    def settle(self, estimated, used): # the bucket was charged the estimate, correct it with the usage gemini reported
+        if used is not None:
+            self.tokens.take(used - estimated)
+
+    def throttle(self, code, delay):
+        if code == 429:
+            self.stats["throttled"] += 1
+            self.paused_until = max(self.paused_until, time.monotonic() + delay) # the queued calls would get a 429 as well
+        else:
+            self.stats["unavailable"] += 1
+
+_schedulers: dict[str, KeyScheduler] = {} # api key -> its scheduler
+
+def get_key_scheduler(api_key, name) -> KeyScheduler:
+    scheduler = _schedulers.get(api_key)
+    if scheduler is None:
+        scheduler = _schedulers[api_key] = KeyScheduler(name)
+    return scheduler
+
+def estimate_tokens(contents, config) -> int: # about 4 characters a token, plus room for the reply
+    return (len(str(contents)) + len(str(config.get("system_instruction", "")))) // 4 + LLM_OUTPUT_TOKENS_ESTIMATE
+
+def usage_tokens(response) -> int | None:
+    usage = getattr(response, "usage_metadata", None)
+    return usage.total_token_count if usage and usage.total_token_count else None
+
+def retry_delay(error: APIError, attempt) -> float:
+    """Full jitter exponential backoff, but never shorter than the RetryInfo delay of a 429"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX_SECONDS, LLM_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    match = re.search(r"'retryDelay': '(\d+(?:\.\d+)?)s'", str(error.details))
+    if match:
+        delay = max(delay, float(match.group(1)))
+    return delay
+
+async def backoff(scheduler: KeyScheduler, error: APIError, attempt):
+    """Sleeps before the retry of a call that failed with error, raises when it is not worth retrying"""
+    if error.code not in RETRYABLE_CODES:
+        raise error
+    delay = retry_delay(error, attempt)
+    scheduler.throttle(error.code, delay)
+    if attempt == LLM_MAX_RETRIES:
+        scheduler.stats["failures"] += 1
+        raise LLMOverloadedError(scheduler.name, delay) from error
+    scheduler.stats["retries"] += 1
+    print(f"gemini {error.code} on {scheduler.name} key, retry {attempt+1} in {delay:.1f}s")
+    await asyncio.sleep(delay)
+
+def deadline_of(phase) -> float: # event loop time a call of phase has to be answered by
+    return asyncio.get_running_loop().time() + LLM_DEADLINE_SECONDS.get(phase, LLM_DEFAULT_DEADLINE_SECONDS)
+
+def missed_deadline(scheduler: KeyScheduler, phase, calling) -> LLMDeadlineError:
+    scheduler.stats["deadline_exceeded"] += 1
+    if calling: # gemini had the call and did not answer in time, rather than the call waiting on the quota
+        scheduler.breaker.failure()
+    return LLMDeadlineError(scheduler.name, phase or "other", max(scheduler.paused_until - time.monotonic(), LLM_BACKOFF_BASE_SECONDS))
+
+async def hedged_call(scheduler: KeyScheduler, phase, tokens, call):
+    """Awaits call(), sending it a second time when still unanswered after the phase's hedge delay if the key has hedge
+    credit and quota to spare right away. The first answer wins and the other call is cancelled"""
+    latency = get_latency_tracker(phase)
+    delay = latency.hedge_delay() if LLM_HEDGE_MAX_RATE > 0 else None
+    scheduler.hedge_credit = min(LLM_HEDGE_BURST, scheduler.hedge_credit + LLM_HEDGE_MAX_RATE)
+    start = time.monotonic()
+    first = asyncio.create_task(call())
+    pending = {first}
+    try:
+        if delay is not None:
+            done, _ = await asyncio.wait(pending, timeout=delay)
+            if not done and scheduler.take_hedge(tokens):
+                print(f"gemini {phase} call on {scheduler.name} key unanswered after {delay:.1f}s, hedged")
+                pending.add(asyncio.create_task(call()))
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            errors = {task: task.exception() for task in done}
+            winner = next((task for task, task_error in errors.items() if task_error is None), None)
+            if winner is not None:
+                if winner is not first:
+                    scheduler.stats["hedge_wins"] += 1
+                latency.add(time.monotonic() - start)
+                scheduler.breaker.success()
+                return winner.result()
+            error = error or next(iter(errors.values()))
+        scheduler.breaker.record(error)
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+async def call_with_admission(api_key, name, contents, config, call, phase=None):
+    """Awaits call() once admitted on api_key's quota, hedged when slow and retrying 429 and 503 answers with backoff,
+    all within phase's deadline. Fails at once while the key's circuit is open"""
+    scheduler = get_key_scheduler(api_key, name)
+    estimated = estimate_tokens(contents, config)
+    deadline = asyncio.timeout_at(deadline_of(phase))
+    calling = False
+    try:
+        async with deadline:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                scheduler.breaker.check()
+                await scheduler.acquire(llm_caller.get(), estimated)
+                calling = True
+                try:
+                    response = await hedged_call(scheduler, phase, estimated, call)
+                except APIError as e:
+                    calling = False
+                    await backoff(scheduler, e, attempt)
+                    continue
+                scheduler.settle(estimated, usage_tokens(response))
+                return response
+    except TimeoutError:
+        if not deadline.expired(): # raised by the call itself
+            raise
+        raise missed_deadline(scheduler, phase, calling) from None
+
+async def stream_with_admission(api_key, name, contents, config, open_stream, phase=None):
+    """Streaming counterpart of call_with_admission. The deadline is for the first chunk, and streams are not hedged:
+    the reply of the losing stream would be paid for as well. Only failures before the first chunk are retried,
+    after that the caller has already seen part of the reply"""
+    scheduler = get_key_scheduler(api_key, name)
+    estimated = estimate_tokens(contents, config)
+    deadline = asyncio.timeout_at(deadline_of(phase))
+    calling = False
+    try:
+        async with deadline:
+            for attempt in range(LLM_MAX_RETRIES + 1):
+                scheduler.breaker.check()
+                await scheduler.acquire(llm_caller.get(), estimated)
+                calling = True
+                try:
+                    stream = aiter(await open_stream())
+                    first = await anext(stream)
+                except StopAsyncIteration:
+                    first = None
+                except APIError as e:
+                    calling = False
+                    scheduler.breaker.record(e)
+                    await backoff(scheduler, e, attempt)
+                    continue
+                except Exception:
+                    scheduler.breaker.failure()
+                    raise
+                scheduler.breaker.success()
+                break
+    except TimeoutError:
+        if not deadline.expired():
+            raise
+        raise missed_deadline(scheduler, phase, calling) from None
+    if first is None:
+        return
+    last = first
+    yield first
+    async for chunk in stream:
+        last = chunk
+        yield chunk
+    scheduler.settle(estimated, usage_tokens(last)) # the final chunk carries the usage of the whole reply
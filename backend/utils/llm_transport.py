@@ -0,0 +1,145 @@
+import asyncio, datetime, hashlib, json, random, re, time, typing
+from pathlib import Path
+
+from google.genai.types import GenerateContentResponse, Candidate, Content, Part
+
+from utils.llm_clients import get_llm_client
+
+import os
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+# where llm_utils sends gemini requests:
+#   live   - gemini itself
+#   record - gemini, saving every response to a fixture file in LLM_FIXTURES_DIR
+#   replay - the fixture files, gemini is never called. for load tests without spending quota
+LLM_TRANSPORT = os.getenv("LLM_TRANSPORT", "live")
+LLM_FIXTURES_DIR = Path(os.getenv("LLM_FIXTURES_DIR", Path(__file__).resolve().parent.parent / "benchmarks" / "fixtures" / "llm"))
+LLM_REPLAY_LATENCY_MS = os.getenv("LLM_REPLAY_LATENCY_MS", "recorded") # "recorded" waits as long as the real call took, or a fixed number of ms
+LLM_REPLAY_JITTER = float(os.getenv("LLM_REPLAY_JITTER", "0.2")) # replay latency varies by up to this fraction either way
+
+# fixtures store dates relative to the day they were recorded on, so a replay on a later day plans from that day instead
+_DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+_RELATIVE_DATE = re.compile(r"\{\{D([+-]\d+)\}\}")
+
+def relative_dates(text: str, today: datetime.date) -> str: # 2026-10-20 -> {{D+2}}
+    def replace(match):
+        try:
+            return "{{D%+d}}" % (datetime.date.fromisoformat(match.group(0)) - today).days
+        except ValueError: # looks like a date but is not one
+            return match.group(0)
+    return _DATE.sub(replace, text)
+
+def absolute_dates(text: str, today: datetime.date) -> str: # {{D+2}} -> 2026-10-20
+    return _RELATIVE_DATE.sub(lambda match: str(today + datetime.timedelta(days=int(match.group(1)))), text)
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", exclude_none=True)
+    return str(value)
+
+def request_kind(config) -> str: # fixture folder, named after the reply type of the request
+    if "tools" in config:
+        return "grounding"
+    schema = config.get("response_schema")
+    if schema is None:
+        return "text"
+    return getattr(schema, "__name__", None) or "_".join(option.__name__ for option in typing.get_args(schema))
+
+def fixture_key(model, contents, config, today: datetime.date) -> str:
+    raw = json.dumps([model, config.get("system_instruction"), contents, str(config.get("response_schema"))], sort_keys=True, default=_jsonable)
+    return hashlib.sha256(relative_dates(raw, today).encode()).hexdigest()[:32]
+
+def _assemble(chunks: list[GenerateContentResponse]) -> GenerateContentResponse: # one response holding a stream's text and final usage
+    text = "".join(chunk.text or "" for chunk in chunks)
+    return GenerateContentResponse(
+        candidates=[Candidate(content=Content(parts=[Part.from_text(text=text)], role="model"))],
+        usage_metadata=chunks[-1].usage_metadata if chunks else None,
+    )
+
+class RecordingModels:
+    """Calls gemini like client.aio.models and writes each response to LLM_FIXTURES_DIR/<kind>/<key>.json"""
+    def __init__(self, models):
+        self._models = models
+
+    def _save(self, model, contents, config, response: GenerateContentResponse, chunks, latency):
+        today = datetime.date.today()
+        path = LLM_FIXTURES_DIR / request_kind(config) / f"{fixture_key(model, contents, config, today)}.json"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fixture = {
+            "latency_ms": round(latency * 1000),
+            "response": response.model_dump(mode="json", exclude_none=True),
+            "chunks": [chunk.model_dump(mode="json", exclude_none=True) for chunk in chunks] if chunks else None,
+        }
+        path.write_text(relative_dates(json.dumps(fixture, indent=1), today))
+
+    async def generate_content(self, model, contents, config):
+        start = time.perf_counter()
+        response = await self._models.generate_content(model=model, contents=contents, config=config)
+        await asyncio.to_thread(self._save, model, contents, config, response, None, time.perf_counter() - start) # file io off the event loop
+        return response
+
+    async def generate_content_stream(self, model, contents, config):
+        start = time.perf_counter()
+        stream = await self._models.generate_content_stream(model=model, contents=contents, config=config)
+        async def record():
+            chunks = []
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+            await asyncio.to_thread(self._save, model, contents, config, _assemble(chunks), chunks, time.perf_counter() - start)
+        return record()
+
+class ReplayModels:
+    """Serves the fixtures written by RecordingModels. A request recorded as is gets its own response, any other
+    gets the next fixture of the same kind, so simulated users that stray from the recorded script still get answers"""
+    def __init__(self):
+        self._fallback: dict[str, int] = {} # kind -> next fixture to hand out
+        self.stats = {"replayed": 0, "unmatched": 0} # unmatched calls got another request's response
+
+    async def _load(self, model, contents, config): # file io runs in threads, the counters are only touched on the event loop
+        today = datetime.date.today()
+        kind = request_kind(config)
+        path = LLM_FIXTURES_DIR / kind / f"{fixture_key(model, contents, config, today)}.json"
+        self.stats["replayed"] += 1
+        if not await asyncio.to_thread(path.exists):
+            self.stats["unmatched"] += 1
+            candidates = await asyncio.to_thread(lambda: sorted((LLM_FIXTURES_DIR / kind).glob("*.json")))
+            if not candidates:
+                raise LookupError(f"no recorded {kind} responses in {LLM_FIXTURES_DIR}")
+            index = self._fallback.get(kind, 0)
+            self._fallback[kind] = index + 1
+            path = candidates[index % len(candidates)]
+        return json.loads(absolute_dates(await asyncio.to_thread(path.read_text), today))
+
+    @staticmethod
+    def _latency(fixture) -> float:
+        latency_ms = fixture["latency_ms"] if LLM_REPLAY_LATENCY_MS == "recorded" else float(LLM_REPLAY_LATENCY_MS)
+        return latency_ms / 1000 * random.uniform(1 - LLM_REPLAY_JITTER, 1 + LLM_REPLAY_JITTER)
+
+    async def generate_content(self, model, contents, config):
+        fixture = await self._load(model, contents, config)
+        await asyncio.sleep(self._latency(fixture))
+        return GenerateContentResponse.model_validate(fixture["response"])
+
+    async def generate_content_stream(self, model, contents, config):
+        fixture = await self._load(model, contents, config)
+        chunks = [GenerateContentResponse.model_validate(chunk) for chunk in fixture["chunks"] or [fixture["response"]]]
+        latency = self._latency(fixture)
+        async def replay():
+            for chunk in chunks: # the recorded time spread evenly over the chunks
+                await asyncio.sleep(latency / len(chunks))
+                yield chunk
+        return replay()
+
+_replay_models = ReplayModels()
+
+def get_llm_models(api_key: str):
+    """The models API (generate_content, generate_content_stream) requests for api_key go to, see LLM_TRANSPORT"""
+    if LLM_TRANSPORT == "replay":
+        return _replay_models
+    if LLM_TRANSPORT == "record":
+        return RecordingModels(get_llm_client(api_key).models)
+    return get_llm_client(api_key).models
@@ -1,11 +1,10 @@
-import datetime, pickle, json, re
+import asyncio, datetime, json, re, time
 from datetime import date
 
 from fastapi import Depends
-from pydantic import TypeAdapter
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from db import get_db
+from db import get_async_db
 
 from models import ChatSession
 from schemas import (FollowUp,
@@ -14,10 +13,16 @@ from schemas import (FollowUp,
                             PhaseGeneration, PhaseCreate,
                             DailiesGeneration, DailiesPost,)
 
-from utils.instruction_chain import BASE_INSTRUCTION, PHASE_INSTRUCTIONS, SEARCH_INSTRUCTION, DAILIES_GENERATION_INSTRUCTION
+from utils.prompt_registry import BASE_PROMPT, PHASE_PROMPTS, SEARCH_PROMPT, DAILIES_PROMPT, RESPONSE_ADAPTER
+from utils.llm_transport import LLM_TRANSPORT, get_llm_models
+from utils.llm_scheduler import llm_caller, call_with_admission, stream_with_admission
+from utils.db_utils import get_chat_history
+from utils.context_encoder import encode_dailies_context, encode_phases_outline
+from utils.cache_utils import (grounding_cache_key, get_cached_grounding, store_grounding,
+                               LLM_CACHE_PHASES, llm_cache_key, get_cached_llm_response, store_llm_response)
+from utils.metrics import observe_llm_call, GROUNDING_SECONDS, DAILIES_WINDOWS
 
-from google import genai
-from google.genai.types import Content, Part, Tool, GoogleSearch
+from google.genai.types import Content, Part, Tool, GoogleSearch, Candidate, GenerateContentResponse
 
 import os
 from pathlib import Path
@@ -31,41 +36,115 @@ PREREQ_API_KEY=os.getenv("PREREQ_API_KEY")
 PHASES_API_KEY=os.getenv("PHASES_API_KEY")
 GROUNDING_API_KEY=os.getenv("GROUNDING_API_KEY")
 DAILIES_API_KEY=os.getenv("DAILIES_API_KEY")
+LLM_API_KEYS = [DEFINITIONS_API_KEY, PREREQ_API_KEY, PHASES_API_KEY, GROUNDING_API_KEY, DAILIES_API_KEY]
+LLM_KEY_NAMES = {api_key: name for name, api_key in reversed([ # label of each key in llm_queue_stats, a key shared by several roles keeps the first name
+    ("definitions", DEFINITIONS_API_KEY), ("prereq", PREREQ_API_KEY), ("phases", PHASES_API_KEY), ("grounding", GROUNDING_API_KEY), ("dailies", DAILIES_API_KEY)])}
 
-def get_llm_response(session: ChatSession, user_input: str, db: Session=Depends(get_db)):
+LLM_MODEL = 'gemini-2.5-flash-lite'
+
+DAILIES_GENERATION_MODE = os.getenv("DAILIES_GENERATION_MODE", "parallel") # "parallel" or "sequential"
+DAILIES_MAX_CONCURRENCY = int(os.getenv("DAILIES_MAX_CONCURRENCY", "4")) # max window calls in flight per generation
+DAILIES_WINDOW_DAYS = 14
+
+class GenerationCancelled(Exception):
+    """Raised by an on_window_done callback to stop a dailies generation, without the sequential fallback"""
+
+async def generate_content(api_key, contents, config, phase_tag=None):
+    # every gemini call goes through here, on the pooled client for its api key, once the key's quota admits it.
+    # phase_tag labels the call's metrics and sets its deadline and hedge delay (see llm_scheduler), and with phase_tag
+    # in LLM_CACHE_PHASES a request seen before is answered from llm_response_cache without calling gemini
+    cache_key = llm_cache_key(LLM_MODEL, contents, config) if phase_tag in LLM_CACHE_PHASES else None
+    if cache_key:
+        cached = await get_cached_llm_response(cache_key, phase_tag)
+        if cached is not None:
+            return cached
+
+    models = get_llm_models(api_key) # gemini, or fixtures depending on LLM_TRANSPORT
+    key_name = LLM_KEY_NAMES.get(api_key, "other")
+    async def call(): # timed from here, the wait for admission is not the model's latency
+        call_start = time.perf_counter()
+        response = await models.generate_content(model=LLM_MODEL, contents=contents, config=config)
+        observe_llm_call(phase_tag, key_name, time.perf_counter() - call_start, response)
+        return response
+
+    start = time.perf_counter()
+    response = await call_with_admission(api_key, key_name, contents, config, call, phase_tag)
+    if cache_key and is_cacheable(response.text):
+        await store_llm_response(cache_key, phase_tag, response, time.perf_counter() - start)
+    return response
+
+async def generate_content_stream(api_key, contents, config, phase_tag=None): # streaming counterpart of generate_content, yields response chunks
+    cache_key = llm_cache_key(LLM_MODEL, contents, config) if phase_tag in LLM_CACHE_PHASES else None
+    if cache_key:
+        cached = await get_cached_llm_response(cache_key, phase_tag)
+        if cached is not None:
+            yield cached # the whole reply as one chunk
+            return
+
+    models = get_llm_models(api_key)
+    key_name = LLM_KEY_NAMES.get(api_key, "other")
+    call_start = None
+    def open_stream():
+        nonlocal call_start
+        call_start = time.perf_counter() # of the last attempt, once admitted
+        return models.generate_content_stream(model=LLM_MODEL, contents=contents, config=config)
+
+    start = time.perf_counter()
+    text = []
+    chunk = None
+    async for chunk in stream_with_admission(api_key, key_name, contents, config, open_stream, phase_tag):
+        text.append(chunk.text or "")
+        yield chunk
+    if call_start is not None:
+        observe_llm_call(phase_tag, key_name, time.perf_counter() - call_start, chunk) # the final chunk carries the usage
+    text = "".join(text)
+    if cache_key and is_cacheable(text):
+        response = GenerateContentResponse(candidates=[Candidate(content=Content(parts=[Part.from_text(text=text)], role='model'))])
+        await store_llm_response(cache_key, phase_tag, response, time.perf_counter() - start)
+
+def is_cacheable(text) -> bool: # replies that do not parse are left out of the cache, so that a retry asks gemini again
+    try:
+        parse_response_text(text or "")
+        return True
+    except Exception:
+        return False
+
+async def get_llm_response(session: ChatSession, user_input: str, db: AsyncSession=Depends(get_async_db)):
+    llm_caller.set(session.id) # queued fairly against other sessions' calls on the same key
+    api_key, contents, config = await build_llm_request(session, user_input, db)
+    return await generate_content(api_key, contents=contents, config=config, phase_tag=session.phase_tag)
+
+async def stream_llm_response(session: ChatSession, user_input: str, db: AsyncSession=Depends(get_async_db)):
+    llm_caller.set(session.id)
+    api_key, contents, config = await build_llm_request(session, user_input, db)
+    async for chunk in generate_content_stream(api_key, contents=contents, config=config, phase_tag=session.phase_tag):
+        yield chunk
+
+async def build_llm_request(session: ChatSession, user_input: str, db: AsyncSession): # (api key, contents, config) of the chat turn for the session's current phase
     
     current_phase = session.phase_tag
     
     if current_phase == "define_goal":    
-        client = genai.Client(api_key=DEFINITIONS_API_KEY)
+        api_key = DEFINITIONS_API_KEY
 
         response_schema = FollowUp | DefinitionsCreate
-        prompt_template = PHASE_INSTRUCTIONS["define_goal"]
-        format_args = {
-            "followUp": FollowUp.model_json_schema(),
-            "definitionsCreate": DefinitionsCreate.model_json_schema()
-        }
+        format_args = {}
 
     elif current_phase == "get_prerequisites":
-        client = genai.Client(api_key=PREREQ_API_KEY)
+        api_key = PREREQ_API_KEY
 
         response_schema = FollowUp | GoalPrerequisites
-        prompt_template = PHASE_INSTRUCTIONS["get_prerequisites"]
         format_args = {
             "goal_context": session.goal_obj,
-            "followUp": FollowUp.model_json_schema(),
-            "goalPrerequisites": GoalPrerequisites.model_json_schema()
         }
 
     elif current_phase in ["generate_phases", "refine_phases"]:
-        client = genai.Client(api_key=PHASES_API_KEY)
+        api_key = PHASES_API_KEY
 
         response_schema = PhaseGeneration
-        prompt_template = PHASE_INSTRUCTIONS[current_phase]
         format_args = {
             "goal_context": session.goal_obj,
             "prereq_context": session.prereq_obj,
-            "phaseGeneration": PhaseGeneration.model_json_schema()
         }
     
     else:
@@ -73,34 +152,37 @@ def get_llm_response(session: ChatSession, user_input: str, db: Session=Depends(
 
     DATE_FORMAT = '%Y-%m-%d'
     current_date_str = date.today().strftime(DATE_FORMAT)
-    full_system_instruction = BASE_INSTRUCTION.format(current_date_str=current_date_str) + \
-                              prompt_template.format(**format_args)
+    full_system_instruction = BASE_PROMPT.render(current_date_str=current_date_str) + \
+                              PHASE_PROMPTS[current_phase].render(**format_args)
 
-    chat_history = pickle.loads(session.session_data)
+    chat_history = await get_chat_history(session, db)
     new_user_message = Content(
         parts=[Part.from_text(text=user_input)],
         role='user'
     )
     chat_history.append(new_user_message)
 
-    return client.models.generate_content(
-        model='gemini-2.5-flash-lite',
-        contents=chat_history,
-        config={
-            "system_instruction": full_system_instruction,
-            "response_mime_type": "application/json",
-            "response_schema": response_schema,
-        },
-    )
+    config = {
+        "system_instruction": full_system_instruction,
+        "response_mime_type": "application/json",
+        "response_schema": response_schema,
+    }
+    return api_key, chat_history, config
 
 # backend/utils/llm_utils.py
 
-def fetch_phase_resources(session: ChatSession, phase: PhaseCreate):
-    client = genai.Client(api_key=GROUNDING_API_KEY)
+async def fetch_phase_resources(session: ChatSession, phase: PhaseCreate):
+    # the search results only depend on the goal, prereqs and phase, so regenerating a phase reuses them
+    start = time.perf_counter()
+    cache_key = grounding_cache_key(session.goal_obj, session.prereq_obj, phase.title)
+    cached = await get_cached_grounding(cache_key) if LLM_TRANSPORT != "record" else None # a recording needs the search call itself
+    if cached is not None:
+        GROUNDING_SECONDS.labels("cache").observe(time.perf_counter() - start)
+        return cached
 
-    response = client.models.generate_content(
-        model='gemini-2.5-flash-lite',
-        contents=SEARCH_INSTRUCTION.format(
+    response = await generate_content(
+        GROUNDING_API_KEY,
+        contents=SEARCH_PROMPT.render(
             goal_json=session.goal_obj,
             prereq_json=session.prereq_obj,
             phases_json=session.phases_obj,
@@ -111,7 +193,9 @@ def fetch_phase_resources(session: ChatSession, phase: PhaseCreate):
             "response_mime_type": "text/plain", # only mode allowed
             "temperature": 1.2
         },
+        phase_tag="grounding",
     )
+    GROUNDING_SECONDS.labels("gemini").observe(time.perf_counter() - start)
     
     # Extract text safely
     try:
@@ -125,80 +209,211 @@ def fetch_phase_resources(session: ChatSession, phase: PhaseCreate):
                     full_text = f"{line}".strip()
                     
                     reference_text_map[tuple(resource.grounding_chunk_indices)] = full_text
+        if resource_links:
+            await store_grounding(cache_key, resource_links, reference_text_map)
         return resource_links, reference_text_map
     except Exception as e:
         return {}, {}
     
-def generate_dailies(session: ChatSession, phase: PhaseCreate, db: Session=Depends(get_db)):
+def split_phase_windows(phase: PhaseCreate, window_days=DAILIES_WINDOW_DAYS): # [(window_start, window_end)] covering the whole phase, both ends inclusive
+    windows = []
+    window_start = phase.start_date
+    while window_start <= phase.end_date:
+        window_end = min(window_start + datetime.timedelta(days=window_days-1), phase.end_date)
+        windows.append((window_start, window_end))
+        window_start = window_end + datetime.timedelta(days=1)
+    return windows
 
-    all_phases_dailies = []
-    if session.dailies_obj:
-        all_phases_dailies = DailiesPost.model_validate_json(session.dailies_obj).dailies
+def attach_citations(daily, resource_links): # swaps the trailing citation marker of a task for the grounded links it refers to
+    match = re.search(r'\s*\((\d+(?:,\s*\d+)*)\)\s*$', daily.task_description)
+    if match:
+        ref_str = match.group(1)
+        citation_markers_to_remove = match.group(0)
+        references = tuple(map(int, ref_str.split(',')))
+        daily.task_description = daily.task_description.replace(citation_markers_to_remove, '').strip()
         
-    current_planning_date = phase.start_date
-    resource_links, reference_text_map = fetch_phase_resources(session, phase)
-    resource = "\n".join(f"{k}: {reference_text_map[k]}" for k in reference_text_map)
+        daily.task_description += "\n Resources: (Please copy and paste)"
+        for reference in references:
+            if reference in resource_links:
+                daily.task_description += f"\n[{reference+1}] {resource_links[reference]}\n"
+    daily.task_description = re.sub(r'\(([^)]*)\)\s*$', '', daily.task_description).strip()
+    return daily
 
-    while current_planning_date <= phase.end_date:
-        if current_planning_date > phase.end_date:
-                break
-        
-        dailies_generation_prompt = f"""
-                                        The currently confirmed tasks for this goal (for context and continuity) is: {all_phases_dailies}.
-                                        Generate the daily schedule for the next 2 weeks starting from, and including {current_planning_date}
-                                        """
-        
-        client = genai.Client(api_key=DAILIES_API_KEY)
-        response = client.models.generate_content(
-            model='gemini-2.5-flash-lite',
+async def generate_window_dailies(system_instruction, dailies_generation_prompt, mode):
+    # prompt tokens and latency of each window are in gemini_prompt_tokens and gemini_request_duration_seconds under the
+    # generate_dailies phase, benchmarks.dailies_prompt_size compares the prompt encodings
+    try:
+        response = await generate_content(
+            DAILIES_API_KEY,
             contents = [{
                 "role": "user", 
                 "parts": [{"text": f"{dailies_generation_prompt}"}]
             }],
             config={
-                "system_instruction": DAILIES_GENERATION_INSTRUCTION.format(
-                    dailiesGeneration=DailiesGeneration.model_json_schema(),
-                    phase_resources = resource,
-                    goal_obj = session.goal_obj,
-                    prereq_obj = session.prereq_obj,
-                    phases_obj = session.phases_obj,
-                    phase_title = phase.title,
-                ),
+                "system_instruction": system_instruction,
                 "response_mime_type": "application/json",
                 "response_schema": DailiesGeneration,
             },
+            phase_tag="generate_dailies",
         )
-        response = parse_response(response)
-        new_tasks = response.dailies
-
-        valid_new_tasks = [t for t in new_tasks if t.dailies_date <= phase.end_date]
-
-        for daily in valid_new_tasks:
-            match = re.search(r'\s*\((\d+(?:,\s*\d+)*)\)\s*$', daily.task_description)
-            if match:
-                ref_str = match.group(1)
-                citation_markers_to_remove = match.group(0)
-                references = tuple(map(int, ref_str.split(',')))
-                daily.task_description = daily.task_description.replace(citation_markers_to_remove, '').strip()
-                
-                daily.task_description += "\n Resources: (Please copy and paste)"
-                for reference in references:
-                    if reference in resource_links:
-                        daily.task_description += f"\n[{reference+1}] {resource_links[reference]}\n"
-            daily.task_description = re.sub(r'\(([^)]*)\)\s*$', '', daily.task_description).strip()
+        dailies = parse_response(response).dailies
+    except Exception:
+        DAILIES_WINDOWS.labels(mode, "failed").inc()
+        raise
+    DAILIES_WINDOWS.labels(mode, "generated").inc()
+    return dailies
+
+async def generate_dailies(session: ChatSession, phase: PhaseCreate, db: AsyncSession=Depends(get_async_db), mode=None, on_window_done=None, done_windows=None):
+    """
+    Generates the dailies of phase and returns them appended to the session's confirmed dailies.
+    on_window_done(window_index, window_tasks, windows_total) is awaited as each window finishes, and
+    windows already in done_windows ({window_index: window_tasks}) are reused instead of regenerated (parallel mode only).
+    """
+
+    llm_caller.set(session.id) # the grounding and every window call are queued for this session, the windows inherit it
+    all_phases_dailies = []
+    if session.dailies_obj:
+        all_phases_dailies = DailiesPost.model_validate_json(session.dailies_obj).dailies
+        
+    resource_links, reference_text_map = await fetch_phase_resources(session, phase)
+    resource = "\n".join(f"{k}: {reference_text_map[k]}" for k in reference_text_map)
+    system_instruction = DAILIES_PROMPT.render(
+        phase_resources = resource,
+        goal_obj = session.goal_obj,
+        prereq_obj = session.prereq_obj,
+        phases_obj = encode_phases_outline(session.phases_obj, phase.title),
+        phase_title = phase.title,
+    )
+
+    mode = mode or DAILIES_GENERATION_MODE
+    if mode == "parallel":
+        done_windows = {} if done_windows is None else done_windows # filled in as windows finish, kept by the fallback
+        try:
+            new_dailies = await generate_dailies_parallel(phase, all_phases_dailies, system_instruction, resource_links, on_window_done, done_windows)
+        except GenerationCancelled:
+            raise
+        except Exception as e:
+            print("parallel dailies generation failed, falling back to sequential: ", e)
+            new_dailies = await generate_missing_windows(phase, all_phases_dailies, system_instruction, resource_links, on_window_done, done_windows)
+        return DailiesGeneration(status="dailies_generated", dailies=all_phases_dailies + new_dailies)
+
+    new_dailies = await generate_dailies_sequential(phase, all_phases_dailies, system_instruction, resource_links, on_window_done)
+    return DailiesGeneration(status="dailies_generated", dailies=all_phases_dailies + new_dailies)
+
+async def generate_dailies_sequential(phase: PhaseCreate, prior_dailies, system_instruction, resource_links, on_window_done=None):
+    # each window sees every task generated before it, so the windows have to run one after another
+    all_phases_dailies = list(prior_dailies)
+    new_dailies = []
+    current_planning_date = phase.start_date
+    windows_total = len(split_phase_windows(phase)) # estimate, the model decides where each window actually ends
+    window_index = 0
+
+    while current_planning_date <= phase.end_date:
+        dailies_generation_prompt = f"""
+                                        The currently confirmed tasks for this goal (for context and continuity) are:
+                                        {encode_dailies_context(all_phases_dailies)}
+                                        Generate the daily schedule for the next 2 weeks starting from, and including {current_planning_date}
+                                        """
+        
+        new_tasks = await generate_window_dailies(system_instruction, dailies_generation_prompt, "sequential")
+        valid_new_tasks = [attach_citations(t, resource_links) for t in new_tasks if t.dailies_date <= phase.end_date]
 
         all_phases_dailies.extend(valid_new_tasks)
+        new_dailies.extend(valid_new_tasks)
+        windows_total = max(windows_total, window_index+1)
+        if on_window_done:
+            await on_window_done(window_index, valid_new_tasks, windows_total)
+        window_index += 1
         if valid_new_tasks != []:
             last_task_date = max(t.dailies_date for t in valid_new_tasks)
             current_planning_date = last_task_date + datetime.timedelta(days=1)
         else:
-            current_planning_date += datetime.timedelta(days=14)
+            current_planning_date += datetime.timedelta(days=DAILIES_WINDOW_DAYS)
     
-    return DailiesGeneration(status="dailies_generated", dailies=all_phases_dailies)
+    return new_dailies
+
+async def generate_missing_windows(phase: PhaseCreate, prior_dailies, system_instruction, resource_links, on_window_done=None, done_windows=None):
+    # fallback of a failed parallel run: its finished windows are kept and the others are generated one after another on
+    # the same fixed windows, so window indices and progress stay those of the parallel run
+    windows = split_phase_windows(phase)
+    done_windows = done_windows or {}
+    context = list(prior_dailies)
+    window_tasks = []
+    for index, (window_start, window_end) in enumerate(windows):
+        if index in done_windows:
+            tasks = done_windows[index]
+        else:
+            dailies_generation_prompt = f"""
+                                        The currently confirmed tasks for this goal (for context and continuity) are:
+                                        {encode_dailies_context(context)}
+                                        Generate the daily schedule from {window_start} to {window_end}, both inclusive
+                                        """
+            new_tasks = await generate_window_dailies(system_instruction, dailies_generation_prompt, "sequential")
+            tasks = [attach_citations(t, resource_links) for t in new_tasks if window_start <= t.dailies_date <= window_end]
+            done_windows[index] = tasks
+            if on_window_done:
+                await on_window_done(index, tasks, len(windows))
+        context.extend(tasks)
+        window_tasks.append(tasks)
+    return merge_window_dailies(window_tasks)
+
+async def generate_dailies_parallel(phase: PhaseCreate, prior_dailies, system_instruction, resource_links, on_window_done=None, done_windows=None):
+    # windows are fixed up front and only get a short continuity summary, so they can be generated at the same time
+    windows = split_phase_windows(phase)
+    done_windows = {} if done_windows is None else done_windows
+    prior_context = encode_dailies_context(prior_dailies)
+    semaphore = asyncio.Semaphore(DAILIES_MAX_CONCURRENCY)
+
+    async def generate_window(index, window_start, window_end):
+        if index in done_windows:
+            DAILIES_WINDOWS.labels("parallel", "reused").inc()
+            return done_windows[index]
+        outline = "\n".join(
+            f"- Window {i+1}: {ws} to {we}, covering part {i+1} of {len(windows)} of the progress towards the phase target"
+            for i, (ws, we) in enumerate(windows[:index])
+        ) or "None, this is the first window of the phase."
+        dailies_generation_prompt = f"""
+                                        The current phase's target is: {phase.description}
+                                        The phase runs from {phase.start_date} to {phase.end_date} and is planned in {len(windows)} windows. This is window {index+1} of {len(windows)}.
+                                        The confirmed tasks of earlier phases (for context and continuity) are:
+                                        {prior_context}
+                                        The earlier windows of this phase are being planned separately and cover:
+                                        {outline}
+                                        Generate the daily schedule from {window_start} to {window_end}, both inclusive, making part {index+1} of {len(windows)} of the progress towards the phase target.
+                                        """
+        async with semaphore:
+            new_tasks = await generate_window_dailies(system_instruction, dailies_generation_prompt, "parallel")
+        window_tasks = [attach_citations(t, resource_links) for t in new_tasks if window_start <= t.dailies_date <= window_end]
+        done_windows[index] = window_tasks
+        if on_window_done:
+            await on_window_done(index, window_tasks, len(windows))
+        return window_tasks
+
+    # a failed window cancels the others before the error reaches generate_dailies, so none of them is still calling
+    # gemini or reporting progress once the fallback starts
+    try:
+        async with asyncio.TaskGroup() as group:
+            tasks = [group.create_task(generate_window(i, ws, we)) for i, (ws, we) in enumerate(windows)]
+    except ExceptionGroup as errors: # the first window error, as gather raised it
+        raise errors.exceptions[0]
+
+    return merge_window_dailies(task.result() for task in tasks)
+
+def merge_window_dailies(window_tasks): # windows are clipped to their own dates, so only exact repeats within a day are left to remove
+    new_dailies = []
+    seen = set()
+    for daily in sorted((t for tasks in window_tasks for t in tasks), key=lambda t: (t.dailies_date, t.start_time)):
+        key = (daily.dailies_date, daily.start_time, daily.task_description)
+        if key in seen:
+            continue
+        seen.add(key)
+        new_dailies.append(daily)
+    return new_dailies
 
 def parse_response(response): # can do more parsing but thats kinda a lot of work i.e. check for missing fields
-    models = TypeAdapter(FollowUp | DefinitionsCreate | GoalPrerequisites | PhaseGeneration | DailiesGeneration)
-    text = response.candidates[0].content.parts[0].text
+    return parse_response_text(response.candidates[0].content.parts[0].text)
+
+def parse_response_text(text):
     # code fence removal
     if text.startswith("```"): 
         if text.startswith("```json\n"):
@@ -209,5 +424,5 @@ def parse_response(response): # can do more parsing but thats kinda a lot of wor
         text = text[:-3]
         
     text = text.strip()
-    return models.validate_python(json.loads(text))
+    return RESPONSE_ADAPTER.validate_json(text)
 
@@ -0,0 +1,127 @@
+import time
+
+from prometheus_client import Counter, Histogram, REGISTRY
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, SummaryMetricFamily
+
+from db.session import async_engine, commit_stats
+from utils.llm_scheduler import llm_queue_stats, llm_hedge_delays
+from utils.cache_utils import grounding_cache_stats, response_cache_stats, llm_cache_stats
+
+# prometheus metrics served on /metrics. histograms and counters are recorded where the work happens, the stats
+# dicts kept by the schedulers and caches are read as they are on each scrape by StatsCollector.
+# one process: with several workers each one counts on its own
+
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Requests by route template, until the last byte of the response (the whole stream for SSE)",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+LLM_SECONDS = Histogram(
+    "gemini_request_duration_seconds", "Gemini calls from request to last chunk, without the wait for admission",
+    ["phase", "key"],
+    buckets=(0.25, 0.5, 1, 2, 4, 8, 16, 32, 64),
+)
+LLM_PROMPT_TOKENS = Counter("gemini_prompt_tokens", "Prompt tokens reported in usage_metadata", ["phase", "key"])
+LLM_OUTPUT_TOKENS = Counter("gemini_output_tokens", "Output tokens reported in usage_metadata, thinking included", ["phase", "key"])
+GROUNDING_SECONDS = Histogram(
+    "grounding_duration_seconds", "Search results of a phase for its dailies, from the grounding cache or a grounded gemini call",
+    ["source"],
+    buckets=(0.005, 0.05, 0.25, 0.5, 1, 2, 4, 8, 16, 32),
+)
+DAILIES_WINDOWS = Counter("dailies_windows", "generate_dailies windows, reused ones come from an interrupted job", ["mode", "outcome"])
+
+class MetricsMiddleware:
+    """ASGI middleware timing every http request into REQUEST_SECONDS. Requests matching no route share one label"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        start = time.perf_counter()
+        status = 500 # unless a response is started
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route") # set by the router on the shared scope
+            REQUEST_SECONDS.labels(scope["method"], route.path if route else "unmatched", str(status)).observe(time.perf_counter() - start)
+
+def observe_llm_call(phase, key, seconds, response):
+    phase = phase or "other"
+    LLM_SECONDS.labels(phase, key).observe(seconds)
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        LLM_PROMPT_TOKENS.labels(phase, key).inc(usage.prompt_token_count or 0)
+        LLM_OUTPUT_TOKENS.labels(phase, key).inc((usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0))
+
+class StatsCollector:
+    """Exposes the in-process stats dicts and the db pool state, read at scrape time"""
+    def collect(self):
+        queue_depth = GaugeMetricFamily("gemini_queue_depth", "Gemini calls waiting for admission", labels=["key"])
+        queue_max_depth = GaugeMetricFamily("gemini_queue_max_depth", "Most gemini calls ever waiting for admission at once", labels=["key"])
+        queue_wait = SummaryMetricFamily("gemini_queue_wait_seconds", "Time admitted gemini calls waited for their key's quota", labels=["key"])
+        throttled = CounterMetricFamily("gemini_throttled", "Gemini answers asking to retry later", labels=["key", "code"])
+        retries = CounterMetricFamily("gemini_retries", "Gemini calls retried after a 429 or 503", labels=["key"])
+        failures = CounterMetricFamily("gemini_failures", "Gemini calls given up on after the last retry", labels=["key"])
+        hedges = CounterMetricFamily("gemini_hedges", "Second calls sent for a gemini call slower than its phase's hedge delay", labels=["key"])
+        hedge_wins = CounterMetricFamily("gemini_hedge_wins", "Hedges answered before the call they duplicate", labels=["key"])
+        deadlines = CounterMetricFamily("gemini_deadline_exceeded", "Gemini calls without an answer within their phase's deadline", labels=["key"])
+        breaker_opened = CounterMetricFamily("gemini_breaker_opened", "Times a key's circuit opened after failures in a row", labels=["key"])
+        breaker_rejected = CounterMetricFamily("gemini_breaker_rejected", "Gemini calls failed at once while their key's circuit was open", labels=["key"])
+        circuit_open = GaugeMetricFamily("gemini_circuit_open", "1 while a key's calls are failed at once", labels=["key"])
+        for key, stats in llm_queue_stats.items():
+            queue_depth.add_metric([key], stats["queued"])
+            queue_max_depth.add_metric([key], stats["max_queued"])
+            queue_wait.add_metric([key], count_value=stats["admitted"], sum_value=stats["wait_seconds"])
+            throttled.add_metric([key, "429"], stats["throttled"])
+            throttled.add_metric([key, "503"], stats["unavailable"])
+            retries.add_metric([key], stats["retries"])
+            failures.add_metric([key], stats["failures"])
+            hedges.add_metric([key], stats["hedges"])
+            hedge_wins.add_metric([key], stats["hedge_wins"])
+            deadlines.add_metric([key], stats["deadline_exceeded"])
+            breaker_opened.add_metric([key], stats["breaker_opened"])
+            breaker_rejected.add_metric([key], stats["breaker_rejected"])
+            circuit_open.add_metric([key], stats["circuit_open"])
+        yield from (queue_depth, queue_max_depth, queue_wait, throttled, retries, failures)
+        yield from (hedges, hedge_wins, deadlines, breaker_opened, breaker_rejected, circuit_open)
+
+        hedge_delay = GaugeMetricFamily("gemini_hedge_delay_seconds", "Time after which a call of the phase is hedged", labels=["phase"])
+        for phase, delay in llm_hedge_delays().items():
+            hedge_delay.add_metric([phase], delay)
+        yield hedge_delay
+
+        llm_cache = CounterMetricFamily("llm_response_cache_requests", "Lookups of the gemini response cache", labels=["phase", "result"])
+        llm_cache_saved = CounterMetricFamily("llm_response_cache_saved_seconds", "Gemini latency the response cache hits skipped", labels=["phase"])
+        for phase, stats in llm_cache_stats.items():
+            llm_cache.add_metric([phase, "hit"], stats["hits"])
+            llm_cache.add_metric([phase, "miss"], stats["misses"])
+            llm_cache_saved.add_metric([phase], stats["saved_seconds"])
+        yield from (llm_cache, llm_cache_saved)
+
+        grounding_cache = CounterMetricFamily("grounding_cache_requests", "Lookups of the grounding cache", labels=["result"])
+        for result, count in grounding_cache_stats.items():
+            grounding_cache.add_metric([result], count)
+        yield grounding_cache
+
+        response_cache = CounterMetricFamily("response_cache_requests", "Conditional dashboard reads", labels=["result"])
+        for result, count in response_cache_stats.items():
+            response_cache.add_metric([result], count)
+        yield response_cache
+
+        yield CounterMetricFamily("db_commits", "Committed transactions", value=commit_stats["commits"])
+        pool = async_engine.pool
+        connections = GaugeMetricFamily("db_pool_connections", "Connections of the async engine's pool", labels=["state"])
+        connections.add_metric(["checked_out"], pool.checkedout())
+        connections.add_metric(["idle"], pool.checkedin())
+        connections.add_metric(["overflow"], max(pool.overflow(), 0))
+        yield connections
+
+REGISTRY.register(StatsCollector())
@@ -0,0 +1,43 @@
+import base64, datetime
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+
+def encode_cursor(dailies_date: datetime.date, daily_id: int) -> str: # opaque to clients, points at the last row of a page
+    return base64.urlsafe_b64encode(f"{dailies_date.isoformat()}_{daily_id}".encode()).decode()
+
+def decode_cursor(cursor: str):
+    try:
+        dailies_date, daily_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("_")
+        return datetime.date.fromisoformat(dailies_date), int(daily_id)
+    except Exception:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+def date_bounds(date_column, from_date=None, to_date=None): # conditions for the inclusive [from_date, to_date] range, either end optional
+    conditions = []
+    if from_date is not None:
+        conditions.append(date_column >= from_date)
+    if to_date is not None:
+        conditions.append(date_column <= to_date)
+    return conditions
+
+def keyset_page(statement, date_column, id_column, cursor=None, limit=None, from_date=None, to_date=None):
+    """
+    Restricts statement to one page of rows ordered by (date, id), starting after cursor and within the
+    inclusive [from_date, to_date] bounds. One extra row is fetched to tell whether a next page exists, see split_page.
+    """
+    statement = statement.where(*date_bounds(date_column, from_date, to_date))
+    if cursor is not None:
+        after_date, after_id = decode_cursor(cursor)
+        # the plain date bound lets the (..., dailies_date) indexes do the seeking, the row comparison breaks ties
+        statement = statement.where(date_column >= after_date, tuple_(date_column, id_column) > tuple_(after_date, after_id))
+    statement = statement.order_by(date_column, id_column)
+    if limit is not None:
+        statement = statement.limit(limit + 1)
+    return statement
+
+def split_page(rows, limit=None): # (rows of the page, cursor of the next page or None), rows come from a keyset_page statement
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]["dailies_date"], rows[-1]["id"])
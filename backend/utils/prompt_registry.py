@@ -0,0 +1,61 @@
+import string
+
+from pydantic import TypeAdapter
+
+from schemas import (FollowUp,
+                            DefinitionsCreate,
+                            GoalPrerequisites,
+                            PhaseGeneration,
+                            DailiesGeneration,)
+
+from utils.instruction_chain import BASE_INSTRUCTION, PHASE_INSTRUCTIONS, SEARCH_INSTRUCTION, DAILIES_GENERATION_INSTRUCTION
+
+# everything in this module is built once at import, requests only fill in their own fields
+
+# schemas are embedded in the prompts as str(dict), the same text str.format produced before
+SCHEMA_STRINGS = {
+    "followUp": str(FollowUp.model_json_schema()),
+    "definitionsCreate": str(DefinitionsCreate.model_json_schema()),
+    "goalPrerequisites": str(GoalPrerequisites.model_json_schema()),
+    "phaseGeneration": str(PhaseGeneration.model_json_schema()),
+    "dailiesGeneration": str(DailiesGeneration.model_json_schema()),
+}
+
+# validator for any structured reply of the creation flow
+RESPONSE_ADAPTER = TypeAdapter(FollowUp | DefinitionsCreate | GoalPrerequisites | PhaseGeneration | DailiesGeneration)
+
+class PromptTemplate:
+    """
+    A str.format template parsed once. Fields given to the constructor are filled in straight away and
+    neighbouring literal text is merged, so render() only joins a few strings with the per-request fields.
+    """
+    def __init__(self, template: str, **static_fields):
+        self.parts = [] # literal strings, and 1-tuples (field name,) for the fields left to render
+        literal = ""
+        for text, field_name, format_spec, conversion in string.Formatter().parse(template):
+            literal += text
+            if field_name is None:
+                continue
+            if format_spec or conversion:
+                raise ValueError(f"format spec and conversion are not supported: {{{field_name}}}")
+            if field_name in static_fields:
+                literal += str(static_fields[field_name])
+                continue
+            if literal:
+                self.parts.append(literal)
+                literal = ""
+            self.parts.append((field_name,))
+        if literal:
+            self.parts.append(literal)
+        self.fields = {part[0] for part in self.parts if isinstance(part, tuple)}
+
+    def render(self, **fields) -> str:
+        return "".join(part if isinstance(part, str) else str(fields[part[0]]) for part in self.parts)
+
+BASE_PROMPT = PromptTemplate(BASE_INSTRUCTION)
+PHASE_PROMPTS = { # phase tag -> system instruction of that phase, without the base instruction
+    phase_tag: PromptTemplate(template, **SCHEMA_STRINGS)
+    for phase_tag, template in PHASE_INSTRUCTIONS.items()
+}
+SEARCH_PROMPT = PromptTemplate(SEARCH_INSTRUCTION)
+DAILIES_PROMPT = PromptTemplate(DAILIES_GENERATION_INSTRUCTION, **SCHEMA_STRINGS)
@@ -0,0 +1,117 @@
+import contextvars, random, re, time
+from collections import Counter
+
+from prometheus_client import Histogram
+from sqlalchemy import event
+
+from db.session import async_engine
+
+import os
+from dotenv import load_dotenv
+
+if os.getenv("RAILWAY_ENVIRONMENT_NAME") is None:
+    load_dotenv()
+
+# statements and db time per request, from cursor events on the async engine:
+#   off   - no event listeners at all
+#   on    - sampled requests are profiled, repeated statements and slow queries are logged
+#   debug - as on, and each profiled response carries an X-SQL-Profile header
+SQL_PROFILER = os.getenv("SQL_PROFILER", "off")
+SQL_PROFILER_SAMPLE_RATE = float(os.getenv("SQL_PROFILER_SAMPLE_RATE", "1")) # share of requests profiled, lower it in production
+SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv("SQL_N_PLUS_ONE_THRESHOLD", "5")) # runs of one statement shape in a request that get it flagged
+SQL_SLOW_QUERY_MS = float(os.getenv("SQL_SLOW_QUERY_MS", "200")) # statements slower than this are logged, profiled request or not
+
+SQL_PROFILE_HEADER = "X-SQL-Profile"
+
+SQL_STATEMENTS = Histogram(
+    "sql_statements_per_request", "Statements sent by a profiled request, by route template",
+    ["route"], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+SQL_SECONDS = Histogram(
+    "sql_seconds_per_request", "Time a profiled request spent executing statements, by route template",
+    ["route"], buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+
+class RequestProfile:
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Counter[str] = Counter()
+
+    def repeated(self) -> list[tuple[str, int]]: # (shape, runs) of the shapes run at least SQL_N_PLUS_ONE_THRESHOLD times
+        return [(shape, runs) for shape, runs in self.shapes.most_common() if runs >= SQL_N_PLUS_ONE_THRESHOLD]
+
+    def header(self) -> str:
+        return f"statements={self.statements}; db_ms={self.seconds * 1000:.1f}; repeated={len(self.repeated())}"
+
+current_profile: contextvars.ContextVar = contextvars.ContextVar("current_profile", default=None)
+
+_WHITESPACE = re.compile(r"\s+")
+_PARAMETER = r"(?:\$\d+(?:::[\w ]+(?:\[\])?)?|%\(\w+\)s)" # asyncpg's $1::INTEGER or psycopg2's %(name)s
+_PARAMETER_LIST = re.compile(rf"\(\s*{_PARAMETER}(?:\s*,\s*{_PARAMETER})*\s*\)") # expanded IN lists and the rows of a multi-row VALUES
+_REPEATED_LIST = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_LITERAL = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+def statement_shape(statement: str) -> str:
+    """The statement without its binds or literals, so that runs differing only in values count as the same shape"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    shape = _REPEATED_LIST.sub("(...)", _PARAMETER_LIST.sub("(...)", shape))
+    return _LITERAL.sub("?", shape)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts: # started before the listeners were added
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    profile = current_profile.get()
+    if profile is not None:
+        profile.statements += 1
+        profile.seconds += elapsed
+        profile.shapes[statement_shape(statement)] += 1
+    if elapsed * 1000 >= SQL_SLOW_QUERY_MS: # binds are left out, they may hold user data
+        print(f"slow query, {elapsed * 1000:.0f} ms: {statement_shape(statement)}")
+
+def _handle_error(exception_context): # a failed statement never reaches after_cursor_execute
+    if exception_context.connection is not None:
+        starts = exception_context.connection.info.get("query_start")
+        if starts:
+            starts.pop()
+
+def init_sql_profiler(engine=async_engine):
+    if SQL_PROFILER == "off":
+        return
+    sync_engine = getattr(engine, "sync_engine", engine)
+    event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(sync_engine, "handle_error", _handle_error)
+
+class SQLProfilerMiddleware:
+    """ASGI middleware profiling a SQL_PROFILER_SAMPLE_RATE share of requests, see SQL_PROFILER.
+    The header is set when the response starts, statements sent while a response streams are only in the logs and metrics"""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or SQL_PROFILER == "off" or random.random() >= SQL_PROFILER_SAMPLE_RATE:
+            return await self.app(scope, receive, send)
+        profile = RequestProfile()
+        token = current_profile.set(profile)
+
+        async def send_with_profile(message):
+            if message["type"] == "http.response.start" and SQL_PROFILER == "debug":
+                message["headers"] = [*message.get("headers", []), (SQL_PROFILE_HEADER.lower().encode(), profile.header().encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_profile)
+        finally:
+            current_profile.reset(token)
+            route = scope.get("route")
+            route = route.path if route else "unmatched"
+            SQL_STATEMENTS.labels(route).observe(profile.statements)
+            SQL_SECONDS.labels(route).observe(profile.seconds)
+            for shape, runs in profile.repeated():
+                print(f"repeated statement, {runs} times in {scope['method']} {route}: {shape}")
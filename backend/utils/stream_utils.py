@@ -0,0 +1,113 @@
+import json, re
+
+from schemas import PhaseCreate
+
+QUESTION_START = re.compile(r'"question_to_user"\s*:\s*"')
+PHASES_START = re.compile(r'"phases"\s*:\s*\[')
+
+def sse_event(event: str, data) -> str: # one server-sent event, data is sent as json
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class StreamingResponseParser:
+    """
+    Picks out the parts of a streamed structured response that can be shown before the whole JSON has arrived:
+    the question_to_user text of a FollowUp as it grows, and each phase of a PhaseGeneration as soon as its object is closed.
+    feed() takes the next text chunk and returns the (event, data) pairs it completed.
+    """
+    def __init__(self):
+        self.text = ""
+        self.question_start = None # index of the first character of the question_to_user string
+        self.question_sent = 0 # decoded characters of the question already sent
+        self.question_done = False
+
+        self.phases_pos = None # scan position inside the phases array
+        self.phases_done = False
+        self.phases_sent = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.object_start = None
+
+    def feed(self, chunk: str):
+        self.text += chunk
+        events = []
+        if not self.question_done:
+            events.extend(self._scan_question())
+        if not self.phases_done:
+            events.extend(self._scan_phases())
+        return events
+
+    def _scan_question(self):
+        if self.question_start is None:
+            match = QUESTION_START.search(self.text)
+            if match is None:
+                return []
+            self.question_start = match.end()
+
+        raw = self.text[self.question_start:]
+        end = len(raw)
+        i = 0
+        while i < len(raw):
+            if raw[i] == "\\":
+                escape_length = 6 if raw[i+1:i+2] == "u" else 2
+                if i + escape_length > len(raw): # escape sequence split across chunks, wait for the rest
+                    end = i
+                    break
+                i += escape_length
+                continue
+            if raw[i] == '"':
+                end = i
+                self.question_done = True
+                break
+            i += 1
+
+        try:
+            question = json.loads(f'"{raw[:end]}"')
+        except json.JSONDecodeError:
+            return []
+        delta = question[self.question_sent:]
+        self.question_sent = len(question)
+        return [("question_delta", {"text": delta})] if delta else []
+
+    def _scan_phases(self):
+        if self.phases_pos is None:
+            match = PHASES_START.search(self.text)
+            if match is None:
+                return []
+            self.phases_pos = match.end()
+
+        events = []
+        text = self.text
+        i = self.phases_pos
+        while i < len(text):
+            char = text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                if self.depth == 0:
+                    self.object_start = i
+                self.depth += 1
+            elif char in "}]":
+                if self.depth == 0: # end of the phases array
+                    self.phases_done = True
+                    i += 1
+                    break
+                self.depth -= 1
+                if self.depth == 0:
+                    try:
+                        phase = PhaseCreate.model_validate_json(text[self.object_start:i+1])
+                        events.append(("phase", {"index": self.phases_sent, "phase": phase.model_dump(mode="json")}))
+                        self.phases_sent += 1
+                    except ValueError:
+                        pass # not a valid phase, the final parse will report it
+                    self.object_start = None
+            i += 1
+        self.phases_pos = i
+        return events
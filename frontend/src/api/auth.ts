@@ -28,6 +28,43 @@ export async function login(email: string, password: string) {
     return res.json(); // contains token
 }
 
+export type Tokens = { access_token: string, refresh_token: string };
+
+export function storeTokens(data: Tokens) {
+    localStorage.setItem("token", data.access_token);
+    localStorage.setItem("refresh_token", data.refresh_token);
+}
+
+export function clearTokens() {
+    localStorage.removeItem("token");
+    localStorage.removeItem("refresh_token");
+}
+
+let refreshing: Promise<string | null> | null = null; // requests that find the access token expired together share one refresh
+
+async function refreshAccessToken(): Promise<string | null> {
+    const res = await fetch(`${API_URL}/auth/refresh`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ refresh_token: localStorage.getItem("refresh_token") }),
+    });
+    if (!res.ok) return null;
+    const data: Tokens = await res.json();
+    storeTokens(data);
+    return data.access_token;
+}
+
+// access token for an Authorization header, renewed with the refresh token once it has expired
+export async function getAccessToken(): Promise<string | null> {
+    const token = localStorage.getItem("token");
+    if (!isExpired(token) || isExpired(localStorage.getItem("refresh_token"))) return token;
+    refreshing ??= refreshAccessToken().finally(() => { refreshing = null; });
+    return refreshing;
+}
+
+// signed in while either token is still valid, an expired access token is renewed on the next request
+export const isSignedIn = () => !isExpired(localStorage.getItem("token")) || !isExpired(localStorage.getItem("refresh_token"));
+
 export const isExpired = (token: string | null) => {
     if (!token) return true;
     try {
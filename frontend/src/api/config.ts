@@ -29,6 +29,7 @@ export interface DailyTableProps {
 export interface DailyCalendarProps {
     goal_phases: string[],
     dailies: Daily[],
+    fetchDailies?: (from: string, to: string) => Promise<Daily[]>, // when given, dailies is ignored and each visible range is fetched
 }
 
 export interface Stats {
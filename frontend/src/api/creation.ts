@@ -1,10 +1,37 @@
-import { APIResponse, APIRequest, PhaseGeneration, DefinitionsCreate, ConfirmRequest, DailiesPost } from "@/types/goals.d";
+import { APIResponse, APIRequest, PhaseGeneration, DefinitionsCreate, ConfirmRequest, DailiesPost, JobStatus } from "@/types/goals.d";
 import { API_URL } from "@/api/config";
+import { getAccessToken } from "@/api/auth";
+
+const JOB_POLL_INTERVAL_MS = 2000;
+
+export async function getJobStatus(jobId: string): Promise<JobStatus> {
+    const res = await fetch(`${API_URL}/create/jobs/${jobId}`, {
+        method: "GET",
+        headers: {
+            Authorization: `Bearer ${await getAccessToken()}`,
+            "Content-Type": "application/json",
+        },
+    });
+    if (!res.ok) throw new Error("Failed to get dailies generation status");
+    return res.json();
+}
+
+// dailies are generated in the background, poll the job until the DailiesPost is ready
+async function waitForDailies(response: APIResponse): Promise<APIResponse> {
+    if (response.phase_tag !== "generate_dailies" || response.ret_obj.status !== "dailies_pending") return response;
+    const jobId = response.ret_obj.job_id;
+    while (true) {
+        const job = await getJobStatus(jobId);
+        if (job.status === "completed" && job.dailies) return { phase_tag: "generate_dailies", ret_obj: job.dailies };
+        if (job.status === "failed" || job.status === "cancelled") throw new Error(job.error || "Failed to generate dailies");
+        await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS));
+    }
+}
 
 export async function resetCreation(): Promise<void> {
     const res = await fetch(`${API_URL}/create/reset`, {
         method: "POST",
-        headers: { Authorization: `Bearer ${localStorage.getItem("token")}`,
+        headers: { Authorization: `Bearer ${await getAccessToken()}`,
                     "Content-Type": "application/json" }
     });
     if (!res.ok) throw new Error("Failed to reset session");
@@ -14,12 +41,12 @@ export async function loadInitialState(): Promise<APIResponse> {
     const res = await fetch(`${API_URL}/create/load`, {
         method: "POST",
         headers: { 
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
     });
     if (!res.ok) throw new Error("Failed to load goal state");
-    return res.json();
+    return waitForDailies(await res.json());
 }
 
 export async function sendUserInput(user_input: string): Promise<APIResponse> {
@@ -29,7 +56,7 @@ export async function sendUserInput(user_input: string): Promise<APIResponse> {
     const res = await fetch(`${API_URL}/create/query`, {
         method: "POST",
         headers: { 
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
         body: JSON.stringify(payload),
@@ -43,13 +70,13 @@ export async function confirmPhase(confirm_obj: DefinitionsCreate | PhaseGenerat
     const res = await fetch(`${API_URL}/create/confirm`, {
         method: "POST",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json"
         },
         body: JSON.stringify(payload),
     });
     if (!res.ok) throw new Error("Failed to confirm definitions/phases");
-    return res.json();
+    return waitForDailies(await res.json());
   }
   
 export async function submitPhaseComment(data: PhaseGeneration, comment: string): Promise<APIResponse> {
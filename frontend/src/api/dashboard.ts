@@ -1,11 +1,38 @@
 
 import { API_URL } from "@/api/config";
+import { getAccessToken } from "@/api/auth";
+
+// last bodies of the read endpoints with their ETag, so that unchanged reads come back as an empty 304
+const ETAG_CACHE_SIZE = 100;
+const etagCache = new Map<string, { etag: string, body: string }>();
+
+export async function fetchConditional(url: string, init: RequestInit): Promise<Response> {
+    const key = `${init.method} ${url} ${init.body ?? ""} ${localStorage.getItem("token")}`;
+    const cached = etagCache.get(key);
+    const headers = new Headers(init.headers);
+    if (cached) {
+        headers.set("If-None-Match", cached.etag);
+    }
+    const res = await fetch(url, { ...init, headers: headers });
+    if (res.status === 304 && cached) {
+        return new Response(cached.body, { status: 200, headers: { "Content-Type": "application/json" } });
+    }
+    const etag = res.headers.get("ETag");
+    if (res.ok && etag) {
+        etagCache.delete(key);
+        etagCache.set(key, { etag: etag, body: await res.clone().text() });
+        if (etagCache.size > ETAG_CACHE_SIZE) {
+            etagCache.delete(etagCache.keys().next().value!);
+        }
+    }
+    return res;
+}
 
 export async function getStats() {
-    const res = await fetch(`${API_URL}/dashboard/stats`, {
+    const res = await fetchConditional(`${API_URL}/dashboard/stats`, {
         method: "GET",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         }
     });
@@ -17,10 +44,10 @@ export async function getStats() {
 }
 
 export async function getGoalProgress(goalId: number | null = null) {
-    const res = await fetch(`${API_URL}/dashboard/goal_progress`, {
+    const res = await fetchConditional(`${API_URL}/dashboard/goal_progress`, {
         method: "POST",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
         body: JSON.stringify({ goal_id: goalId })
@@ -33,10 +60,10 @@ export async function getGoalProgress(goalId: number | null = null) {
 }
 
 export async function getTitle(goalId: number) {
-    const res = await fetch(`${API_URL}/dashboard/get_title`, {
+    const res = await fetchConditional(`${API_URL}/dashboard/get_title`, {
         method: "POST",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
         body: JSON.stringify({ goal_id: goalId })
@@ -50,10 +77,10 @@ export async function getTitle(goalId: number) {
 }
 
 export async function getPhases(goalId: number) {
-    const res = await fetch(`${API_URL}/dashboard/get_phases`, {
+    const res = await fetchConditional(`${API_URL}/dashboard/get_phases`, {
         method: "POST",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
         body: JSON.stringify({ goal_id: goalId })
@@ -65,14 +92,30 @@ export async function getPhases(goalId: number) {
     return res.json();
 }
 
-export async function getDailies(goalId: number, completed: boolean) {
-    const res = await fetch(`${API_URL}/dashboard/get_dailies`, {
+export interface DailiesPageOptions {
+    from?: string, // YYYY-MM-DD, inclusive
+    to?: string,
+    limit?: number, // page size, all matching dailies when left out
+    cursor?: string, // next_cursor of the previous page
+    includeTotal?: boolean,
+}
+
+export async function getDailies(goalId: number, completed: boolean, options: DailiesPageOptions = {}) {
+    const res = await fetchConditional(`${API_URL}/dashboard/get_dailies`, {
         method: "POST",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
-        body: JSON.stringify({ goal_id: goalId, completed: completed })
+        body: JSON.stringify({
+            goal_id: goalId,
+            completed: completed,
+            from: options.from,
+            to: options.to,
+            limit: options.limit,
+            cursor: options.cursor,
+            include_total: options.includeTotal ?? false,
+        })
     });
     if (!res.ok) {
         const data = await res.json();
@@ -81,11 +124,30 @@ export async function getDailies(goalId: number, completed: boolean) {
     return res.json();
 }
 
+export async function getCalendar(from: string, to: string, goalId: number | null = null) {
+    const params = new URLSearchParams({ from: from, to: to });
+    if (goalId !== null) {
+        params.set("goal_id", goalId.toString());
+    }
+    const res = await fetchConditional(`${API_URL}/dashboard/calendar?${params}`, {
+        method: "GET",
+        headers: {
+            Authorization: `Bearer ${await getAccessToken()}`,
+            "Content-Type": "application/json",
+        }
+    });
+    if (!res.ok) {
+        const data = await res.json();
+        throw new Error(data.detail || "Failed to get calendar tasks");
+    }
+    return res.json();
+}
+
 export async function markComplete(selectedIds: Array<number>, completed: boolean) {
     const res = await fetch(`${API_URL}/dashboard/mark_complete`, {
         method: "PATCH",
         headers: {
-            Authorization: `Bearer ${localStorage.getItem("token")}`,
+            Authorization: `Bearer ${await getAccessToken()}`,
             "Content-Type": "application/json",
         },
         body: JSON.stringify({ ids: selectedIds, completed: completed })
@@ -4,7 +4,7 @@ import { redirect } from "next/navigation";
 import Grid from "@mui/material/Grid";
 import { Goal, Stats } from "@/api/config";
 import { getStats, getGoalProgress } from "@/api/dashboard";
-import { isExpired } from "@/api/auth";
+import { isSignedIn, clearTokens } from "@/api/auth";
 import StatCard from "@/components/dashboard/StatCard";
 import { DailyTable, EmptyDailies } from "@/components/dashboard/DailyList";
 import ProgressCard from "@/components/dashboard/GoalProgressCard";
@@ -21,9 +21,8 @@ export default function Dashboard() {
     const [goals, setGoals] = useState<Goal[]>([]);
 
     useEffect(() => {
-        const token = localStorage.getItem("token");
-        if (isExpired(token)) {
-            localStorage.removeItem("token");
+        if (!isSignedIn()) {
+            clearTokens();
             redirect("/");
         }
     });
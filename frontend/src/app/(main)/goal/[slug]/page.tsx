@@ -4,8 +4,8 @@ import Box from "@mui/material/Box";
 import DailiesCalendar from "@/components/goals/TaskCalendar";
 import { Daily } from "@/api/config";
 import { DailyTable } from "@/components/goals/GoalDetailsDailyList";
-import { getPhases, getTitle, getDailies } from "@/api/dashboard";
-import { isExpired } from "@/api/auth";
+import { getPhases, getTitle, getDailies, getCalendar } from "@/api/dashboard";
+import { isSignedIn, clearTokens } from "@/api/auth";
 import ProgressCard from "@/components/dashboard/GoalProgressCard";
 import { getGoalProgress } from "@/api/dashboard";
 import { Goal } from "@/api/config";
@@ -13,7 +13,7 @@ import Grid from "@mui/material/Grid";
 import { redirect } from "next/navigation";
 import Stack from "@mui/material/Stack";
 import Typography from "@mui/material/Typography";
-import { use, useEffect, useState } from "react";
+import { use, useCallback, useEffect, useState } from "react";
 
 export default function GoalDetails({ params, }: {params: Promise<{ slug: string }>}) {
     const { slug } = use(params);
@@ -23,11 +23,12 @@ export default function GoalDetails({ params, }: {params: Promise<{ slug: string
     const [completedDailies, setCompletedDailies] = useState<Daily[]>([]);
     const [goalData, setGoalData] = useState<Goal[]>([]);
     const [phaseData, setPhaseData] = useState<string[]>([]);
+    // the calendar asks for the dates it is showing instead of receiving every daily of the goal
+    const fetchCalendarDailies = useCallback(async (from: string, to: string) => (await getCalendar(from, to, id)).dailies, [id]);
 
     useEffect(() => {
-        const token = localStorage.getItem("token");
-        if (isExpired(token)) {
-            localStorage.removeItem("token");
+        if (!isSignedIn()) {
+            clearTokens();
             redirect("/");
         }
     });
@@ -78,9 +79,8 @@ export default function GoalDetails({ params, }: {params: Promise<{ slug: string
                     <DailiesCalendar
                         props={{
                             goal_phases: phaseData,
-                            dailies: [...uncompletedDailies, ...completedDailies].sort((a: Daily, b: Daily) => {
-                                return new Date(a.dailies_date).getTime() - new Date(b.dailies_date).getTime();
-                            })
+                            dailies: [],
+                            fetchDailies: fetchCalendarDailies,
                         }}
                     />
                 </Grid>
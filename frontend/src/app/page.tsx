@@ -1,7 +1,7 @@
 "use client"
 import { useState, useEffect } from "react";
 import { redirect, useRouter } from "next/navigation";
-import { isExpired } from "@/api/auth";
+import { isSignedIn, clearTokens } from "@/api/auth";
 import { Carousel } from "@/components/layout/Carousel";
 import AuthModal from "@/components/AuthModal";
 import Navbar from "@/components/layout/Navbar";
@@ -12,11 +12,11 @@ export default function HomePage() {
 
     useEffect(() => {
         const token = localStorage.getItem("token");
-        if (token && !isExpired(token)) {
+        if (token && isSignedIn()) {
             redirect("/dashboard"); // redirect signed-in users
         }
         else if (token) {
-            localStorage.removeItem("token");
+            clearTokens();
             router.refresh();
             window.location.reload();
         }
@@ -1,7 +1,7 @@
 "use client";
 import { useState } from "react";
 import { useRouter } from "next/navigation";
-import { login, signup } from "@/api/auth";
+import { login, signup, storeTokens } from "@/api/auth";
 
 export default function AuthModal({ mode, onClose }: { mode: "login" | "signup", onClose: () => void }) {
     const [username, setUsername] = useState("")
@@ -17,7 +17,7 @@ export default function AuthModal({ mode, onClose }: { mode: "login" | "signup",
             ? await login(email, password)
             : await signup(username, email, password);
 
-            localStorage.setItem("token", data.access_token);
+            storeTokens(data);
             window.dispatchEvent(new Event("storage"));
             router.push("/dashboard");
             onClose();
@@ -1,7 +1,7 @@
 "use client"
-import React, { useState } from "react";
+import React, { useMemo, useState } from "react";
 import FullCalendar from "@fullcalendar/react"
-import { EventClickArg } from "@fullcalendar/core";
+import { EventClickArg, EventInput, EventSourceFuncArg } from "@fullcalendar/core";
 import dayGridPlugin from "@fullcalendar/daygrid";
 import timeGridPlugin from "@fullcalendar/timegrid";
 import listPlugin from "@fullcalendar/list";
@@ -78,6 +78,9 @@ const getPhaseColor = (phaseTitle: string, phaseColorMap: PhaseColorMap) => {
     return phaseColorMap[phaseTitle] || '#e0e0e0'; // Use the map, fall back to gray
 };
 
+const toLocalDateString = (date: Date) => // YYYY-MM-DD of the date in the browser's timezone
+    `${date.getFullYear()}-${String(date.getMonth() + 1).padStart(2, '0')}-${String(date.getDate()).padStart(2, '0')}`;
+
 export const transformDailiesToEvents = (
     dailiesGeneration: DailyCalendarProps,
     phaseColorMap: PhaseColorMap
@@ -207,7 +210,25 @@ export default function DailiesCalendar(
     dailiesData.goal_phases.forEach((title, index) => {
         phaseColorMap[title] = COLOR_PALETTE[index % COLOR_PALETTE.length];
     });
-    const events = transformDailiesToEvents(dailiesData, phaseColorMap);
+    const fetchDailies = dailiesData.fetchDailies;
+    const goalPhasesKey = dailiesData.goal_phases.join("\n");
+    // memoised so that opening the task modal does not make FullCalendar refetch the range
+    const fetchEvents = useMemo(() => fetchDailies
+        ? (info: EventSourceFuncArg, success: (events: EventInput[]) => void, failure: (error: Error) => void) => {
+            // info.end is exclusive, the api bounds are inclusive. dates come from the local date parts:
+            // toISOString() is in UTC, which moves local midnight to the previous day ahead of UTC
+            const from = toLocalDateString(info.start);
+            const lastDay = new Date(info.end);
+            lastDay.setDate(lastDay.getDate() - 1);
+            const to = toLocalDateString(lastDay);
+            fetchDailies(from, to)
+                .then((dailies) => success(transformDailiesToEvents({ ...dailiesData, dailies: dailies }, phaseColorMap)))
+                .catch(failure);
+        }
+        : null,
+        // eslint-disable-next-line react-hooks/exhaustive-deps
+        [fetchDailies, goalPhasesKey]);
+    const events = fetchEvents ?? transformDailiesToEvents(dailiesData, phaseColorMap);
     const handleEventClick = (info: EventClickArg) => {
         const event = info.event;
         setModalData({
@@ -6,6 +6,7 @@ import { User } from "lucide-react";
 import { jwtDecode } from "jwt-decode";
 import { useClickAway } from "@uidotdev/usehooks";
 import AuthModal from "@/components/AuthModal";
+import { clearTokens } from "@/api/auth";
 
 type TokenPayload = {
     uid?: number;
@@ -89,7 +90,7 @@ export default function Navbar() {
                                     <button
                                         onClick={() => {
                                             setUserMenu(false);
-                                            localStorage.removeItem("token");
+                                            clearTokens();
                                             setUsername(getUsername);
                                             router.push("/");
                                         }}
@@ -4,6 +4,8 @@ import { PlusCircle, Target } from "lucide-react";
 import { useEffect, useState } from "react";
 import { useRouter } from "next/navigation";
 import { API_URL } from "@/api/config";
+import { fetchConditional } from "@/api/dashboard";
+import { getAccessToken } from "@/api/auth";
 import GoalSidebarItem from "@/components/goals/GoalSidebarItem";
 
 type Goal = { id: number; title: string };
@@ -16,9 +18,9 @@ export default function Sidebar() {
 
     async function fetchGoals() {
         try {
-            const res = await fetch(`${API_URL}/goals/titles`, {
+            const res = await fetchConditional(`${API_URL}/goals/titles`, {
                 method: "POST",
-                headers: { Authorization: `Bearer ${localStorage.getItem("token")}`,
+                headers: { Authorization: `Bearer ${await getAccessToken()}`,
                             "Content-Type": "application/json" }
             });
             const data: Goal[] = await res.json();
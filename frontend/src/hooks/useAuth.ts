@@ -1,5 +1,6 @@
 import { useState } from "react";
 import api from "@/lib/api";
+import { storeTokens, clearTokens } from "@/api/auth";
 
 export const useAuth = () => {
     const [loading, setLoading] = useState(false);
@@ -7,7 +8,7 @@ export const useAuth = () => {
     const login = async (email: string, password: string) => {
         setLoading(true);
         const res = await api.post("/auth/login", { email, password });
-        localStorage.setItem("token", res.data.access_token);
+        storeTokens(res.data);
         setLoading(false);
     };
 
@@ -21,7 +22,7 @@ export const useAuth = () => {
         setLoading(false);
     };
 
-    const logout = () => localStorage.removeItem("token");
+    const logout = () => clearTokens();
 
     return { login, signup, logout, loading };
 };
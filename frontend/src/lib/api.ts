@@ -1,12 +1,13 @@
 import axios from "axios";
+import { getAccessToken } from "@/api/auth";
 
 const api = axios.create({
     baseURL: process.env.NEXT_PUBLIC_API_URL || "http://127.0.0.1:8000",
 });
 
-api.interceptors.request.use((config) => {
+api.interceptors.request.use(async (config) => {
     const token =
-        typeof window !== "undefined" ? localStorage.getItem("token") : null;
+        typeof window !== "undefined" ? await getAccessToken() : null;
     if (token) config.headers.Authorization = `Bearer ${token}`;
     return config;
 });
@@ -38,6 +38,21 @@ export type DailiesPost = DailiesGeneration & {
     curr_phase: string;
 };
 
+export type DailiesJob = {
+    status: 'dailies_pending';
+    job_id: string;
+};
+
+export type JobStatus = {
+    job_id: string;
+    status: "queued" | "running" | "completed" | "failed" | "cancelled";
+    windows_done: number;
+    windows_total: number;
+    percent_done: number;
+    dailies: DailiesPost | null; // partial until status is "completed"
+    error: string | null;
+};
+
 export type GoalCompleted = {
     status: 'goal_completed';
     goal_title: string;
@@ -56,7 +71,7 @@ export type APIResponse =
         ret_obj: PhaseGeneration;
     } | {
         phase_tag: "generate_dailies";
-        ret_obj: DailiesPost;
+        ret_obj: DailiesPost | DailiesJob;
     } | {
         phase_tag: "goal_completed"
         ret_obj: GoalCompleted;